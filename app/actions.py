@@ -24,7 +24,6 @@ except NameError:
 
 import bisect
 import curses.ascii
-import difflib
 import binascii
 import io
 import os
@@ -34,12 +33,22 @@ import time
 import traceback
 
 import app.bookmark
+import app.bracket_index
 import app.config
+import app.document_search
 import app.history
+import app.line_store
 import app.log
+import app.mapped_file
+import app.match_index
 import app.mutator
+import app.parallel_parser
 import app.parser
+import app.project_search
+import app.redo_chain
+import app.regex
 import app.selectable
+import app.trigram_index
 
 
 class Actions(app.mutator.Mutator):
@@ -61,6 +70,23 @@ class Actions(app.mutator.Mutator):
         self.rootGrammar = self.program.prefs.getGrammar(None)
         self.debugUpperChangedRow = -1
         self.parser = app.parser.Parser()
+        # The brackets of the parsed text. See bracketIndexMaybe().
+        self.bracketIndex = app.bracket_index.BracketIndex()
+        # Set while the lines are read lazily from a large file. See
+        # fileLoadMapped().
+        self.mappedFile = None
+        # See parallelParseMaybe().
+        self.parallelParse = None
+        self.parallelParseTried = False
+        # Set while this buffer shows the results of a findInFiles().
+        self.projectSearch = None
+        # The joined lines, for finding a multi-line pattern. See
+        # findDocumentPattern().
+        self.documentSearch = app.document_search.DocumentSearch()
+        # The matches of |findRe|. See findMatchesMaybe().
+        self.matchIndex = app.match_index.MatchIndex()
+        # Encodes the redoChain for the history. See fileWrite().
+        self.redoChainEncoder = app.redo_chain.RedoChainEncoder()
         self.fileFilter(u'')
 
     def getMatchingBracketRowCol(self):
@@ -78,16 +104,38 @@ class Actions(app.mutator.Mutator):
                 len(self.parser.rowText(self.penRow)) <= self.penCol):
             return None
         ch = self.parser.rowText(self.penRow)[self.penCol]
+        if isinstance(self.parser, app.parser.Parser):
+            offset = self.bracketIndex.matchingBracket(
+                self.parser,
+                self.parser.nodeBegin[self.parser.rows[self.penRow]] +
+                self.penCol)
+            if offset == app.bracket_index.kNoMatch:
+                return None
+            if offset is not None:
+                return self.parser.rowColFromOffset(offset)
+        # Search the rows instead, e.g. while the index is behind the parse.
+        # As in the index, brackets in strings and comments are skipped
+        # (unless the bracket at the pen is in one).
+        isSkippedGrammar = app.bracket_index.isSkippedGrammar
+        skipStrings = not isSkippedGrammar(
+            self.parser.grammarAt(self.penRow, self.penCol))
+
+        def isSkipped(row, col):
+            return skipStrings and isSkippedGrammar(
+                self.parser.grammarAt(row, col))
 
         def searchForward(openCh, closeCh):
             count = 1
             textCol = self.penCol + 1
+            regex = app.regex.cachedCompile(u"(\\" + openCh + u")|(\\" +
+                                            closeCh + u")")
             for row in range(self.penRow, self.parser.rowCount()):
                 if row != self.penRow:
                     textCol = 0
                 line = self.parser.rowText(row)[textCol:]
-                for match in re.finditer(
-                        u"(\\" + openCh + u")|(\\" + closeCh + u")", line):
+                for match in regex.finditer(line):
+                    if isSkipped(row, textCol + match.start()):
+                        continue
                     if match.group() == openCh:
                         count += 1
                     else:
@@ -98,15 +146,16 @@ class Actions(app.mutator.Mutator):
 
         def searchBack(closeCh, openCh):
             count = -1
+            regex = app.regex.cachedCompile(u"(\\" + openCh + u")|(\\" +
+                                            closeCh + u")")
             for row in range(self.penRow, -1, -1):
                 line = self.parser.rowText(row)
                 if row == self.penRow:
                     line = line[:self.penCol]
-                found = [
-                    i for i in re.finditer(
-                        u"(\\" + openCh + u")|(\\" + closeCh + u")", line)
-                ]
+                found = [i for i in regex.finditer(line)]
                 for match in reversed(found):
+                    if isSkipped(row, match.start()):
+                        continue
                     if match.group() == openCh:
                         count += 1
                     else:
@@ -906,6 +955,9 @@ class Actions(app.mutator.Mutator):
         return data.split(u'\n')
 
     def dataToLines(self):
+        if self.mappedFile is not None:
+            # The lines are read from the file as needed.
+            return
         if self.isBinary:
             self.lines = self.doDataToLines(self.data)
             #self.lines = self.doBinaryDataToLines(self.data)
@@ -913,6 +965,9 @@ class Actions(app.mutator.Mutator):
             self.lines = self.doDataToLines(self.data)
 
     def fileFilter(self, data):
+        if self.mappedFile is not None:
+            self.mappedFile = None
+            self.parser = app.parser.Parser()
         self.data = data
         self.dataToLines()
         self.upperChangedRow = 0
@@ -926,6 +981,8 @@ class Actions(app.mutator.Mutator):
         if not os.path.exists(self.fullPath):
             data = u''
             self.setMessage(u'Creating new file')
+        elif self.fileLoadMapped():
+            return
         else:
             try:
                 inputFile = io.open(self.fullPath)
@@ -935,6 +992,11 @@ class Actions(app.mutator.Mutator):
                 self.isBinary = False
             except Exception as e:
                 #app.log.info(unicode(e))
+                if inputFile:
+                    inputFile.close()
+                    inputFile = None
+                if self.fileLoadHex():
+                    return
                 try:
                     inputFile = io.open(self.fullPath, 'rb')
                     if 1:
@@ -968,6 +1030,59 @@ class Actions(app.mutator.Mutator):
             inputFile.close()
         self.determineFileType()
 
+    def fileLoadMapped(self):
+        """Load a large file lazily, see app/mapped_file.py. Files smaller
+        than the largeFileSize pref are read as usual.
+
+        Returns:
+          True if the file was loaded.
+        """
+        largeFileSize = self.program.prefs.editor.get(u'largeFileSize')
+        if not largeFileSize or os.path.getsize(self.fullPath) < largeFileSize:
+            return False
+        try:
+            mappedFile = app.mapped_file.MappedFile(self.fullPath,
+                                                    self.doDataToLines)
+        except UnicodeDecodeError:
+            return self.fileLoadHex()
+        except Exception as e:
+            app.log.info(u'not loading lazily', self.fullPath, unicode(e))
+            return False
+        self.useMappedFile(mappedFile)
+        self.isBinary = False
+        self.fileEncoding = mappedFile.encoding
+        self.setMessage(u'Opened large file')
+        self.determineFileType()
+        return True
+
+    def fileLoadHex(self):
+        """Load a binary file lazily, as rows of hex digits.
+
+        Returns:
+          True if the file was loaded.
+        """
+        try:
+            mappedFile = app.mapped_file.HexFile(self.fullPath)
+        except Exception as e:
+            app.log.info(u'not loading lazily', self.fullPath, unicode(e))
+            return False
+        self.useMappedFile(mappedFile)
+        self.isBinary = True
+        self.fileEncoding = None
+        app.log.info(u'Opened file as a binary file')
+        self.setMessage(u'Opened file as a binary file')
+        self.determineFileType()
+        return True
+
+    def useMappedFile(self, mappedFile):
+        """Read the lines from |mappedFile| (as they are needed)."""
+        self.fileFilter(u'')
+        self.mappedFile = mappedFile
+        self.lines.assignBlocks(mappedFile.blocks)
+        self.parser = app.parser.WindowParser()
+        self.fileStat = os.stat(self.fullPath)
+        self.relativePath = os.path.relpath(self.fullPath, os.getcwd())
+
     def _determineRootGrammar(self, name, extension):
         if extension == u"" and len(self.lines) > 0:
             line = self.lines[0]
@@ -1010,8 +1125,9 @@ class Actions(app.mutator.Mutator):
           None.
         """
         # Restore the file history.
-        self.fileHistory = self.program.history.getFileHistory(
-            self.fullPath, self.data)
+        # The file (rather than self.data) is hashed, so that the checksum
+        # is cached for the getFileInfo() below.
+        self.fileHistory = self.program.history.getFileHistory(self.fullPath)
 
         # Restore all positions and values of variables.
         self.penRow, self.penCol = self.fileHistory.setdefault(u'pen', (0, 0))
@@ -1029,10 +1145,18 @@ class Actions(app.mutator.Mutator):
         self.markerRow, self.markerCol = self.fileHistory.setdefault(
             u'marker', (0, 0))
         if self.program.prefs.editor[u'saveUndo']:
-            self.redoChain = self.fileHistory.setdefault(
-                u'redoChainCompound', [])
+            # Prior versions stored the redoChain as is.
+            self.redoChain = self.fileHistory.get(u'redoChainCompound', [])
             self.savedAtRedoIndex = self.fileHistory.setdefault(
                 u'savedAtRedoIndexCompound', 0)
+            chunks = self.fileHistory.get(u'redoChunks')
+            if chunks is not None:
+                try:
+                    self.redoChain = app.redo_chain.decodeRedoChain(chunks)
+                except Exception as e:
+                    app.log.exception(e)
+                    self.redoChain = []
+                    self.savedAtRedoIndex = 0
             self.tempChange = self.fileHistory.setdefault(u'tempChange', None)
             self.redoIndex = self.savedAtRedoIndex
             self.oldRedoIndex = self.savedAtRedoIndex
@@ -1044,8 +1168,8 @@ class Actions(app.mutator.Mutator):
         self.bookmarks = self.fileHistory.setdefault(u'bookmarks', [])
 
         # Store the file's info.
-        self.lastChecksum, self.lastFileSize = app.history.getFileInfo(
-            self.fullPath)
+        self.lastChecksum, self.lastFileSize = (
+            self.program.history.getFileInfo(self.fullPath))
 
     def updateBasicScrollPosition(self):
         """Sets scrollRow, scrollCol to the closest values that the view's
@@ -1143,7 +1267,11 @@ class Actions(app.mutator.Mutator):
         return horizontally and vertically
 
     def linesToData(self):
-        if self.isBinary:
+        if isinstance(self.lines, app.line_store.LineStore):
+            # The line store caches the text of each block of lines, so only
+            # the rows that changed since the last call are encoded again.
+            self.data = self.lines.text(self.doLinesToData)
+        elif self.isBinary:
             self.data = self.doLinesToData(self.lines)
             # TODO(dschuyler): convert binary data.
             #self.data = self.doLinesToBinaryData(self.lines)
@@ -1161,7 +1289,8 @@ class Actions(app.mutator.Mutator):
         self.fenceRedoChain()
         try:
             try:
-                if self.program.prefs.editor[u'onSaveStripTrailingSpaces']:
+                if (self.program.prefs.editor[u'onSaveStripTrailingSpaces'] and
+                        self.mappedFile is None):
                     self.stripTrailingWhiteSpace()
                     self.compoundChangePush()
                 # Save user data that applies to read-only files into history.
@@ -1173,42 +1302,52 @@ class Actions(app.mutator.Mutator):
                 self.fileHistory[u'marker'] = (self.markerRow, self.markerCol)
                 self.fileHistory[u'selectionMode'] = self.selectionMode
                 self.fileHistory[u'bookmarks'] = self.bookmarks
-                self.linesToData()
-                if self.isBinary:
-                    removeWhitespace = {
-                        ord(u' '): None,
-                        ord(u'\n'): None,
-                        ord(u'\r'): None,
-                        ord(u'\t'): None,
-                    }
-                    outputData = binascii.unhexlify(
-                        self.data.translate(removeWhitespace))
-                    outputFile = io.open(self.fullPath, u'wb+')
-                elif self.fileEncoding is None:
-                    outputData = self.data
-                    outputFile = io.open(
-                        self.fullPath, u'w+', encoding=u'UTF-8')
+                if self.mappedFile is not None:
+                    self.mappedFile.write(self.fullPath, self.lines,
+                                          self.doLinesToData)
                 else:
-                    outputData = self.data
-                    outputFile = io.open(
-                        self.fullPath, 'w+', encoding=self.fileEncoding)
-                outputFile.seek(0)
-                outputFile.truncate()
-                outputFile.write(outputData)
-                outputFile.close()
+                    self.linesToData()
+                    if self.isBinary:
+                        removeWhitespace = {
+                            ord(u' '): None,
+                            ord(u'\n'): None,
+                            ord(u'\r'): None,
+                            ord(u'\t'): None,
+                        }
+                        outputData = binascii.unhexlify(
+                            self.data.translate(removeWhitespace))
+                        outputFile = io.open(self.fullPath, u'wb+')
+                    elif self.fileEncoding is None:
+                        outputData = self.data
+                        outputFile = io.open(
+                            self.fullPath, u'w+', encoding=u'UTF-8')
+                    else:
+                        outputData = self.data
+                        outputFile = io.open(
+                            self.fullPath, 'w+', encoding=self.fileEncoding)
+                    outputFile.seek(0)
+                    outputFile.truncate()
+                    outputFile.write(outputData)
+                    outputFile.close()
                 # Save user data that applies to writable files.
                 self.savedAtRedoIndex = self.redoIndex
                 if self.program.prefs.editor[u'saveUndo']:
-                    self.fileHistory[u'redoChainCompound'] = self.redoChain
-                    self.fileHistory[
-                        u'savedAtRedoIndexCompound'] = self.savedAtRedoIndex
+                    chunks, dropped = self.redoChainEncoder.encode(
+                        self.redoChain, self.savedAtRedoIndex,
+                        self.program.prefs.editor[u'saveUndoLimit'])
+                    self.fileHistory.pop(u'redoChainCompound', None)
+                    self.fileHistory[u'redoChunks'] = chunks
+                    self.fileHistory[u'savedAtRedoIndexCompound'] = (
+                        self.savedAtRedoIndex - dropped)
                     self.fileHistory[u'tempChange'] = self.tempChange
+
+                def onSaved(fileInfo):
+                    # Store the file's new info
+                    self.lastChecksum, self.lastFileSize = fileInfo
+
                 self.program.history.saveUserHistory(
                     (self.fullPath, self.lastChecksum, self.lastFileSize),
-                    self.fileHistory)
-                # Store the file's new info
-                self.lastChecksum, self.lastFileSize = app.history.getFileInfo(
-                    self.fullPath)
+                    self.fileHistory, onSaved)
                 self.fileStat = os.stat(self.fullPath)
                 # If we're writing this file for the first time, self.isReadOnly
                 # will still be True (from when it didn't exist).
@@ -1216,7 +1355,12 @@ class Actions(app.mutator.Mutator):
                 self.setMessage(u'File saved')
             except Exception as e:
                 color = self.program.prefs.color.get(u'status_line_error')
-                if self.isReadOnly:
+                if isinstance(e, UnicodeDecodeError):
+                    self.setMessage(u'Part of the file is not',
+                                    self.fileEncoding,
+                                    u'text. The file was not saved.',
+                                    color=color)
+                elif self.isReadOnly:
                     self.setMessage(
                         u"Permission error. Try modifying in sudo mode.",
                         color=color)
@@ -1252,23 +1396,11 @@ class Actions(app.mutator.Mutator):
             self.findRe = None
             self.doSelectionMode(app.selectable.kSelectionNone)
             return
-        editorPrefs = self.program.prefs.editor
-        flags = 0
-        flags |= (editorPrefs.get(u'findIgnoreCase') and re.IGNORECASE or 0)
-        flags |= (editorPrefs.get(u'findMultiLine') and re.MULTILINE or 0)
-        flags |= (editorPrefs.get(u'findLocale') and re.LOCALE or 0)
-        flags |= (editorPrefs.get(u'findDotAll') and re.DOTALL or 0)
-        flags |= (editorPrefs.get(u'findVerbose') and re.VERBOSE or 0)
-        flags |= (editorPrefs.get(u'findUnicode') and re.UNICODE or 0)
-        if not editorPrefs.get(u'findUseRegex'):
-            searchFor = re.escape(searchFor)
-        if editorPrefs.get(u'findWholeWord'):
-            searchFor = r"\b%s\b" % searchFor
+        searchFor, flags = app.regex.findPattern(searchFor,
+                                                 self.program.prefs.editor)
         #app.log.info(searchFor, flags)
         # The saved re is also used for highlighting.
-        self.findRe = re.compile(searchFor, flags)
-        self.findBackRe = re.compile(u"%s(?!.*%s.*)" % (searchFor, searchFor),
-                                     flags)
+        self.findRe = app.regex.cachedCompile(searchFor, flags)
         self.findCurrentPattern(direction)
 
     def replaceFound(self, replaceWith):
@@ -1290,7 +1422,7 @@ class Actions(app.mutator.Mutator):
 
     def findPlainText(self, text):
         searchFor = re.escape(text)
-        self.findRe = re.compile(u'()^' + searchFor)
+        self.findRe = app.regex.cachedCompile(u'()^' + searchFor)
         self.findCurrentPattern(0)
 
     def findReplaceFlags(self, tokens):
@@ -1340,56 +1472,148 @@ class Actions(app.mutator.Mutator):
             return
         _, find, replace, flags = splitCmd
         self.linesToData()
-        data = self.findReplaceText(find, replace, flags, self.data)
-        self.applyDocumentUpdate(data)
+        self.applyLineRanges(
+            self.findReplaceRanges(find, replace, flags, self.data))
 
     def findReplaceText(self, find, replace, flags, text):
         flags = self.findReplaceFlags(flags)
-        return re.sub(find, replace, text, flags=flags)
+        return app.regex.cachedCompile(find, flags).sub(replace, text)
 
-    def applyDocumentUpdate(self, data):
-        diff = difflib.ndiff(self.lines, self.doDataToLines(data))
-        ndiff = []
-        counter = 0
-        for i in diff:
-            if i[0] != u' ':
-                if counter:
-                    ndiff.append(counter)
-                    counter = 0
-                if i[0] in [u'+', u'-']:
-                    ndiff.append(i)
-            else:
-                counter += 1
-        if counter:
-            ndiff.append(counter)
-        if len(ndiff) == 1 and type(ndiff[0]) is type(0):
-            # Nothing was changed. The only entry is a 'skip these lines'
+    def findReplaceRanges(self, find, replace, flags, text):
+        """Substitute (as findReplaceText() does) within |text|, which is
+        self.lines joined with line breaks. Rather than making a new document,
+        the changes are gathered by line.
+
+        Returns:
+          A list of (row, oldLines, newLines), see applyLineRanges().
+        """
+        regex = app.regex.cachedCompile(find, self.findReplaceFlags(flags))
+        # Parsing the template for each match is slow, so skip that when there
+        # are no escapes or group references.
+        literal = u'\\' not in replace
+        ranges = []
+        # The row of |offset| and the offset of the start of that row.
+        row = 0
+        offset = 0
+        rowBegin = 0
+        # The range being gathered.
+        beginRow = endRow = None
+        pieces = []
+        rangeBegin = rangeEnd = position = 0
+
+        def finish():
+            pieces.append(text[position:rangeEnd])
+            newLines = tuple(self.doDataToLines(u''.join(pieces)))
+            oldLines = tuple(self.lines[beginRow:endRow + 1])
+            if newLines != oldLines:
+                ranges.append((beginRow, oldLines, newLines))
+
+        for match in regex.finditer(text):
+            begin, end = match.span()
+            replacement = replace if literal else match.expand(replace)
+            if begin > offset:
+                row += text.count(u'\n', offset, begin)
+                rowBegin = text.rfind(u'\n', 0, begin) + 1
+                offset = begin
+            if beginRow is None or row > endRow:
+                if beginRow is not None:
+                    finish()
+                beginRow = row
+                pieces = []
+                rangeBegin = position = rowBegin
+            endRow = row + text.count(u'\n', begin, end)
+            rangeEnd = text.find(u'\n', end)
+            if rangeEnd == -1:
+                rangeEnd = len(text)
+            pieces.append(text[position:begin])
+            pieces.append(replacement)
+            position = end
+        if beginRow is not None:
+            finish()
+        return ranges
+
+    def lineRanges(self, newLines):
+        """Find the rows that differ between self.lines and |newLines|.
+
+        Returns:
+          A list of (row, oldLines, newLines), see applyLineRanges().
+        """
+        oldLines = self.lines
+        oldCount = len(oldLines)
+        newCount = len(newLines)
+        if oldCount == newCount:
+            # Fast path: compare row by row.
+            ranges = []
+            row = 0
+            while row < oldCount:
+                if oldLines[row] == newLines[row]:
+                    row += 1
+                    continue
+                end = row + 1
+                while end < oldCount and oldLines[end] != newLines[end]:
+                    end += 1
+                ranges.append((row, tuple(oldLines[row:end]),
+                               tuple(newLines[row:end])))
+                row = end
+            return ranges
+        # One range, between the rows in common at the start and end.
+        limit = min(oldCount, newCount)
+        begin = 0
+        while begin < limit and oldLines[begin] == newLines[begin]:
+            begin += 1
+        end = 0
+        while (end < limit - begin and
+               oldLines[oldCount - 1 - end] == newLines[newCount - 1 - end]):
+            end += 1
+        return [(begin, tuple(oldLines[begin:oldCount - end]),
+                 tuple(newLines[begin:newCount - end]))]
+
+    def applyLineRanges(self, ranges):
+        """Replace ranges of rows, as a single change.
+
+        Args:
+          ranges (list): (row, oldLines, newLines) tuples, in order of |row|
+              and not overlapping. The rows of |oldLines| are replaced with
+              |newLines|.
+        """
+        if not ranges:
             self.setMessage(u'No matches found')
             return
-        ndiff = tuple(ndiff)
-        if 0:
-            for i in ndiff:
-                app.log.info(i)
-        self.redoAddChange((u'ld', ndiff))
+        self.redoAddChange((u'lr', tuple(ranges)))
         self.redo()
 
+    def applyDocumentUpdate(self, data):
+        """Replace the document with |data|, changing only the rows that
+        differ."""
+        self.applyLineRanges(self.lineRanges(self.doDataToLines(data)))
+
     def findCurrentPattern(self, direction):
+        if self.isMultiLineFind():
+            self.findDocumentPattern(direction)
+            return
+        if self.findRe is not None and self.matchIndex.isCurrent(
+                self.findRe, self.lines):
+            self.findIndexedPattern(direction)
+            return
         localRe = self.findRe
-        offset = self.penCol + direction
-        if direction < 0:
-            localRe = self.findBackRe
         if localRe is None:
             app.log.info(u'localRe is None')
             return
+        if direction >= 0:
+            search = localRe.search
+        else:
+            # Search backward by taking the last of the forward matches.
+            def search(text):
+                return app.regex.searchBackward(localRe, text)
+
         # Check part of current line.
         text = self.lines[self.penRow]
         if direction >= 0:
-            text = text[offset:]
+            offset = self.penCol + direction
+            found = localRe.search(text[offset:])
         else:
-            text = text[:self.penCol]
             offset = 0
-        #app.log.info(u'find() searching', repr(text))
-        found = localRe.search(text)
+            found = app.regex.searchBackward(localRe, text, self.penCol)
         rowFound = self.penRow
         if not found:
             offset = 0
@@ -1399,12 +1623,8 @@ class Actions(app.mutator.Mutator):
             else:
                 theRange = range(self.penRow - 1, -1, -1)
             for i in theRange:
-                found = localRe.search(self.lines[i])
+                found = search(self.lines[i])
                 if found:
-                    if 0:
-                        for k in found.regs:
-                            app.log.info(u'AAA', k[0], k[1])
-                        app.log.info(u'b found on line', i, repr(found))
                     rowFound = i
                     break
             if not found:
@@ -1415,18 +1635,14 @@ class Actions(app.mutator.Mutator):
                 else:
                     theRange = range(len(self.lines) - 1, self.penRow, -1)
                 for i in theRange:
-                    found = localRe.search(self.lines[i])
+                    found = search(self.lines[i])
                     if found:
                         rowFound = i
                         break
                 if not found:
-                    # Check the rest of the current line
-                    if direction >= 0:
-                        text = self.lines[self.penRow]
-                    else:
-                        text = self.lines[self.penRow][self.penCol:]
-                        offset = self.penCol
-                    found = localRe.search(text)
+                    # Check the rest of the current line (or, going backward,
+                    # the whole line, since nothing begins before the pen).
+                    found = search(self.lines[self.penRow])
                     rowFound = self.penRow
         if found:
             #app.log.info(u'c found on line', rowFound, repr(found.regs))
@@ -1438,6 +1654,114 @@ class Actions(app.mutator.Mutator):
         app.log.info(u'find not found')
         self.doSelectionMode(app.selectable.kSelectionNone)
 
+    def isMultiLineFind(self):
+        """Whether |findRe| may match across lines (see the findMultiLine
+        and findDotAll prefs). Not for large (mapped) files, which are only
+        read as they're viewed."""
+        return (self.findRe is not None and self.mappedFile is None and
+                bool(self.findRe.flags & (re.MULTILINE | re.DOTALL)))
+
+    def findDocumentPattern(self, direction):
+        """Select the next (or prior) match of |findRe| within the whole
+        document, rather than within each line. See findCurrentPattern()."""
+        self.documentSearch.update(self.lines)
+        found = self.documentSearch.search(self.findRe, self.penRow,
+                                           self.penCol + max(direction, 0),
+                                           direction)
+        if found is None:
+            app.log.info(u'find not found')
+            self.doSelectionMode(app.selectable.kSelectionNone)
+            return
+        (row, col), (endRow, endCol), wrapped = found
+        if wrapped:
+            self.setMessage(u'Find wrapped around.')
+        if row == endRow:
+            self.selectText(row, col, endCol - col,
+                            app.selectable.kSelectionCharacter)
+            return
+        # Mark the end of the match and leave the pen at the start, as
+        # selectText() does.
+        inView = self.isInView(row, col, endRow, endCol)
+        self.doSelectionMode(app.selectable.kSelectionNone)
+        self.cursorMove(endRow - self.penRow, endCol - self.penCol)
+        self.doSelectionMode(app.selectable.kSelectionCharacter)
+        self.cursorMove(row - self.penRow, col - self.penCol)
+        if not inView:
+            self.scrollToOptimalScrollPosition()
+
+    def findIndexedPattern(self, direction):
+        """Select the next (or prior) match using the match index, rather
+        than searching the lines. See findCurrentPattern()."""
+        matchIndex = self.matchIndex
+        if direction >= 0:
+            # Search the rest of the pen row as a slice, as
+            # findCurrentPattern() does (so that e.g. ^ matches at the pen).
+            # The index holds the matches of whole rows.
+            offset = self.penCol + direction
+            found = self.findRe.search(self.lines[self.penRow][offset:])
+            if found is not None:
+                self.selectText(self.penRow, offset + found.start(),
+                                found.end() - found.start(),
+                                app.selectable.kSelectionCharacter)
+                return
+            found = matchIndex.nextMatch(self.penRow + 1, 0)
+            if found is None:
+                self.setMessage(u'Find wrapped around.')
+                found = matchIndex.firstMatch()
+        else:
+            found = matchIndex.priorMatch(self.penRow, self.penCol)
+            if found is None:
+                self.setMessage(u'Find wrapped around.')
+                found = matchIndex.lastMatch()
+        if found is None:
+            app.log.info(u'find not found')
+            self.doSelectionMode(app.selectable.kSelectionNone)
+            return
+        row, begin, end = found
+        self.selectText(row, begin, end - begin,
+                        app.selectable.kSelectionCharacter)
+
+    def bracketIndexMaybe(self):
+        """Index the brackets parsed since the last call, stopping early if a
+        user event arrives. See getMatchingBracketRowCol().
+
+        Returns:
+          True if the parsed text is indexed.
+        """
+        if not isinstance(self.parser, app.parser.Parser):
+            # A large file (see app.parser.WindowParser) isn't indexed.
+            return True
+        return self.bracketIndex.update(self.parser, self.program.bg)
+
+    def findMatchesMaybe(self):
+        """Bring the match index up to date with |findRe|, stopping early if
+        a user event arrives.
+
+        Returns:
+          True if the index is up to date (or there is nothing to find).
+        """
+        if (self.findRe is None or self.mappedFile is not None or
+                self.isMultiLineFind()):
+            # The rows of a large file are only read as they're viewed, so
+            # they aren't indexed. A multi-line match doesn't fit in a row.
+            if self.matchIndex.regex is not None:
+                self.matchIndex.clear()
+            return True
+        return self.matchIndex.update(self.findRe, self.lines, self.program.bg)
+
+    def findMatchNumber(self):
+        """Get the number of the match at the pen and the count of matches.
+
+        Returns:
+          (number, count), where |number| is None if there is no match at the
+          pen. None if the matches haven't been found yet.
+        """
+        if self.findRe is None or not self.matchIndex.isCurrent(
+                self.findRe, self.lines):
+            return None
+        return (self.matchIndex.matchNumber(self.penRow, self.penCol),
+                self.matchIndex.matchCount())
+
     def findAgain(self):
         """Find the current pattern, searching down the document."""
         self.findCurrentPattern(1)
@@ -1446,6 +1770,66 @@ class Actions(app.mutator.Mutator):
         """Find the current pattern, searching up the document."""
         self.findCurrentPattern(-1)
 
+    def findInFiles(self, searchFor, root):
+        """Search the files under |root| for |searchFor| (using the find
+        prefs, as find() does). The results replace the lines of this buffer
+        as they arrive, see projectSearchMaybe(). A prior search is
+        cancelled."""
+        self.cancelProjectSearch()
+        pattern, flags = app.regex.findPattern(searchFor,
+                                               self.program.prefs.editor)
+        index = None
+        if self.program.prefs.editor.get(u'findInFilesIndex'):
+            try:
+                index = app.trigram_index.getIndex(
+                    self.program.prefs.userData.get(u'indexPath'), root)
+            except Exception as e:
+                app.log.exception(e)
+        try:
+            self.projectSearch = app.project_search.ProjectSearch(
+                root, pattern, flags, index=index)
+        except re.error as e:
+            self.setMessage(u'Bad pattern: ' + unicode(e))
+            return
+        self.fileFilter(u'find in files: %s\n' % (searchFor,))
+        self.setMessage(u'Searching in ' + root)
+
+    def cancelProjectSearch(self):
+        """Stop the findInFiles() search of this buffer, if any."""
+        if self.projectSearch is not None:
+            self.projectSearch.cancel()
+            self.projectSearch = None
+
+    def projectSearchMaybe(self):
+        """Add the results of a findInFiles() that arrived since the last
+        call.
+
+        Returns:
+          True if the search is finished.
+        """
+        search = self.projectSearch
+        if search is None or search.isDone():
+            return True
+        # Wait briefly, so that the background thread doesn't spin.
+        results = search.takeResults(0.05)
+        if results:
+            row = len(self.lines) - 1
+            lines = self.doDataToLines(u'\n'.join(
+                u'%s:%d:%d: %s' % (relPath, resultRow + 1, col + 1, line)
+                for relPath, resultRow, col, line in results))
+            # Keep the (empty) last row last. The results aren't an edit by
+            # the user, so they're kept out of the redo chain (and can't be
+            # undone).
+            self.lines.replaceLines(row, row, lines)
+            if self.upperChangedRow > row:
+                self.upperChangedRow = row
+        finished = search.isDone()
+        if results or finished:
+            self.setMessage(u'%d matches in %d files%s' %
+                            (len(self.lines) - 2, search.fileCount,
+                             u'' if finished else u', searching'))
+        return finished
+
     def findNext(self, searchFor):
         """Find a new pattern, searching down the document."""
         self.find(searchFor, 1)
@@ -1701,6 +2085,23 @@ class Actions(app.mutator.Mutator):
 
     def doParse(self, begin, end):
         start = time.time()
+        if self.mappedFile is not None:
+            # Only the rows in view are parsed in a large file.
+            if self.view is not None:
+                self.parser.parse(self.program.prefs, self.lines,
+                                  self.rootGrammar, self.view.scrollRow,
+                                  self.view.scrollRow + self.view.rows)
+            if (self.mappedFile.decodeError is not None and
+                    not self.isReadOnly):
+                # The rows just read (or read earlier) have bytes that aren't
+                # text in the file encoding, so the file can't be saved.
+                self.isReadOnly = True
+                self.setMessage(u'Part of the file is not', self.fileEncoding,
+                                u'text, it will not be saved',
+                                color=self.program.prefs.color.get(
+                                    u'status_line_error'))
+            self.parserTime = time.time() - start
+            return
         self.linesToData()
         self.parser.parse(self.program.bg, self.program.prefs, self.data,
                           self.rootGrammar, begin, end)
@@ -1709,29 +2110,92 @@ class Actions(app.mutator.Mutator):
         self.parserTime = time.time() - start
 
     def parseDocument(self):
+        if self.mappedFile is None and self.parallelParseMaybe():
+            return
         begin = min(self.parser.fullyParsedToLine, self.upperChangedRow)
         end = len(self.lines)
         self.doParse(begin, end)
 
+    def cancelParallelParse(self):
+        """Stop the parallelParseMaybe() parse of this buffer, if any."""
+        if self.parallelParse is not None:
+            self.parallelParse.cancel()
+            self.parallelParse = None
+
+    def parallelParseMaybe(self):
+        """For a large document, parse in several processes rather than in
+        the background thread (if the parallelParse pref is set).
+
+        Returns:
+          True if a parallel parse is running or just finished.
+        """
+        if self.parallelParse is None:
+            if (self.parallelParseTried or
+                    not self.program.prefs.editor.get('parallelParse')):
+                return False
+            self.parallelParseTried = True
+            self.linesToData()
+            if len(self.data) < app.parallel_parser.kMinParallelParseSize:
+                return False
+            self.parallelParse = app.parallel_parser.ParallelParse(
+                self.program.prefs, self.data, self.rootGrammar)
+            return True
+        self.linesToData()
+        if self.data is not self.parallelParse.data:
+            # The document changed while parsing, so the (serial) parse starts
+            # over.
+            self.cancelParallelParse()
+            return False
+        # Wait briefly, so that the background thread doesn't spin.
+        if not self.parallelParse.ready(0.05):
+            return True
+        parallelParse = self.parallelParse
+        self.parallelParse = None
+        start = time.time()
+        parallelParse.stitch(self.parser, self.program.prefs)
+        self.debugUpperChangedRow = self.upperChangedRow
+        self.upperChangedRow = self.parser.fullyParsedToLine
+        self.parserTime = time.time() - start
+        return True
+
     def parseScreenMaybe(self):
         begin = min(self.parser.fullyParsedToLine, self.upperChangedRow)
         end = self.view.scrollRow + self.view.rows + 1
         if end > begin + 100:
-            # Call doParse with an empty range.
-            end = begin
+            # Call doParse with an empty range and parse the visible rows
+            # from a guessed state; the background parse fills in the rest.
+            self.doParse(begin, begin)
+            self.parseWindow()
+            return
         self.doParse(begin, end)
 
     def parseGrammars(self):
         if not self.view:
             return
         scrollRow = self.view.scrollRow
-        # If there is a gap, leave it to the background parsing.
         if (self.parser.fullyParsedToLine < scrollRow or
                 self.upperChangedRow < scrollRow):
+            # There is a gap, leave it to the background parsing (but show the
+            # visible rows in the meantime).
+            begin = min(self.parser.fullyParsedToLine, self.upperChangedRow)
+            self.doParse(begin, begin)
+            self.parseWindow()
             return
         end = self.view.scrollRow + self.view.rows + 1
         self.doParse(self.upperChangedRow, end)
 
+    def parseWindow(self):
+        """Parse the visible rows ahead of the rows above them. See
+        app.parser.Parser.parseWindow()."""
+        if self.mappedFile is not None:
+            # doParse() parses only the visible rows anyway.
+            return
+        start = time.time()
+        self.parser.parseWindow(self.program.prefs, self.rootGrammar,
+                                self.view.scrollRow,
+                                self.view.scrollRow + self.view.rows)
+        self.parserTime += time.time() - start
+
     def doSelectionMode(self, mode):
         if self.selectionMode != mode:
             self.redoAddChange((u'm', (0, 0, self.penRow - self.markerRow,
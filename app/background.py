@@ -17,12 +17,12 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import fcntl
 import os
 try:
     import Queue as queue
 except ImportError:
     import queue
-import signal
 import sys
 import threading
 import time
@@ -32,6 +32,105 @@ import app.profile
 import app.render
 
 
+class FrameTransport:
+    """Hands frames from the background thread to the main thread.
+
+    Only the rows that differ from the prior frame are sent. A frame that the
+    main thread hasn't taken yet is merged with the next one (so frames that
+    are superseded before the main thread gets to them are not drawn). The
+    main thread is woken by a byte written to a pipe, which it may select() on
+    along with the terminal input.
+    """
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        # The rows (row: [runs]) of the last frame put, used by the background
+        # thread.
+        self.__priorRows = {}
+        # The rows changed in the frames not yet taken, and the cursor and
+        # command count of the latest of those frames.
+        self.__rows = {}
+        self.__cursor = None
+        self.__cmdCount = None
+        self.__exception = None
+        self.__resend = False
+        # The number of frames merged into a later frame (for debugging).
+        self.droppedFrames = 0
+        self.wakeFd, self.__wakeWriteFd = os.pipe()
+        flags = fcntl.fcntl(self.wakeFd, fcntl.F_GETFL)
+        fcntl.fcntl(self.wakeFd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+
+    def __wake(self):
+        os.write(self.__wakeWriteFd, b'.')
+
+    def hasFrame(self):
+        return self.__cmdCount is not None or self.__exception is not None
+
+    def put(self, drawList, cursor, cmdCount):
+        """Send a frame (from the background thread)."""
+        rows = {}
+        for run in drawList:
+            runs = rows.get(run[0])
+            if runs is None:
+                runs = rows[run[0]] = []
+            runs.append(run)
+        with self.__lock:
+            if self.__resend:
+                self.__priorRows = {}
+                self.__resend = False
+            priorRows = self.__priorRows
+            changed = self.__rows
+            for row, runs in rows.items():
+                if priorRows.get(row) != runs:
+                    changed[row] = runs
+            self.__priorRows = rows
+            self.__cursor = cursor
+            isWaiting = self.__cmdCount is not None
+            if isWaiting:
+                self.droppedFrames += 1
+            self.__cmdCount = cmdCount
+        if not isWaiting:
+            self.__wake()
+
+    def putException(self, out):
+        """Send the formatted traceback |out| (from the background thread)."""
+        with self.__lock:
+            self.__exception = out
+        self.__wake()
+
+    def resend(self):
+        """Send all the rows of the next frame (e.g. after the main thread
+        forgets what is on the screen)."""
+        with self.__lock:
+            self.__resend = True
+
+    def take(self):
+        """Get the frame (on the main thread).
+
+        Returns:
+          (drawList, cursor, cmdCount) where |drawList| has the rows that
+          changed, ('exception', out), or None if there is no new frame.
+        """
+        try:
+            while os.read(self.wakeFd, 4096):
+                pass
+        except OSError:
+            # EAGAIN, the pipe is empty.
+            pass
+        with self.__lock:
+            if self.__exception is not None:
+                return ('exception', self.__exception)
+            if self.__cmdCount is None:
+                return None
+            rows = self.__rows
+            frame = ([run for row in sorted(rows) for run in rows[row]],
+                     self.__cursor, self.__cmdCount)
+            self.__rows = {}
+            self.__cursor = None
+            self.__cmdCount = None
+        return frame
+
+
 class BackgroundThread(threading.Thread):
 
     def __init__(self, *args, **keywords):
@@ -40,13 +139,14 @@ class BackgroundThread(threading.Thread):
         self.fromBackground = None
 
     def get(self):
-        return self.fromBackground.get()
+        """Get the latest frame, see FrameTransport.take()."""
+        return self.fromBackground.take()
 
     def hasMessage(self):
         # This thread yield (time.sleep(0)) dramatically improves Python3
         # performance. Without this line empty() will be called far too often.
         time.sleep(0)
-        return not self.fromBackground.empty()
+        return self.fromBackground.hasFrame()
 
     def hasUserEvent(self):
         time.sleep(0)  # See note in hasMessage().
@@ -56,11 +156,9 @@ class BackgroundThread(threading.Thread):
         self.toBackground.put(data)
 
 
-def background(inputQueue, outputQueue):
+def background(inputQueue, outputFrames):
     cmdCount = 0
     block = True
-    pid = os.getpid()
-    signalNumber = signal.SIGUSR1
     while True:
         try:
             try:
@@ -69,13 +167,29 @@ def background(inputQueue, outputQueue):
                 if message == 'quit':
                     app.log.info('bg received quit message')
                     return
-                program.executeCommandList(message)
-                program.shortTimeSlice()
-                program.render()
+                scheduler = program.program.renderScheduler
+                commandCount = 0
+                while True:
+                    program.executeCommandList(message)
+                    program.shortTimeSlice()
+                    commandCount += len(message)
+                    # Gather the input that arrives before the next frame is
+                    # due into that frame.
+                    wait = scheduler.timeUntilFrame()
+                    if wait <= 0:
+                        break
+                    try:
+                        program, message = inputQueue.get(True, wait)
+                    except queue.Empty:
+                        break
+                    if message == 'quit':
+                        app.log.info('bg received quit message')
+                        return
+                scheduler.render(program, commandCount)
                 # debugging only: program.showWindowHierarchy()
-                cmdCount += len(message)
-                outputQueue.put(program.program.frame.grabFrame() + (cmdCount,))
-                os.kill(pid, signalNumber)
+                cmdCount += commandCount
+                outputFrames.put(*program.program.frame.grabFrame() +
+                                 (cmdCount,))
                 #app.profile.endPythonProfile(profile)
                 time.sleep(0)  # See note in hasMessage().
                 if not inputQueue.empty():
@@ -84,16 +198,15 @@ def background(inputQueue, outputQueue):
                 pass
             block = program.longTimeSlice()
             if block:
-                program.render()
-                outputQueue.put(program.program.frame.grabFrame() + (cmdCount,))
-                os.kill(pid, signalNumber)
+                program.program.renderScheduler.render(program, 0)
+                outputFrames.put(*program.program.frame.grabFrame() +
+                                 (cmdCount,))
         except Exception as e:
             app.log.exception(e)
             app.log.error('bg thread exception', e)
             errorType, value, tracebackInfo = sys.exc_info()
             out = traceback.format_exception(errorType, value, tracebackInfo)
-            outputQueue.put(('exception', out))
-            os.kill(pid, signalNumber)
+            outputFrames.putException(out)
             while True:
                 program, message = inputQueue.get()
                 if message == 'quit':
@@ -103,7 +216,7 @@ def background(inputQueue, outputQueue):
 
 def startupBackground():
     toBackground = queue.Queue()
-    fromBackground = queue.Queue()
+    fromBackground = FrameTransport()
     bg = BackgroundThread(
         target=background, args=(toBackground, fromBackground))
     bg.setName('ci_edit_bg')
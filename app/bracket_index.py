@@ -0,0 +1,186 @@
+# Copyright 2018 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+  An index of the brackets in a document, each paired with its match.
+
+  The brackets are found in the parsed part of the document (following the
+  background parse), skipping those within strings and comments. Each kind of
+  bracket is paired separately, e.g. the ( in '( [ )' matches the ). Looking up
+  the match of a bracket is then a binary search.
+
+  The state of the pairing is saved every so often (a checkpoint), so after an
+  edit the brackets are found again from the checkpoint before the edit rather
+  than from the start of the document.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import array
+import bisect
+
+import app.parser
+import app.regex
+
+# The number of characters searched between checkpoints (and checks for a
+# user event).
+kScanChars = 64 * 1024
+
+# The partner of an unmatched bracket.
+kNoMatch = -1
+
+kOpenBrackets = u'([{'
+kCloseBrackets = u')]}'
+
+
+def isSkippedGrammar(grammar):
+    """Whether brackets within |grammar| are ignored (e.g. a string)."""
+    name = grammar.get(u'name', u'')
+    return u'string' in name or u'comment' in name
+
+
+class BracketIndex:
+    """The brackets of the text parsed by an app.parser.Parser."""
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.parser = None
+        self.data = None
+        # The offset of each bracket and the index of its partner (kNoMatch if
+        # it has none, or, for an open bracket, none has been found yet).
+        self.offsets = array.array(app.parser.kIntType)
+        self.partners = array.array(app.parser.kIntType)
+        # The brackets before |scannedTo| (an offset in |data|) are indexed.
+        self.scannedTo = 0
+        # (offset, bracketCount, openBrackets) where |openBrackets| is a tuple
+        # holding a tuple of the unmatched open bracket indexes for each kind.
+        self.checkpoints = [(0, 0, ((), (), ()))]
+        self.__openBrackets = ([], [], [])
+        self.__skipped = {}
+
+    def __restore(self, offset):
+        """Forget the brackets after the last checkpoint before |offset|."""
+        # The key sorts after any checkpoint at |offset|, since no checkpoint
+        # has more than len(self.offsets) brackets.
+        index = bisect.bisect_right(self.checkpoints,
+                                    (offset, len(self.offsets) + 1)) - 1
+        del self.checkpoints[index + 1:]
+        checkpointOffset, bracketCount, openBrackets = self.checkpoints[index]
+        del self.offsets[bracketCount:]
+        del self.partners[bracketCount:]
+        for kind in openBrackets:
+            for i in kind:
+                self.partners[i] = kNoMatch
+        self.__openBrackets = tuple(list(kind) for kind in openBrackets)
+        self.scannedTo = checkpointOffset
+
+    def update(self, parser, bgThread=None):
+        """Index the brackets that |parser| has parsed since the last call.
+
+        Args:
+          parser (Parser): The parse of the document.
+          bgThread (BackgroundThread): If given, stop early when a user event
+              is waiting (to be resumed by calling update() again).
+
+        Returns:
+          True if the parsed part of the document is indexed.
+        """
+        if parser is not self.parser:
+            self.clear()
+            self.parser = parser
+        data = parser.data
+        if data is not self.data:
+            if self.data is not None:
+                self.__restore(
+                    app.parser.commonPrefixLength(
+                        self.data, data, min(len(self.data), len(data))))
+            self.data = data
+        if parser.fullyParsedToLine < 0:
+            parsedTo = 0
+        elif parser.fullyParsedToLine < len(parser.rows):
+            parsedTo = parser.nodeBegin[parser.rows[parser.fullyParsedToLine]]
+        else:
+            parsedTo = len(data)
+        if self.scannedTo > parsedTo:
+            # The parse started over (e.g. with a new grammar).
+            self.__restore(parsedTo)
+        nodeBegin = parser.nodeBegin
+        nodeGrammar = parser.nodeGrammar
+        skipped = self.__skipped
+        offsets = self.offsets
+        partners = self.partners
+        openBrackets = self.__openBrackets
+        finditer = app.regex.kReBrackets.finditer
+        while self.scannedTo < parsedTo:
+            if bgThread is not None and bgThread.hasUserEvent():
+                return False
+            end = min(self.scannedTo + kScanChars, parsedTo)
+            for found in finditer(data, self.scannedTo, end):
+                offset = found.start()
+                grammarId = nodeGrammar[bisect.bisect_right(nodeBegin, offset) -
+                                        1]
+                isSkipped = skipped.get(grammarId)
+                if isSkipped is None:
+                    isSkipped = isSkippedGrammar(parser.grammars[grammarId])
+                    skipped[grammarId] = isSkipped
+                if isSkipped:
+                    continue
+                ch = data[offset]
+                index = len(offsets)
+                offsets.append(offset)
+                kind = kOpenBrackets.find(ch)
+                if kind != -1:
+                    openBrackets[kind].append(index)
+                    partners.append(kNoMatch)
+                    continue
+                kind = kCloseBrackets.find(ch)
+                if openBrackets[kind]:
+                    partner = openBrackets[kind].pop()
+                    partners[partner] = index
+                    partners.append(partner)
+                else:
+                    partners.append(kNoMatch)
+            self.scannedTo = end
+            self.checkpoints.append((end, len(offsets),
+                                     tuple(tuple(kind)
+                                           for kind in openBrackets)))
+        return True
+
+    def matchingBracket(self, parser, offset):
+        """Find the partner of the bracket at |offset| in the data of
+        |parser|.
+
+        Returns:
+          The offset of the partner, kNoMatch if the bracket has none, or None
+          if it isn't known (the bracket isn't indexed, e.g. it is within a
+          string, or the index isn't up to date).
+        """
+        if (parser is not self.parser or parser.data is not self.data or
+                offset >= self.scannedTo):
+            return None
+        offsets = self.offsets
+        index = bisect.bisect_left(offsets, offset)
+        if index >= len(offsets) or offsets[index] != offset:
+            return None
+        partner = self.partners[index]
+        if partner == kNoMatch:
+            if (self.data[offset] in kOpenBrackets and
+                    self.scannedTo < len(self.data)):
+                # The partner may be in the part not yet indexed.
+                return None
+            return kNoMatch
+        return offsets[partner]
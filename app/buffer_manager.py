@@ -52,6 +52,8 @@ class BufferManager:
         if app.config.strict_debug:
             assert issubclass(self.__class__, BufferManager), self
             assert issubclass(textBuffer.__class__, app.text_buffer.TextBuffer)
+        textBuffer.cancelParallelParse()
+        textBuffer.cancelProjectSearch()
         self.untrackBuffer_(textBuffer)
 
     def getUnsavedBuffer(self):
@@ -31,6 +31,7 @@ import curses
 import locale
 import io
 import os
+import select
 import struct
 import sys
 import time
@@ -52,6 +53,10 @@ import app.window
 
 userConsoleMessage = None
 
+# How long (in seconds) to wait for input or a frame before checking for
+# events that don't wake select(), such as a curses KEY_RESIZE.
+kSelectTimeout = 0.1
+
 
 def userMessage(*args):
     global userConsoleMessage
@@ -73,8 +78,12 @@ class CiProgram:
         self.dictionary = app.spelling.Dictionary()
         self.clipboard = app.clipboard.Clipboard()
         self.frame = app.render.Frame()
+        self.screen = app.render.Screen()
+        self.renderScheduler = app.render.RenderScheduler()
         self.history = app.history.History(
-            self.prefs.userData.get('historyPath'))
+            self.prefs.userData.get('historyPath'),
+            self.prefs.editor.get('checksumAlgorithm'),
+            self.prefs.userData.get('legacyHistoryPath'))
         self.bufferManager = app.buffer_manager.BufferManager(self, self.prefs)
         self.cursesScreen = None
         self.debugMouseEvent = (0, 0, 0, 0, 0)
@@ -132,35 +141,35 @@ class CiProgram:
         # Cache the thread setting.
         useBgThread = self.prefs.editor['useBgThread']
         cmdCount = 0
-        # Track the time needed to handle commands and render the UI.
-        # (A performance measurement).
+        # Track the time from reading input to painting the frame that
+        # handled it (see refresh()). (A performance measurement).
         self.mainLoopTime = 0
         self.mainLoopTimePeak = 0
+        self.inputStart = time.time()
+        self.inputCount = 0
         cursesWindow = app.window.mainCursesWindow
         if self.prefs.startup['timeStartup']:
             # When running a timing of the application startup, push a CTRL_Q
             # onto the curses event messages to simulate a full startup with a
             # GUI render.
             curses.ungetch(17)
-        start = time.time()
         # The first render, to get something on the screen.
         if useBgThread:
             self.bg.put((self.programWindow, []))
         else:
-            self.programWindow.render()
+            self.renderScheduler.render(self.programWindow, 0)
         # This is the 'main loop'. Execution doesn't leave this loop until the
         # application is closing down.
+        # Wait on the terminal input and the frames from the background thread
+        # (not done with the fake curses used in testing).
+        waitFds = None
+        if useBgThread and not hasattr(cursesWindow,
+                                       'test_rendered_command_count'):
+            waitFds = [sys.stdin.fileno(), self.bg.fromBackground.wakeFd]
         while not self.exiting:
             if useBgThread:
-                while self.bg.hasMessage():
-                    frame = self.bg.get()
-                    if frame[0] == 'exception':
-                        for line in frame[1]:
-                            userMessage(line[:-1])
-                        self.quitNow()
-                        return
-                    drawList, cursor, cmdCount = frame
-                    self.refresh(drawList, cursor, cmdCount)
+                if not self.refreshFromBackground():
+                    return
             elif 1:
                 drawList, cursor = self.frame.grabFrame()
                 self.refresh(drawList, cursor, cmdCount)
@@ -174,14 +183,20 @@ class CiProgram:
                     profile, stream=output).sort_stats('cumulative')
                 stats.print_stats()
                 app.log.info(output.getvalue())
-            self.mainLoopTime = time.time() - start
-            if self.mainLoopTime > self.mainLoopTimePeak:
-                self.mainLoopTimePeak = self.mainLoopTime
-            # Gather several commands into a batch before doing a redraw.
-            # (A performance optimization).
+            # Gather all of the waiting input into a batch before doing a
+            # redraw. (A performance optimization).
             cmdList = []
             while not len(cmdList):
-                for _ in range(5):
+                if waitFds is not None:
+                    try:
+                        select.select(waitFds, [], [], kSelectTimeout)
+                    except select.error:
+                        # Interrupted by a signal.
+                        pass
+                    if not self.refreshFromBackground():
+                        return
+                batchStart = time.time()
+                while True:
                     eventInfo = None
                     if self.exiting:
                         return
@@ -246,20 +261,14 @@ class CiProgram:
                         assert u is not None
                         eventInfo = u
                         ch = app.curses_util.UNICODE_INPUT
-                    if ch == 0 and useBgThread:
-                        # bg response.
-                        frame = None
-                        while self.bg.hasMessage():
-                            frame = self.bg.get()
-                            if frame[0] == 'exception':
-                                for line in frame[1]:
-                                    userMessage(line[:-1])
-                                self.quitNow()
+                    if ch == curses.ERR:
+                        if useBgThread:
+                            # Paint a frame that arrived while reading input
+                            # (the fake curses used in testing doesn't wait
+                            # on the frames with select()).
+                            if not self.refreshFromBackground():
                                 return
-                        if frame is not None:
-                            drawList, cursor, cmdCount = frame
-                            self.refresh(drawList, cursor, cmdCount)
-                    elif ch != curses.ERR:
+                    else:
                         self.ch = ch
                         if ch == curses.KEY_MOUSE:
                             # On Ubuntu, Gnome terminal, curses.getmouse() may
@@ -270,15 +279,21 @@ class CiProgram:
                             self.debugMouseEvent = curses.getmouse()
                             eventInfo = (self.debugMouseEvent, time.time())
                         cmdList.append((ch, eventInfo))
-            start = time.time()
-            if len(cmdList):
-                if useBgThread:
-                    self.bg.put((self.programWindow, cmdList))
-                else:
-                    self.programWindow.executeCommandList(cmdList)
-                    self.programWindow.shortTimeSlice()
-                    self.programWindow.render()
-                    cmdCount += len(cmdList)
+                    if ch == curses.ERR or (time.time() - batchStart >
+                                            app.render.kFrameTime):
+                        # Out of input, or the input is arriving as fast as it
+                        # is read (don't hold up the next frame).
+                        break
+            if self.inputStart is None:
+                self.inputStart = time.time()
+            self.inputCount += len(cmdList)
+            if useBgThread:
+                self.bg.put((self.programWindow, cmdList))
+            else:
+                self.programWindow.executeCommandList(cmdList)
+                self.programWindow.shortTimeSlice()
+                self.renderScheduler.render(self.programWindow, len(cmdList))
+                cmdCount += len(cmdList)
 
     def startup(self):
         """A second init-like function. Called after command line arguments are
@@ -376,13 +391,40 @@ class CiProgram:
         app.log.info()
         self.exiting = True
 
+    def refreshFromBackground(self):
+        """Paint the latest frame from the background thread, if there is a new
+        one.
+
+        Returns:
+          False if the background thread raised an exception (the program is
+          then closing).
+        """
+        frame = self.bg.get()
+        if frame is None:
+            return True
+        if frame[0] == 'exception':
+            for line in frame[1]:
+                userMessage(line[:-1])
+            self.quitNow()
+            return False
+        drawList, cursor, cmdCount = frame
+        self.refresh(drawList, cursor, cmdCount)
+        return True
+
     def refresh(self, drawList, cursor, cmdCount):
         """Paint the drawList to the screen in the main thread."""
         cursesWindow = app.window.mainCursesWindow
         # Ask curses to hold the back buffer until curses refresh().
         cursesWindow.noutrefresh()
         curses.curs_set(0)  # Hide cursor.
-        for i in drawList:
+        # Only the cells that differ from the prior frame are written.
+        rows, cols = cursesWindow.getmaxyx()
+        if self.bg is not None and self.screen.rows and (
+                rows, cols) != (self.screen.rows, self.screen.cols):
+            # The screen is painted from scratch, ask for all of the rows.
+            self.bg.fromBackground.resend()
+            self.bg.put((self.programWindow, []))
+        for i in self.screen.changes(drawList, rows, cols):
             try:
                 cursesWindow.addstr(*i)
             except curses.error:
@@ -398,6 +440,12 @@ class CiProgram:
                 cursesWindow.leaveok(1)  # Don't update cursor position.
             except curses.error:
                 pass
+        if self.inputStart is not None and cmdCount >= self.inputCount:
+            # All of the input read so far is on the screen.
+            self.mainLoopTime = time.time() - self.inputStart
+            if self.mainLoopTime > self.mainLoopTimePeak:
+                self.mainLoopTimePeak = self.mainLoopTime
+            self.inputStart = None
         # This is a workaround to allow background processing (and parser screen
         # redraw) to interact well with the test harness. The intent is to tell
         # the test that the screen includes all commands executed up to N.
@@ -442,6 +490,7 @@ class CiProgram:
         if self.prefs.editor['useBgThread']:
             self.bg.put((self.programWindow, 'quit'))
             self.bg.join()
+        self.history.waitForSaves()
 
     def setUpPalette(self):
 
@@ -25,6 +25,7 @@ import curses
 
 import app.curses_util
 import app.log
+import app.regex
 import app.window
 
 
@@ -68,6 +69,21 @@ class DebugWindow(app.window.ActiveWindow):
             u"scr rows %d cols %d mlt %f/%f pt %f" %
             (screenRows, screenCols, program.mainLoopTime,
              program.mainLoopTimePeak, textBuffer.parserTime), color)
+        scheduler = program.renderScheduler
+        self.writeLine(
+            u"frames %d cmds %d render %f/%f" %
+            (scheduler.frameCount, scheduler.frameCommands,
+             scheduler.renderTime, scheduler.renderTimePeak), color)
+        self.writeLine(
+            u"regex cache hits %d misses %d size %d" %
+            app.regex.cacheStats(), color)
+        self.writeLine(
+            u"cells written %d of %d" %
+            (program.screen.cellsWritten, program.screen.cellsDrawn), color)
+        self.writeLine(
+            u"row cache hits %d misses %d size %d" %
+            (textBuffer.rowCache.hits, textBuffer.rowCache.misses,
+             len(textBuffer.rowCache)), color)
         self.writeLine(
             u"ch %3s %s" % (program.ch, app.curses_util.cursesKeyName(program.ch)
                            or u'UNKNOWN'), color)
@@ -272,6 +272,9 @@ prefs = {
     'editor': {
         'autoInsertClosingCharacter': False,
         'captiveCursor': False,
+        # A hashlib algorithm used to recognize files in the history, e.g.
+        # 'blake2b' is faster (but prior history won't be recognized).
+        'checksumAlgorithm': 'sha512',
         'colorScheme': 'default',
         'filesShowDotFiles': True,
         'filesShowSizes': True,
@@ -280,6 +283,9 @@ prefs = {
         'filesSortAscendingBySize': None,
         'filesSortAscendingByModifiedDate': None,
         'findDotAll': False,
+        # Keep an index of the files (in the userData indexPath) to speed up
+        # findInFiles.
+        'findInFilesIndex': False,
         'findIgnoreCase': True,
         'findLocale': False,
         'findMultiLine': False,
@@ -288,6 +294,9 @@ prefs = {
         'findVerbose': False,
         'findWholeWord': False,
         'indentation': '  ',
+        # Files of at least this many bytes are read lazily (see
+        # app/mapped_file.py). Zero to disable.
+        'largeFileSize': 64 * 1024 * 1024,
         'lineLimitIndicator': 80,
         'naturalScrollDirection': True,
         'onSaveStripTrailingSpaces': True,
@@ -298,6 +307,8 @@ prefs = {
         'palette8': 'default8',
         'palette16': 'default16',
         'palette256': 'default256',
+        # Parse large files in several processes (see app/parallel_parser.py).
+        'parallelParse': False,
         'predictionShowOpenFiles': True,
         'predictionShowAlternateFiles': True,
         'predictionShowRecentFiles': True,
@@ -305,6 +316,9 @@ prefs = {
         'predictionSortAscendingByName': None,
         'predictionSortAscendingByStatus': None,
         'saveUndo': True,
+        # The most bytes of (compressed) undo history kept for each file. The
+        # oldest changes are dropped beyond this. None for no limit.
+        'saveUndoLimit': 1024 * 1024,
         'showLineNumbers': True,
         'showStatusLine': True,
         'showTopInfo': True,
@@ -1093,6 +1107,12 @@ prefs = {
         'homePath':
         os.path.expanduser('~/.ci_edit'),
         'historyPath':
+        os.path.join(os.path.expanduser('~/.ci_edit'), 'history.db'),
+        # Where findInFiles keeps indexes (see findInFilesIndex).
+        'indexPath':
+        os.path.join(os.path.expanduser('~/.ci_edit'), 'index'),
+        # The history file of prior versions, imported into historyPath.
+        'legacyHistoryPath':
         os.path.join(os.path.expanduser('~/.ci_edit'), 'history.dat'),
     },
 }
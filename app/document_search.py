@@ -0,0 +1,106 @@
+# Copyright 2018 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+  Search the text of a whole document, so that a match may span lines (e.g.
+  with the findMultiLine or findDotAll prefs).
+
+  The text and the offset of each row within it come from the LineStore, which
+  caches the text of each block of lines (see LineStore.text()). Searching
+  backward scans windows of the text going back from the pen, rather than all
+  of the text before it.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import app.line_store
+
+# The text before the pen is searched backward this many characters at a time
+# (the window doubles in size each time nothing is found). A match found
+# within a window is also limited to end within this many characters after the
+# pen, before it's matched again in full.
+kSearchWindow = 64 * 1024
+
+
+class DocumentSearch:
+    """The text of a LineStore, for searching."""
+
+    def __init__(self):
+        self.lines = None
+        self.text = u''
+
+    def update(self, lines):
+        """Get the text of |lines| (which is only joined again where the
+        lines changed)."""
+        self.lines = lines
+        self.text = lines.text(app.line_store.joinNewLines)
+
+    def offset(self, row, col):
+        """The offset within |text| of |row|, |col|."""
+        return min(self.lines.textOffset(row) + col, len(self.text))
+
+    def rowCol(self, offset):
+        """The (row, col) of |offset| within |text|."""
+        return self.lines.textRowCol(offset)
+
+    def search(self, regex, row, col, direction):
+        """Find the next match of |regex| at or after |row|, |col| (or, if
+        |direction| is negative, the last match that begins before it),
+        wrapping around the end of the document.
+
+        Returns:
+          ((row, col), (endRow, endCol), wrapped) or None if there is no match.
+        """
+        text = self.text
+        offset = self.offset(row, col)
+        wrapped = False
+        if direction >= 0:
+            found = regex.search(text, offset)
+            if found is None:
+                wrapped = True
+                found = regex.search(text)
+        else:
+            found = self.__searchBackward(regex, offset)
+            if found is None:
+                wrapped = True
+                found = self.__searchBackward(regex, len(text) + 1)
+        if found is None:
+            return None
+        return (self.rowCol(found.start()), self.rowCol(found.end()), wrapped)
+
+    def __searchBackward(self, regex, end):
+        """Find the last match of |regex| that begins before |end|.
+
+        Returns:
+          A match object, or None.
+        """
+        text = self.text
+        limit = min(len(text), end + kSearchWindow)
+        size = kSearchWindow
+        begin = end
+        while begin > 0:
+            begin = max(0, end - size)
+            size *= 2
+            starts = []
+            for found in regex.finditer(text, begin, limit):
+                if found.start() >= end:
+                    break
+                starts.append(found.start())
+            # The match may have been cut short by |limit|.
+            for start in reversed(starts):
+                found = regex.match(text, start)
+                if found is not None:
+                    return found
+        return None
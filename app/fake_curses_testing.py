@@ -54,6 +54,9 @@ class FakeCursesTestCase(unittest.TestCase):
         self.cursesScreen = curses.StandardScreen()
         self.prg = app.ci_program.CiProgram()
         self.prg.setUpCurses(self.cursesScreen)
+        # The fake input waits for each frame, so there is no input to gather
+        # by holding off on a render.
+        self.prg.renderScheduler.frameTime = 0
 
     def addClickInfo(self, timeStamp, screenText, bState):
         caller = inspect.stack()[1]
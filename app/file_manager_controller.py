@@ -28,6 +28,7 @@ import time
 import app.buffer_file
 import app.config
 import app.controller
+import app.regex
 import app.string
 
 
@@ -60,8 +61,8 @@ class DirectoryListController(app.controller.Controller):
         fileName = ''
         if len(pathInput) > 0 and pathInput[-1] != os.sep:
             dirPath, fileName = os.path.split(fullPath)
-            self.view.textBuffer.findRe = re.compile('()^' +
-                                                     re.escape(fileName))
+            self.view.textBuffer.findRe = app.regex.cachedCompile(
+                u'()^' + re.escape(fileName))
         else:
             self.view.textBuffer.findRe = None
         appPrefs = self.view.program.prefs
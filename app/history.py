@@ -14,6 +14,12 @@
 """
   Track user history to provide features such as resuming editing at the same
   cursor position after reloading a file; or a recent file list.
+
+  The history is kept in an sqlite database with one record per file, keyed by
+  the file's (checksum, size). Saving a file writes only that file's record and
+  a record is only read when its file is opened. Records that haven't been used
+  in a long while (or beyond the kMaxHistoryEntries most recently used) are
+  removed.
 """
 
 # For Python 2to3 support.
@@ -29,36 +35,93 @@ try:
     import cPickle as pickle
 except ImportError:
     import pickle
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+try:
+    import sqlite3
+except ImportError:
+    sqlite3 = None
 import hashlib
 import os
+import threading
 import time
 
 import app.log
 
+# Files are hashed this many bytes at a time.
+kChecksumChunkSize = 1024 * 1024
+
+# Any hashlib algorithm may be used for checksums (see the checksumAlgorithm
+# editor pref). E.g. 'blake2b' is faster than 'sha512' on 64-bit machines.
+# Changing the algorithm leaves prior history unused.
+kDefaultChecksumAlgorithm = 'sha512'
+
+# Only this many of the most recently used file records are kept.
+kMaxHistoryEntries = 5000
+
+# Records of files that haven't been opened or saved for this many seconds are
+# removed.
+kMaxHistoryAge = 365 * 24 * 60 * 60
+
+# Checksums of files, keyed by (path, algorithm). Each value is (statKey,
+# checksum), where statKey identifies the version of the file that the checksum
+# is for. See calculateChecksum().
+_checksumCache = {}
+_checksumCacheLock = threading.Lock()
 
-def calculateChecksum(filePath, data=None):
+
+def _statKey(filePath):
+    stat = os.stat(filePath)
+    return (stat.st_size, getattr(stat, 'st_mtime_ns', stat.st_mtime),
+            stat.st_ino)
+
+
+def calculateChecksum(filePath, data=None,
+                      algorithm=kDefaultChecksumAlgorithm):
     """
     Calculates the hash value of the specified file.
     The second argument can be passed in if a file's data has
     already been read so that you do not have to read the file again.
 
+    The checksum of a file is cached until the file's size, modification time,
+    or inode changes.
+
     Args:
       filePath (str): The absolute path to the file.
       data (str): Defaults to None. This is the data
         returned by calling read() on a file object.
+      algorithm (str): The name of a hashlib algorithm.
 
     Returns:
       The hash value of the file's data.
     """
     app.log.info("Calculate checksum of the current file")
-    hasher = hashlib.sha512()
+    hasher = hashlib.new(algorithm)
     try:
         if data is not None:
-            hasher.update(data.encode(u"utf-8"))
-        else:
-            with open(filePath, 'rb') as dataFile:
-                hasher.update(dataFile.read())
-        return hasher.hexdigest()
+            # Encode a piece at a time, rather than copying the whole document.
+            for i in range(0, len(data), kChecksumChunkSize):
+                hasher.update(data[i:i + kChecksumChunkSize].encode(u"utf-8"))
+            return hasher.hexdigest()
+        statKey = _statKey(filePath)
+        cacheKey = (filePath, algorithm)
+        with _checksumCacheLock:
+            cached = _checksumCache.get(cacheKey)
+        if cached is not None and cached[0] == statKey:
+            return cached[1]
+        with open(filePath, 'rb') as dataFile:
+            # Read in pieces, the file may be very large.
+            while True:
+                chunk = dataFile.read(kChecksumChunkSize)
+                if not chunk:
+                    break
+                hasher.update(chunk)
+        checksum = hasher.hexdigest()
+        with _checksumCacheLock:
+            _checksumCache[cacheKey] = (statKey, checksum)
+        return checksum
     except FileNotFoundError as e:
         pass
     except Exception as e:
@@ -85,7 +148,7 @@ def calculateFileSize(filePath):
     return 0
 
 
-def getFileInfo(filePath, data=None):
+def getFileInfo(filePath, data=None, algorithm=kDefaultChecksumAlgorithm):
     """
     Returns the hash value and size of the specified file.
     The second argument can be passed in if a file's data has
@@ -95,58 +158,213 @@ def getFileInfo(filePath, data=None):
       filePath (str): The absolute path to the file.
       data (str): Defaults to None. This is the data
         returned by calling read() on a file object.
+      algorithm (str): The name of a hashlib algorithm.
 
     Returns:
       A tuple containing the checksum and size of the file.
     """
-    checksum = calculateChecksum(filePath, data)
+    checksum = calculateChecksum(filePath, data, algorithm)
     fileSize = calculateFileSize(filePath)
     return (checksum, fileSize)
 
 
 class History():
 
-    def __init__(self, pathToHistory):
-        self.userHistory = {}
+    def __init__(self, pathToHistory, checksumAlgorithm=None,
+                 pathToLegacyHistory=None):
+        """
+        Args:
+          pathToHistory (str): The history database, or None to not keep a
+              history.
+          checksumAlgorithm (str): The name of a hashlib algorithm.
+          pathToLegacyHistory (str): A pickled history (from prior versions)
+              that is imported when the database is created.
+        """
         self.pathToHistory = pathToHistory
+        self.pathToLegacyHistory = pathToLegacyHistory
+        self.checksumAlgorithm = (checksumAlgorithm or
+                                  kDefaultChecksumAlgorithm)
+        # The most recent (checksum, fileSize) saved for each path.
+        self.fileInfos = {}
+        # The database connection, which is shared with the worker thread.
+        self.__db = None
+        self.__dbLock = threading.Lock()
+        # saveUserHistory() requests, handled by a worker thread.
+        self.__saves = queue.Queue()
+        self.__worker = None
+        # The number of queued (or running) saves of each path, see
+        # waitForSave().
+        self.__pending = {}
+        self.__pendingChanged = threading.Condition()
+        # (onSaved, newFileInfo) of the finished saves, see runSavedCallbacks().
+        self.__saved = queue.Queue()
+
+    def getFileInfo(self, filePath, data=None):
+        """See getFileInfo() (the module function)."""
+        return getFileInfo(filePath, data, self.checksumAlgorithm)
 
     def loadUserHistory(self):
         """
-        Retrieves the user's complete edit history for all files.
+        Opens the user's history database (creating it if needed). The history
+        of a file is read when the file is opened, see getFileHistory().
+
+        Until this is called, no history is read or written.
 
         Returns:
           None.
         """
-        if os.path.isfile(self.pathToHistory):
-            with open(self.pathToHistory, 'rb') as historyFile:
-                try:
-                    self.userHistory = pickle.load(historyFile)
-                except ValueError as e:
-                    app.log.info(unicode(e))
+        if sqlite3 is None or self.pathToHistory is None:
+            app.log.info(u'user history not kept')
+            return
+        isNew = not os.path.isfile(self.pathToHistory)
+        try:
+            db = sqlite3.connect(self.pathToHistory, check_same_thread=False)
+            db.execute(u"""CREATE TABLE IF NOT EXISTS history (
+                checksum TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                path TEXT,
+                adate REAL NOT NULL,
+                data BLOB NOT NULL,
+                PRIMARY KEY (checksum, size))""")
+            db.execute(u"""CREATE INDEX IF NOT EXISTS history_adate
+                ON history (adate)""")
+            db.commit()
+        except sqlite3.Error as e:
+            app.log.error(u'loadUserHistory', self.pathToHistory, e)
+            return
+        with self.__dbLock:
+            self.__db = db
+        if isNew:
+            self.__importLegacyHistory()
+
+    def __importLegacyHistory(self):
+        """Copy the records of a pickled history file into the database."""
+        path = self.pathToLegacyHistory
+        if path is None or not os.path.isfile(path):
+            return
+        try:
+            with open(path, 'rb') as historyFile:
+                userHistory = pickle.load(historyFile)
+        except Exception as e:
+            app.log.info(u'legacy history not imported', e)
+            return
+        now = time.time()
+        with self.__dbLock:
+            for (checksum, fileSize), fileHistory in userHistory.items():
+                if checksum is None:
+                    continue
+                self.__db.execute(
+                    u"""INSERT OR REPLACE INTO history
+                    (checksum, size, path, adate, data)
+                    VALUES (?, ?, ?, ?, ?)""",
+                    (checksum, fileSize, fileHistory.get(u'path'),
+                     fileHistory.get(u'adate', now),
+                     sqlite3.Binary(pickle.dumps(fileHistory))))
+            self.__evict()
+            self.__db.commit()
+        app.log.info(u'imported', len(userHistory), u'history records')
 
-    def saveUserHistory(self, fileInfo, fileHistory):
+    def saveUserHistory(self, fileInfo, fileHistory, onSaved=None):
         """
-        Saves the user's file history by writing to a pickle file.
+        Saves the user's history of a file, replacing the file's prior record.
+
+        The file's checksum is calculated (and the record written) on a worker
+        thread, so that saving a large file isn't held up by reading it back.
 
         Args:
           fileInfo (tuple): Contains (filePath, lastChecksum, lastFileSize).
           fileHistory (dict): The history of the file that the user wants to
                               save.
+          onSaved (function): Called with the new (checksum, fileSize) of the
+                              file, by runSavedCallbacks().
 
         Returns:
           None.
         """
+        # Pickle now, the caller may change |fileHistory| after this returns.
+        data = pickle.dumps(fileHistory)
+        filePath = fileInfo[0]
+        with self.__pendingChanged:
+            self.__pending[filePath] = self.__pending.get(filePath, 0) + 1
+        self.__saves.put((fileInfo, fileHistory.get(u'path'), data, onSaved))
+        if self.__worker is None:
+            self.__worker = threading.Thread(
+                target=self.__saveWorker, name='history')
+            self.__worker.daemon = True
+            self.__worker.start()
+
+    def waitForSaves(self):
+        """Block until all saveUserHistory() requests are done."""
+        if self.__worker is not None:
+            self.__saves.join()
+
+    def waitForSave(self, filePath):
+        """Block until the saveUserHistory() requests for |filePath| are
+        done (not waiting on those of other files)."""
+        with self.__pendingChanged:
+            while self.__pending.get(filePath):
+                self.__pendingChanged.wait()
+
+    def runSavedCallbacks(self):
+        """Call the onSaved functions of the saves that finished (on the
+        calling thread, which should be the one that owns the buffers)."""
+        while True:
+            try:
+                onSaved, newFileInfo = self.__saved.get_nowait()
+            except queue.Empty:
+                return
+            onSaved(newFileInfo)
+
+    def __saveWorker(self):
+        while True:
+            fileInfo, path, data, onSaved = self.__saves.get()
+            try:
+                self.__save(fileInfo, path, data, onSaved)
+            except Exception as e:
+                app.log.exception(e)
+            finally:
+                filePath = fileInfo[0]
+                with self.__pendingChanged:
+                    self.__pending[filePath] -= 1
+                    if not self.__pending[filePath]:
+                        del self.__pending[filePath]
+                    self.__pendingChanged.notify_all()
+                self.__saves.task_done()
+
+    def __save(self, fileInfo, path, data, onSaved):
         filePath, lastChecksum, lastFileSize = fileInfo
-        try:
-            if self.pathToHistory is not None:
-                self.userHistory.pop((lastChecksum, lastFileSize), None)
-                newChecksum, newFileSize = getFileInfo(filePath)
-                self.userHistory[(newChecksum, newFileSize)] = fileHistory
-                with open(self.pathToHistory, 'wb') as historyFile:
-                    pickle.dump(self.userHistory, historyFile)
-                app.log.info('wrote pickle')
-        except Exception as e:
-            app.log.exception(e)
+        newFileInfo = self.getFileInfo(filePath)
+        if onSaved is not None:
+            self.__saved.put((onSaved, newFileInfo))
+        with self.__dbLock:
+            if self.__db is None or newFileInfo[0] is None:
+                return
+            # In case an earlier save of this file finished after |fileInfo|
+            # was read.
+            for oldInfo in ((lastChecksum, lastFileSize),
+                            self.fileInfos.get(filePath)):
+                if oldInfo is not None and oldInfo != newFileInfo:
+                    self.__db.execute(
+                        u"DELETE FROM history WHERE checksum = ? AND size = ?",
+                        oldInfo)
+            self.fileInfos[filePath] = newFileInfo
+            self.__db.execute(
+                u"""INSERT OR REPLACE INTO history
+                (checksum, size, path, adate, data) VALUES (?, ?, ?, ?, ?)""",
+                (newFileInfo[0], newFileInfo[1], path, time.time(),
+                 sqlite3.Binary(data)))
+            self.__evict()
+            self.__db.commit()
+        app.log.info(u'wrote history record', len(data), u'bytes')
+
+    def __evict(self):
+        """Remove old records. The caller holds self.__dbLock."""
+        self.__db.execute(u"DELETE FROM history WHERE adate < ?",
+                          (time.time() - kMaxHistoryAge,))
+        self.__db.execute(
+            u"""DELETE FROM history WHERE rowid IN (
+            SELECT rowid FROM history ORDER BY adate DESC LIMIT -1 OFFSET ?)""",
+            (kMaxHistoryEntries,))
 
     def getFileHistory(self, filePath, data=None):
         """
@@ -165,22 +383,45 @@ class History():
         Returns:
           The file history (dict) of the desired file if it exists.
         """
-        checksum, fileSize = getFileInfo(filePath, data)
-        fileHistory = self.userHistory.get((checksum, fileSize), {})
-        fileHistory['adate'] = time.time()
+        # A save of this file may be in progress.
+        self.waitForSave(filePath)
+        now = time.time()
+        fileHistory = {}
+        if self.__db is not None:
+            checksum, fileSize = self.getFileInfo(filePath, data)
+            with self.__dbLock:
+                row = self.__db.execute(
+                    u"""SELECT data FROM history
+                    WHERE checksum = ? AND size = ?""",
+                    (checksum, fileSize)).fetchone()
+                if row is not None:
+                    # Mark the record as recently used.
+                    self.__db.execute(
+                        u"""UPDATE history SET adate = ?
+                        WHERE checksum = ? AND size = ?""",
+                        (now, checksum, fileSize))
+                    self.__db.commit()
+            if row is not None:
+                try:
+                    fileHistory = pickle.loads(bytes(row[0]))
+                except Exception as e:
+                    app.log.info(u'unreadable history record', e)
+        fileHistory['adate'] = now
         return fileHistory
 
     def getRecentFiles(self):
         """
         Returns:
-          A list of file paths to recently accessed files.
+          A list of file paths to recently accessed files, the most recent
+          first.
         """
-        files = []
-        for entry in self.userHistory.values():
-            path = entry.get('path')
-            if path is not None:
-                files.append(path)
-        return files
+        if self.__db is None:
+            return []
+        with self.__dbLock:
+            rows = self.__db.execute(
+                u"""SELECT path FROM history WHERE path IS NOT NULL
+                GROUP BY path ORDER BY MAX(adate) DESC""").fetchall()
+        return [row[0] for row in rows]
 
     def clearUserHistory(self):
         """
@@ -192,9 +433,16 @@ class History():
         Returns:
           None.
         """
-        self.userHistory = {}
-        try:
-            os.remove(self.pathToHistory)
-            app.log.info("user history cleared")
-        except Exception as e:
-            app.log.error('clearUserHistory exception', e)
+        self.waitForSaves()
+        with self.__dbLock:
+            if self.__db is not None:
+                self.__db.close()
+                self.__db = None
+        for path in (self.pathToHistory, self.pathToLegacyHistory):
+            if path is None or not os.path.isfile(path):
+                continue
+            try:
+                os.remove(path)
+                app.log.info("user history cleared")
+            except Exception as e:
+                app.log.error('clearUserHistory exception', e)
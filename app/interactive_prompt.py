@@ -106,6 +106,7 @@ class InteractivePrompt(app.controller.Controller):
             u'build': self.buildCommand,
             u'cua': self.changeToCuaMode,
             u'emacs': self.changeToEmacsMode,
+            u'findInFiles': self.findInFilesCommand,
             u'make': self.makeCommand,
             #u'split': self.splitCommand,  # Experimental wip.
             u'vim': self.changeToVimNormalMode,
@@ -147,6 +148,23 @@ class InteractivePrompt(app.controller.Controller):
     def changeToVimNormalMode(self, cmdLine, view):
         return {}, u'Vim normal mode'
 
+    def findInFilesCommand(self, cmdLine, view):
+        args = cmdLine.split(None, 1)
+        if len(args) < 2:
+            return {}, u'tip: findInFiles foo to find foo in the files here.'
+        tb = view.textBuffer
+        if tb.projectSearch is None:
+            # Show the results in a new buffer (or reuse a prior results
+            # buffer, which cancels that search).
+            bufferManager = self.view.program.bufferManager
+            for other in bufferManager.buffers:
+                # Only one search runs at a time.
+                other.cancelProjectSearch()
+            tb = bufferManager.newTextBuffer()
+            view.setTextBuffer(tb)
+        tb.findInFiles(args[1], os.getcwd())
+        return {}, u'Finding %s in files' % (args[1],)
+
     def focus(self):
         app.log.info(u'InteractivePrompt.focus')
         self.textBuffer.selectionAll()
@@ -0,0 +1,403 @@
+# Copyright 2018 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+  Storage for the lines of a document.
+
+  A LineStore behaves like a list of line strings (the row/col API used
+  throughout the editor), but keeps the lines in a sequence of small blocks
+  with an index of where each block begins. Finding a row is a binary search
+  over the block index and inserting or removing lines only shifts the lines
+  within one block, rather than every line following the edit.
+
+  The text of each block is cached (see text()), so producing the document as
+  a single string after an edit only re-encodes the blocks that changed. The
+  offset of a row within that string (and back) is found from the block texts,
+  see textOffset().
+
+  The blocks need not be lists, see assignBlocks() and app/mapped_file.py.
+
+  Recent edits are logged (see editsSince()), so that data kept for each row
+  elsewhere (e.g. app.match_index) may be updated for just the rows that
+  changed.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import bisect
+import collections
+import itertools
+
+# Blocks are split when they grow past twice this size and adjacent blocks are
+# merged when they would fit within this size.
+kBlockSize = 512
+
+# The number of edits kept for editsSince().
+kMaxEdits = 1000
+
+
+def joinNewLines(lines):
+    """Join |lines| with new lines. See LineStore.text() and textOffset()."""
+    return u"\n".join(lines)
+
+
+class LineStore(object):
+    """A list-like sequence of lines, stored in blocks."""
+
+    def __init__(self, lines=(), blockSize=kBlockSize):
+        self.__blockSize = blockSize
+        self.__blocks = []
+        # The joined text of each block, as {joinLines: text} (or None if the
+        # block changed since the text was last requested). Kept parallel to
+        # __blocks.
+        self.__texts = []
+        # The whole document text for each joinLines, as [version, text,
+        # blockTexts, blockOffsets], valid while |version| == __version.
+        # |blockOffsets| (the offset of each block within |text|) is made as
+        # needed.
+        self.__joined = {}
+        self.__version = 0
+        # (version, begin, end, count) for each recent edit, where |version| is
+        # the version after the edit. See editsSince().
+        self.__edits = collections.deque(maxlen=kMaxEdits)
+        # The row at which each block begins. Rebuilt lazily, after the number
+        # of rows in some block has changed.
+        self.__starts = None
+        self.__length = 0
+        self.__assign(lines)
+
+    def __assign(self, lines):
+        lines = list(lines)
+        size = self.__blockSize
+        self.__blocks = [
+            lines[i:i + size] for i in range(0, len(lines), size)
+        ]
+        self.__texts = [None] * len(self.__blocks)
+        self.__length = len(lines)
+        self.__starts = None
+        self.__version += 1
+        self.__edits.clear()
+
+    def assignBlocks(self, blocks):
+        """Replace the lines with |blocks|, each a list-like sequence of lines
+        (e.g. app.mapped_file.LazyBlock). The blocks may be larger than the
+        block size; they are split up when edited."""
+        self.__blocks = list(blocks)
+        self.__texts = [None] * len(self.__blocks)
+        self.__length = sum(len(block) for block in self.__blocks)
+        self.__starts = None
+        self.__version += 1
+        self.__edits.clear()
+
+    def __blockStarts(self):
+        if self.__starts is None:
+            starts = [0]
+            for block in self.__blocks:
+                starts.append(starts[-1] + len(block))
+            self.__starts = starts
+        return self.__starts
+
+    def __locate(self, row):
+        """Find the block holding |row|.
+
+        Returns:
+          (blockIndex, indexWithinBlock).
+        """
+        starts = self.__blockStarts()
+        blockIndex = bisect.bisect_right(starts, row, 0, len(self.__blocks)) - 1
+        return blockIndex, row - starts[blockIndex]
+
+    def __normalizeRow(self, row):
+        if row < 0:
+            row += self.__length
+        if not 0 <= row < self.__length:
+            raise IndexError('line index out of range')
+        return row
+
+    def __normalizeSlice(self, index):
+        begin, end, step = index.indices(self.__length)
+        if step != 1:
+            raise ValueError('LineStore slices must have a step of 1')
+        return begin, max(begin, end)
+
+    def __split(self, row):
+        """Ensure a block boundary at |row|.
+
+        Returns:
+          The index of the block that begins at |row|.
+        """
+        if row >= self.__length:
+            return len(self.__blocks)
+        blockIndex, offset = self.__locate(row)
+        if offset:
+            block = self.__blocks[blockIndex]
+            self.__blocks[blockIndex:blockIndex + 1] = [
+                block[:offset], block[offset:]
+            ]
+            self.__texts[blockIndex:blockIndex + 1] = [None, None]
+            self.__starts = None
+            blockIndex += 1
+        return blockIndex
+
+    def __rebalance(self, blockIndex):
+        """Split an oversized block or merge undersized blocks near
+        |blockIndex|."""
+        blocks = self.__blocks
+        texts = self.__texts
+        size = self.__blockSize
+        if not 0 <= blockIndex < len(blocks):
+            return
+        block = blocks[blockIndex]
+        if len(block) > size * 2:
+            pieces = [block[i:i + size] for i in range(0, len(block), size)]
+            blocks[blockIndex:blockIndex + 1] = pieces
+            texts[blockIndex:blockIndex + 1] = [None] * len(pieces)
+            self.__starts = None
+        elif not block:
+            del blocks[blockIndex]
+            del texts[blockIndex]
+            self.__starts = None
+        elif (blockIndex + 1 < len(blocks) and
+              len(block) + len(blocks[blockIndex + 1]) <= size):
+            block.extend(blocks[blockIndex + 1])
+            del blocks[blockIndex + 1]
+            del texts[blockIndex + 1]
+            texts[blockIndex] = None
+            self.__starts = None
+
+    def __len__(self):
+        return self.__length
+
+    def __iter__(self):
+        return itertools.chain.from_iterable(self.__blocks)
+
+    def __reversed__(self):
+        for block in reversed(self.__blocks):
+            for line in reversed(block):
+                yield line
+
+    def __eq__(self, other):
+        try:
+            if len(self) != len(other):
+                return False
+        except TypeError:
+            return False
+        for a, b in zip(self, other):
+            if a != b:
+                return False
+        return True
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __repr__(self):
+        return 'LineStore(%r)' % (list(self),)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            begin, end = self.__normalizeSlice(index)
+            if begin >= end:
+                return []
+            blockIndex, offset = self.__locate(begin)
+            result = []
+            remaining = end - begin
+            blocks = self.__blocks
+            while remaining > 0:
+                block = blocks[blockIndex]
+                chunk = block[offset:offset + remaining]
+                result.extend(chunk)
+                remaining -= len(chunk)
+                blockIndex += 1
+                offset = 0
+            return result
+        blockIndex, offset = self.__locate(self.__normalizeRow(index))
+        return self.__blocks[blockIndex][offset]
+
+    def __setitem__(self, index, value):
+        if isinstance(index, slice):
+            begin, end = self.__normalizeSlice(index)
+            self.replaceLines(begin, end, value)
+            return
+        row = self.__normalizeRow(index)
+        blockIndex, offset = self.__locate(row)
+        self.__blocks[blockIndex][offset] = value
+        self.__texts[blockIndex] = None
+        self.__version += 1
+        self.__edits.append((self.__version, row, row + 1, 1))
+
+    def __delitem__(self, index):
+        if isinstance(index, slice):
+            begin, end = self.__normalizeSlice(index)
+            self.replaceLines(begin, end, ())
+            return
+        row = self.__normalizeRow(index)
+        blockIndex, offset = self.__locate(row)
+        del self.__blocks[blockIndex][offset]
+        self.__texts[blockIndex] = None
+        self.__version += 1
+        self.__edits.append((self.__version, row, row + 1, 0))
+        self.__length -= 1
+        self.__starts = None
+        self.__rebalance(blockIndex)
+
+    def append(self, line):
+        self.insert(self.__length, line)
+
+    def extend(self, lines):
+        self.replaceLines(self.__length, self.__length, lines)
+
+    def insert(self, row, line):
+        """Insert a single |line| before |row| (like list.insert())."""
+        if row < 0:
+            row = max(0, row + self.__length)
+        row = min(row, self.__length)
+        self.__edits.append((self.__version + 1, row, row, 1))
+        if not self.__blocks:
+            self.__blocks.append([line])
+            self.__texts.append(None)
+        elif row == self.__length:
+            self.__blocks[-1].append(line)
+            self.__texts[-1] = None
+            row = self.__length - 1
+        else:
+            blockIndex, offset = self.__locate(row)
+            self.__blocks[blockIndex].insert(offset, line)
+            self.__texts[blockIndex] = None
+        self.__version += 1
+        self.__length += 1
+        self.__starts = None
+        self.__rebalance(self.__locate(row)[0])
+
+    def replaceLines(self, begin, end, lines):
+        """Replace the rows from |begin| up to (not including) |end| with
+        |lines|. This is the bulk form of insert and delete."""
+        lines = list(lines)
+        begin = max(0, min(begin, self.__length))
+        end = max(begin, min(end, self.__length))
+        if end - begin == len(lines):
+            # Same number of lines, the block structure is unchanged.
+            for i, line in enumerate(lines):
+                self.__setitem__(begin + i, line)
+            return
+        firstBlock = self.__split(begin)
+        lastBlock = self.__split(end)
+        size = self.__blockSize
+        newBlocks = [lines[i:i + size] for i in range(0, len(lines), size)]
+        self.__blocks[firstBlock:lastBlock] = newBlocks
+        self.__texts[firstBlock:lastBlock] = [None] * len(newBlocks)
+        self.__version += 1
+        self.__edits.append((self.__version, begin, end, len(lines)))
+        self.__length += len(lines) - (end - begin)
+        self.__starts = None
+        # Tidy the edges of the edit, where partial blocks may remain.
+        self.__rebalance(firstBlock + (len(lines) + size - 1) // size)
+        self.__rebalance(max(0, firstBlock - 1))
+
+    def version(self):
+        """A number that changes whenever the lines change."""
+        return self.__version
+
+    def editsSince(self, version):
+        """Get the edits made after |version| (see version()).
+
+        Returns:
+          A list of (begin, end, count) for each edit, in the order made, where
+          the rows from |begin| up to (not including) |end| were replaced with
+          |count| rows. None if the edits are no longer known (the lines were
+          replaced or there have been too many edits since).
+        """
+        if version == self.__version:
+            return []
+        edits = self.__edits
+        if not edits or edits[0][0] > version + 1 or version > self.__version:
+            return None
+        return [edit[1:] for edit in edits if edit[0] > version]
+
+    def text(self, joinLines):
+        """Get the whole document as a single string.
+
+        Args:
+          joinLines (function): Converts a list of lines into text, e.g.
+              joinNewLines(). It's called per block, so it must give the same
+              result on a split up list of lines as on the whole list.
+
+        Returns:
+          The text of all blocks joined with newlines. Only blocks that changed
+          since the prior call (with the same |joinLines|) are passed to
+          |joinLines| again.
+        """
+        return self.__join(joinLines)[1]
+
+    def __join(self, joinLines):
+        joined = self.__joined.get(joinLines)
+        if joined is None or joined[0] != self.__version:
+            texts = self.__texts
+            blockTexts = []
+            for i, block in enumerate(self.__blocks):
+                if texts[i] is None:
+                    texts[i] = {}
+                blockText = texts[i].get(joinLines)
+                if blockText is None:
+                    blockText = texts[i][joinLines] = joinLines(block)
+                blockTexts.append(blockText)
+            joined = [
+                self.__version, u"\n".join(blockTexts), blockTexts, None
+            ]
+            self.__joined[joinLines] = joined
+        return joined
+
+    def __blockOffsets(self):
+        """The offset of each block within text(joinNewLines)."""
+        joined = self.__join(joinNewLines)
+        if joined[3] is None:
+            offsets = [0]
+            for blockText in joined[2]:
+                offsets.append(offsets[-1] + len(blockText) + 1)
+            joined[3] = offsets
+        return joined[3]
+
+    def textOffset(self, row):
+        """The offset of the start of |row| within text(joinNewLines)."""
+        offsets = self.__blockOffsets()
+        if row >= self.__length:
+            return offsets[-1]
+        blockIndex, indexWithinBlock = self.__locate(row)
+        return offsets[blockIndex] + sum(
+            len(line) + 1
+            for line in self.__blocks[blockIndex][:indexWithinBlock])
+
+    def textRowCol(self, offset):
+        """The (row, col) of |offset| within text(joinNewLines)."""
+        offsets = self.__blockOffsets()
+        if not self.__blocks:
+            return (0, offset)
+        blockIndex = bisect.bisect_right(offsets, offset, 0,
+                                         len(self.__blocks)) - 1
+        row = self.__blockStarts()[blockIndex]
+        col = offset - offsets[blockIndex]
+        for line in self.__blocks[blockIndex]:
+            if col <= len(line):
+                break
+            col -= len(line) + 1
+            row += 1
+        return (row, col)
+
+    def iterBlocks(self):
+        """Iterate over the blocks of lines (see assignBlocks())."""
+        return iter(self.__blocks)
+
+    def blockCount(self):
+        """For testing and debugging."""
+        return len(self.__blocks)
@@ -0,0 +1,404 @@
+# Copyright 2018 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+  Read the lines of a large file lazily.
+
+  Rather than reading (and copying) the whole file before showing it, the file
+  is memory mapped and split into blocks of about kBlockBytes, each ending at a
+  line break. Only the number of lines in each block is counted up front. The
+  lines of a block are decoded when they are first requested and only a few
+  decoded blocks are cached, so memory use stays bounded. A block that is
+  edited keeps its (decoded) lines from then on. A block that isn't text in the
+  encoding is found when it is first decoded, and from then on the file can't
+  be saved (see MappedFile.decodeError).
+
+  The blocks are used as the blocks of an app.line_store.LineStore.
+
+  A HexFile does the same for a binary file, showing it as rows of hex digits.
+  Saving a HexFile writes only the bytes that changed (when the rows still line
+  up with the bytes in the file).
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import binascii
+import collections
+import io
+import mmap
+import os
+import re
+import shutil
+
+import app.log
+
+# The approximate size of each block, in bytes.
+kBlockBytes = 1024 * 1024
+
+# How many blocks of decoded (but unchanged) lines are cached.
+kCachedBlockCount = 8
+
+# How many lines writeLines() converts to text at a time.
+kWriteRows = 4096
+
+# The number of bytes in each row of a HexFile.
+kHexRowBytes = 16
+
+# A line break, as counted by lineCount().
+kLineBreakRe = re.compile(b'\r\n?|\n')
+
+# Characters that are ignored when reading the hex digits of a HexFile row.
+kHexWhitespace = {
+    ord(u' '): None,
+    ord(u'\n'): None,
+    ord(u'\r'): None,
+    ord(u'\t'): None,
+}
+
+
+def lineCount(data, isLast):
+    """The number of lines in |data| (bytes), counting CR, LF, and CRLF as line
+    breaks. Unless |isLast|, |data| ends with a line break that does not begin
+    another line."""
+    count = data.count(b'\n') + data.count(b'\r') - data.count(b'\r\n')
+    return count + 1 if isLast else count
+
+
+def changedRange(old, new):
+    """Find the part of |new| (bytes) that differs from |old|.
+
+    Returns:
+      (begin, end) offsets into |new|, or None if they are the same.
+    """
+    if old == new:
+        return None
+    old = bytearray(old)
+    new = bytearray(new)
+    begin = 0
+    limit = min(len(old), len(new))
+    while begin < limit and old[begin] == new[begin]:
+        begin += 1
+    end = len(new)
+    if len(old) == len(new):
+        while end > begin and old[end - 1] == new[end - 1]:
+            end -= 1
+    return begin, end
+
+
+def replaceFile(path, write):
+    """Call |write| with a new file, which then replaces the file at |path|.
+
+    The file at |path| may be mapped (and still be read from while writing),
+    so the new file is written beside it and then renamed over it.
+    """
+    tempPath = path + u'.ci_edit_save'
+    with io.open(tempPath, u'wb') as outputFile:
+        write(outputFile)
+    if os.path.exists(path):
+        shutil.copymode(path, tempPath)
+    os.rename(tempPath, path)
+
+
+def writeLines(path, lines, linesToData, encoding):
+    """Write |lines| to |path| a few rows at a time (rather than as one string).
+    See replaceFile().
+
+    Args:
+      linesToData (function): Converts a list of lines to text (e.g.
+          app.actions.Actions.doLinesToData).
+    """
+
+    def write(outputFile):
+        for row in range(0, len(lines), kWriteRows):
+            if row:
+                outputFile.write(b'\n')
+            outputFile.write(
+                linesToData(lines[row:row + kWriteRows]).encode(encoding))
+
+    replaceFile(path, write)
+
+
+class LazyBlock(object):
+    """A block of lines that are decoded from a MappedFile when needed. Acts
+    like a list of lines."""
+
+    def __init__(self, mappedFile, begin, end, count, isLast):
+        self.__mappedFile = mappedFile
+        self.__begin = begin
+        self.__end = end
+        self.__count = count
+        self.__isLast = isLast
+        # Set once the block is changed.
+        self.__lines = None
+
+    def __read(self):
+        if self.__lines is not None:
+            return self.__lines
+        return self.__mappedFile.readLines(self.__begin, self.__end,
+                                           self.__isLast)
+
+    def __materialize(self):
+        if self.__lines is None:
+            self.__lines = list(self.__read())
+        return self.__lines
+
+    def isMaterialized(self):
+        return self.__lines is not None
+
+    def byteRange(self):
+        """The (begin, end) offsets of the block within the file."""
+        return self.__begin, self.__end
+
+    def __len__(self):
+        if self.__lines is not None:
+            return len(self.__lines)
+        return self.__count
+
+    def __iter__(self):
+        return iter(self.__read())
+
+    def __reversed__(self):
+        return reversed(self.__read())
+
+    def __getitem__(self, index):
+        return self.__read()[index]
+
+    def __setitem__(self, index, value):
+        self.__materialize()[index] = value
+
+    def __delitem__(self, index):
+        del self.__materialize()[index]
+
+    def append(self, line):
+        self.__materialize().append(line)
+
+    def extend(self, lines):
+        self.__materialize().extend(lines)
+
+    def insert(self, index, line):
+        self.__materialize().insert(index, line)
+
+
+class MappedFile(object):
+    """A memory mapped file split into LazyBlocks."""
+
+    def __init__(self, path, dataToLines, encoding=u'utf-8'):
+        """
+        Args:
+          path (str): The file to open (which must not be empty).
+          dataToLines (function): Splits decoded text into lines (e.g.
+              app.actions.Actions.doDataToLines).
+          encoding (str): The file encoding.
+
+        Raises:
+          IOError, or UnicodeDecodeError if the first block of the file is not
+          text in |encoding|.
+        """
+        self.path = path
+        self.encoding = encoding
+        # The first UnicodeDecodeError from decodeLines(), if any. The lines of
+        # that block are shown with replacement characters, and write() raises
+        # the error rather than saving them over the original bytes.
+        self.decodeError = None
+        self.__dataToLines = dataToLines
+        self.__cache = collections.OrderedDict()
+        with io.open(path, 'rb') as inputFile:
+            self.map = mmap.mmap(
+                inputFile.fileno(), 0, access=mmap.ACCESS_READ)
+        self.blocks = self.indexBlocks()
+
+    def indexBlocks(self):
+        """Split the file into blocks, in a single (streaming) pass.
+
+        A block ends at a line break (CR, LF, or CRLF), so it never splits a
+        character. Only the first block is decoded now (e.g. so that a binary
+        file may be opened as hex instead), the rest are checked by
+        decodeLines().
+
+        Raises:
+          UnicodeDecodeError.
+        """
+        data = self.map
+        size = len(data)
+        blocks = []
+        begin = 0
+        while begin < size:
+            end = min(size, begin + kBlockBytes)
+            cut = max(data.rfind(b'\n', begin, end), data.rfind(b'\r', begin,
+                                                                 end))
+            if cut == -1:
+                # A very long line, end the block after it.
+                found = kLineBreakRe.search(data, end)
+                if found is None:
+                    break
+                end = found.end()
+            elif data[cut:cut + 2] == b'\r\n':
+                end = cut + 2
+            else:
+                end = cut + 1
+            blocks.append(
+                LazyBlock(self, begin, end, lineCount(data[begin:end], False),
+                          False))
+            begin = end
+        # The last line (which is empty if the file ends with a line break).
+        blocks.append(
+            LazyBlock(self, begin, size, lineCount(data[begin:size], True),
+                      True))
+        begin, end = blocks[0].byteRange()
+        data[begin:end].decode(self.encoding)
+        app.log.info(u'mapped file', self.path, len(blocks), u'blocks')
+        return blocks
+
+    def decodeLines(self, begin, end, isLast):
+        """Get the lines in bytes |begin| to |end| of the file."""
+        data = self.map[begin:end]
+        try:
+            text = data.decode(self.encoding)
+        except UnicodeDecodeError as e:
+            app.log.info(u'not', self.encoding, u'text at', begin + e.start)
+            if self.decodeError is None:
+                self.decodeError = e
+            text = data.decode(self.encoding, u'replace')
+        lines = self.__dataToLines(text)
+        if not isLast:
+            # The block ends with a line break, rather than a line.
+            lines.pop()
+        return lines
+
+    def readLines(self, begin, end, isLast):
+        """Get the lines of a block (see decodeLines()), with caching."""
+        lines = self.__cache.pop(begin, None)
+        if lines is None:
+            lines = self.decodeLines(begin, end, isLast)
+            if len(self.__cache) >= kCachedBlockCount:
+                self.__cache.popitem(last=False)
+        self.__cache[begin] = lines
+        return lines
+
+    def write(self, path, lines, linesToData):
+        """Save |lines| (which began as self.blocks) to |path|.
+
+        Raises:
+          UnicodeDecodeError if a block was not text in the encoding (see
+          decodeLines()), since its lines hold replacement characters.
+        """
+        if self.decodeError is not None:
+            raise self.decodeError
+        writeLines(path, lines, linesToData, self.encoding)
+
+    def close(self):
+        self.__cache.clear()
+        self.map.close()
+
+
+class HexFile(MappedFile):
+    """A memory mapped binary file, shown as rows of kHexRowBytes bytes in hex.
+
+    Edits to the rows are saved as byte level patches to the file when every
+    unchanged block is still at its original offset (e.g. bytes were changed
+    rather than inserted or removed). Otherwise the file is written anew.
+    """
+
+    def __init__(self, path):
+        # The size of the file on disk, which may differ from the size of the
+        # map once patches are written.
+        self.size = os.path.getsize(path)
+        # Set once the file at self.path is no longer the mapped file.
+        self.__replaced = False
+        MappedFile.__init__(self, path, None, None)
+
+    def indexBlocks(self):
+        size = len(self.map)
+        blockBytes = max(kHexRowBytes,
+                         kBlockBytes // 2 // kHexRowBytes * kHexRowBytes)
+        blocks = []
+        for begin in range(0, size, blockBytes):
+            end = min(size, begin + blockBytes)
+            isLast = end == size
+            rowCount = (end - begin + kHexRowBytes - 1) // kHexRowBytes
+            blocks.append(
+                LazyBlock(self, begin, end, rowCount + isLast, isLast))
+        return blocks
+
+    def decodeLines(self, begin, end, isLast):
+        digits = binascii.hexlify(self.map[begin:end]).decode(u'ascii')
+        width = kHexRowBytes * 2
+        lines = [digits[i:i + width] for i in range(0, len(digits), width)]
+        if isLast:
+            # The (empty) row after the final line break.
+            lines.append(u'')
+        return lines
+
+    def __blockData(self, block):
+        """Get the bytes for a block of rows."""
+        return binascii.unhexlify(u''.join(block).translate(kHexWhitespace))
+
+    def patches(self, lines):
+        """Find the bytes to write to the file to save |lines|.
+
+        Returns:
+          (patches, size) where |patches| is a list of (offset, bytes) and
+          |size| is the new size of the file, or None if the bytes of an
+          unchanged block have moved.
+        """
+        patches = []
+        offset = 0
+        for block in lines.iterBlocks():
+            if isinstance(block, LazyBlock) and not block.isMaterialized():
+                begin, end = block.byteRange()
+                if begin != offset:
+                    return None
+                offset = end
+                continue
+            data = self.__blockData(block)
+            original = self.map[offset:min(offset + len(data), self.size)]
+            changed = changedRange(original, data)
+            if changed is not None and changed[0] < changed[1]:
+                patches.append((offset + changed[0],
+                                data[changed[0]:changed[1]]))
+            offset += len(data)
+        return patches, offset
+
+    def write(self, path, lines, linesToData=None):
+        """Save |lines| (which began as self.blocks) to |path|."""
+        patches = None
+        if path == self.path and not self.__replaced:
+            patches = self.patches(lines)
+        if patches is None:
+            self.__replace(path, lines)
+            return
+        patches, size = patches
+        with io.open(path, 'r+b') as outputFile:
+            for offset, data in patches:
+                outputFile.seek(offset)
+                outputFile.write(data)
+            outputFile.truncate(size)
+        self.size = size
+
+    def __replace(self, path, lines):
+
+        def write(outputFile):
+            for block in lines.iterBlocks():
+                if isinstance(block, LazyBlock) and not block.isMaterialized():
+                    begin, end = block.byteRange()
+                    outputFile.write(self.map[begin:end])
+                else:
+                    outputFile.write(self.__blockData(block))
+
+        replaceFile(path, write)
+        if path == self.path:
+            # The map now refers to the prior (unlinked) file, which is still
+            # read from for unchanged blocks.
+            self.__replaced = True
@@ -0,0 +1,236 @@
+# Copyright 2018 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+  An index of the matches of the find pattern within a document.
+
+  The document is searched once for each pattern (a slice at a time, in the
+  background) and the index is then kept up to date by searching only the rows
+  that were edited (see app.line_store.LineStore.editsSince()). The matches
+  are kept in order, so finding the next or prior match, the number of a
+  match, or the matches within the rows on screen is a binary search.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import bisect
+
+# Check for a pending user event after searching this many rows.
+kCheckRows = 1000
+
+
+class MatchIndex:
+    """The matches of a regex within a LineStore."""
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        """Forget the matches (e.g. when there is no longer a find pattern)."""
+        self.regex = None
+        self.lines = None
+        self.version = None
+        # The rows that have a match, in order, and a list of the (begin, end)
+        # columns of the matches on each of those rows.
+        self.rows = []
+        self.cols = []
+        # The number of matches before each of |rows| (built as needed).
+        self.__counts = None
+        # Rows below |scannedTo| have been searched (or are in |dirtyRows|).
+        self.scannedTo = 0
+        # Rows edited since they were searched, in order.
+        self.dirtyRows = []
+
+    def isCurrent(self, regex, lines):
+        """Whether the index holds all the matches of |regex| in |lines|."""
+        return (regex is self.regex and lines is self.lines and
+                self.version == lines.version() and
+                self.scannedTo >= len(lines) and not self.dirtyRows)
+
+    def update(self, regex, lines, bgThread=None):
+        """Bring the index up to date with |regex| and |lines|.
+
+        Args:
+          regex (re.RegexObject): The find pattern.
+          lines (LineStore): The document.
+          bgThread (BackgroundThread): If given, stop early when a user event
+              is waiting (to be resumed by calling update() again).
+
+        Returns:
+          True if the index is up to date.
+        """
+        if self.isCurrent(regex, lines):
+            return True
+        self.__counts = None
+        if regex is not self.regex or lines is not self.lines:
+            self.clear()
+            self.regex = regex
+            self.lines = lines
+            self.version = lines.version()
+        elif self.version != lines.version():
+            edits = lines.editsSince(self.version)
+            self.version = lines.version()
+            if edits is None:
+                self.clear()
+                self.regex = regex
+                self.lines = lines
+                self.version = lines.version()
+            else:
+                for begin, end, count in edits:
+                    self.__applyEdit(begin, end, count)
+        if self.dirtyRows:
+            if len(self.dirtyRows) > len(lines) // 8:
+                # Searching everything again is quicker than inserting the
+                # matches one row at a time.
+                self.rows = []
+                self.cols = []
+                self.scannedTo = 0
+            else:
+                for row in self.dirtyRows:
+                    self.__searchRow(row)
+            self.dirtyRows = []
+        rowCount = len(lines)
+        finditer = regex.finditer
+        rows = self.rows
+        cols = self.cols
+        while self.scannedTo < rowCount:
+            if bgThread is not None and bgThread.hasUserEvent():
+                return False
+            end = min(self.scannedTo + kCheckRows, rowCount)
+            for row, line in enumerate(lines[self.scannedTo:end],
+                                       self.scannedTo):
+                found = [i.span() for i in finditer(line)]
+                if found:
+                    rows.append(row)
+                    cols.append(found)
+            self.scannedTo = end
+        return True
+
+    def __applyEdit(self, begin, end, count):
+        """Adjust the index for the rows from |begin| up to |end| being
+        replaced with |count| rows."""
+        delta = count - (end - begin)
+        if self.scannedTo > begin:
+            if self.scannedTo <= end:
+                self.scannedTo = begin
+            else:
+                self.scannedTo += delta
+        rows = self.rows
+        first = bisect.bisect_left(rows, begin)
+        last = bisect.bisect_left(rows, end)
+        rows[first:] = [row + delta for row in rows[last:]]
+        del self.cols[first:last]
+        dirtyRows = self.dirtyRows
+        first = bisect.bisect_left(dirtyRows, begin)
+        last = bisect.bisect_left(dirtyRows, end)
+        dirtyRows[first:] = list(range(
+            begin, min(begin + count, self.scannedTo))) + [
+                row + delta for row in dirtyRows[last:]]
+
+    def __searchRow(self, row):
+        found = [i.span() for i in self.regex.finditer(self.lines[row])]
+        rows = self.rows
+        index = bisect.bisect_left(rows, row)
+        present = index < len(rows) and rows[index] == row
+        if found:
+            if present:
+                self.cols[index] = found
+            else:
+                rows.insert(index, row)
+                self.cols.insert(index, found)
+        elif present:
+            del rows[index]
+            del self.cols[index]
+
+    def __matchCounts(self):
+        if self.__counts is None:
+            counts = []
+            total = 0
+            for found in self.cols:
+                counts.append(total)
+                total += len(found)
+            counts.append(total)
+            self.__counts = counts
+        return self.__counts
+
+    def matchCount(self):
+        return self.__matchCounts()[-1]
+
+    def nextMatch(self, row, col):
+        """Find the first match at or after |row|, |col|.
+
+        Returns:
+          (row, begin, end) or None.
+        """
+        index = bisect.bisect_left(self.rows, row)
+        if index < len(self.rows) and self.rows[index] == row:
+            for begin, end in self.cols[index]:
+                if begin >= col:
+                    return (row, begin, end)
+            index += 1
+        if index < len(self.rows):
+            begin, end = self.cols[index][0]
+            return (self.rows[index], begin, end)
+        return None
+
+    def priorMatch(self, row, col):
+        """Find the last match that begins before |row|, |col|.
+
+        Returns:
+          (row, begin, end) or None.
+        """
+        index = bisect.bisect_right(self.rows, row) - 1
+        if index >= 0 and self.rows[index] == row:
+            for begin, end in reversed(self.cols[index]):
+                if begin < col:
+                    return (row, begin, end)
+            index -= 1
+        if index >= 0:
+            begin, end = self.cols[index][-1]
+            return (self.rows[index], begin, end)
+        return None
+
+    def firstMatch(self):
+        if not self.rows:
+            return None
+        begin, end = self.cols[0][0]
+        return (self.rows[0], begin, end)
+
+    def lastMatch(self):
+        if not self.rows:
+            return None
+        begin, end = self.cols[-1][-1]
+        return (self.rows[-1], begin, end)
+
+    def matchNumber(self, row, col):
+        """The number (counting from 1) of the match that begins at |row|,
+        |col|, or None if no match begins there."""
+        index = bisect.bisect_left(self.rows, row)
+        if index >= len(self.rows) or self.rows[index] != row:
+            return None
+        for i, found in enumerate(self.cols[index]):
+            if found[0] == col:
+                return self.__matchCounts()[index] + i + 1
+        return None
+
+    def matchesInRows(self, beginRow, endRow):
+        """Generate (row, begin, end) for the matches on the rows from
+        |beginRow| up to (not including) |endRow|."""
+        rows = self.rows
+        index = bisect.bisect_left(rows, beginRow)
+        while index < len(rows) and rows[index] < endRow:
+            for begin, end in self.cols[index]:
+                yield (rows[index], begin, end)
+            index += 1
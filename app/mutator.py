@@ -46,7 +46,6 @@ class Mutator(app.selectable.Selectable):
         self.oldRedoIndex = 0
         self.debugRedo = False
         self.findRe = None
-        self.findBackRe = None
         self.fileExtension = None
         self.fullPath = u''
         self.fileStat = None
@@ -171,6 +170,33 @@ class Mutator(app.selectable.Selectable):
     def setFilePath(self, path):
         self.fullPath = app.buffer_file.fullPath(path)
 
+    def __replaceRows(self, ranges):
+        """Replace ranges of rows.
+
+        Args:
+          ranges (list): (row, count, lines) tuples, in order of |row|. The
+              |count| rows at |row| are replaced with |lines|.
+        """
+        if all(count == len(lines) for _, count, lines in ranges):
+            # The rows stay in place, so just set them.
+            for row, _, lines in ranges:
+                for i, line in enumerate(lines):
+                    self.lines[row + i] = line
+        else:
+            # Splice all the ranges at once, rather than moving the rows after
+            # each range in turn.
+            begin = ranges[0][0]
+            end = ranges[-1][0] + ranges[-1][1]
+            spliced = []
+            row = begin
+            for rangeRow, count, lines in ranges:
+                spliced.extend(self.lines[row:rangeRow])
+                spliced.extend(lines)
+                row = rangeRow + count
+            self.lines[begin:end] = spliced
+        if self.upperChangedRow > ranges[0][0]:
+            self.upperChangedRow = ranges[0][0]
+
     def __doMoveLines(self, begin, end, to):
         lines = self.lines[begin:end]
         del self.lines[begin:end]
@@ -195,7 +221,7 @@ class Mutator(app.selectable.Selectable):
                 self.markerRow += count
             if self.upperChangedRow > to:
                 self.upperChangedRow = to
-        self.lines = self.lines[:to] + lines + self.lines[to:]
+        self.lines[to:to] = lines
 
     def __doVerticalInsert(self, change):
         text, row, endRow, col = change[1]
@@ -302,6 +328,9 @@ class Mutator(app.selectable.Selectable):
                 change[1][0]) is type(0) else 0
             if self.upperChangedRow > firstChangedRow:
                 self.upperChangedRow = firstChangedRow
+        elif change[0] == 'lr':  # Redo line ranges.
+            self.__replaceRows([(row, len(oldLines), newLines)
+                                for row, oldLines, newLines in change[1]])
         elif change[0] == 'm':  # Redo move
             self.__redoMove(change)
         elif change[0] == 'ml':  # Redo move lines
@@ -309,10 +338,9 @@ class Mutator(app.selectable.Selectable):
             self.__doMoveLines(begin, end, to)
         elif change[0] == 'n':  # Redo split lines (insert \n).
             line = self.lines[self.penRow]
-            self.lines.insert(self.penRow + 1, line[self.penCol:])
-            self.lines[self.penRow] = line[:self.penCol]
-            for i in range(max(change[1] - 1, 0)):
-                self.lines.insert(self.penRow + 1, u"")
+            self.lines[self.penRow:self.penRow + 1] = (
+                [line[:self.penCol]] + [u""] * max(change[1] - 1, 0) +
+                [line[self.penCol:]])
             if self.upperChangedRow > self.penRow:
                 self.upperChangedRow = self.penRow
             self.__redoMove(change[2])
@@ -480,6 +508,14 @@ class Mutator(app.selectable.Selectable):
                 change[1][0]) is type(0) else 0
             if self.upperChangedRow > firstChangedRow:
                 self.upperChangedRow = firstChangedRow
+        elif change[0] == 'lr':  # Undo line ranges.
+            # Find where each range is after the change.
+            ranges = []
+            delta = 0
+            for row, oldLines, newLines in change[1]:
+                ranges.append((row + delta, len(newLines), oldLines))
+                delta += len(newLines) - len(oldLines)
+            self.__replaceRows(ranges)
         elif change[0] == 'm':
             self.__undoMove(change)
         elif change[0] == 'ml':
@@ -494,8 +530,7 @@ class Mutator(app.selectable.Selectable):
             # Undo split lines.
             self.__undoMove(change[2])
             self.lines[self.penRow] += self.lines[self.penRow + change[1]]
-            for _ in range(change[1]):
-                del self.lines[self.penRow + 1]
+            del self.lines[self.penRow + 1:self.penRow + 1 + change[1]]
             if self.upperChangedRow > self.penRow:
                 self.upperChangedRow = self.penRow
         elif change[0] == 'v':  # undo paste
@@ -0,0 +1,264 @@
+# Copyright 2018 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+  Parse a large document using several processes.
+
+  The document is split into chunks at blank lines. Each chunk is parsed in a
+  worker process as if it began in the root grammar. The results are stitched
+  together in order, after checking that the parse of each chunk really did
+  end in the root grammar (i.e. that the guess about where it was safe to
+  split was right). At the first chunk where that check fails the stitching
+  stops and the remainder is left to the (serial) background parse.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import array
+import multiprocessing
+import sys
+
+import app.log
+import app.parser
+
+# Documents smaller than this are parsed serially; starting the worker
+# processes costs more than it saves.
+kMinParallelParseSize = 1000000
+
+# How many chunks each worker process is given (on average).
+kChunksPerProcess = 4
+
+# The Prefs (and grammars) in a worker process. See _initWorker().
+_workerPrefs = None
+
+
+def _initWorker(appPrefs):
+    global _workerPrefs
+    _workerPrefs = appPrefs
+
+
+def poolContext():
+    """Get the multiprocessing context to make a pool of worker processes
+    with.
+
+    Pools are made on the background thread. Forking a process that runs
+    several threads copies any locks the other threads hold, so the workers
+    are started from a server process (or spawned) where that is supported.
+    """
+    if not hasattr(multiprocessing, 'get_context'):
+        # Python 2.
+        return multiprocessing
+    methods = multiprocessing.get_all_start_methods()
+    for method in ('forkserver', 'spawn'):
+        if method in methods:
+            return multiprocessing.get_context(method)
+    return multiprocessing
+
+
+def _parseChunk(args):
+    """Parse one chunk of the document (in a worker process).
+
+    Args:
+      args (tuple): (grammarName, text, prefixLength). The first
+          |prefixLength| characters of |text| are the tail of the prior chunk,
+          included so that regexes looking behind the start of the chunk see
+          the same text as they would in a serial parse.
+
+    Returns:
+      None on failure, or (grammarNames, nodeGrammar, nodeBegin, nodePrior,
+      nodeVisual, rows).
+    """
+    grammarName, text, prefixLength = args
+    grammar = _workerPrefs.grammars[grammarName]
+    parser = app.parser.Parser()
+    rowCount = text.count(u'\n') + 1
+    while parser.fullyParsedToLine < rowCount:
+        priorFullyParsedToLine = parser.fullyParsedToLine
+        # The extra row allows the parse to continue to the end of the text
+        # (rather than stopping at the start of the last row).
+        parser.parse(None, _workerPrefs, text, grammar, priorFullyParsedToLine,
+                     rowCount + 1)
+        if parser.fullyParsedToLine <= priorFullyParsedToLine:
+            # No progress.
+            return None
+    return ([g.get('name') for g in parser.grammars], parser.nodeGrammar,
+            parser.nodeBegin, parser.nodePrior, parser.nodeVisual, parser.rows)
+
+
+def splitOffsets(data, chunkCount):
+    """Find offsets to split |data| at, each is the start of a blank line.
+
+    Returns:
+      A list of offsets beginning with 0.
+    """
+    offsets = [0]
+    chunkSize = len(data) // chunkCount
+    for i in range(1, chunkCount):
+        target = max(offsets[-1] + 1, i * chunkSize)
+        found = data.find(u'\n\n', target)
+        if found == -1:
+            break
+        offsets.append(found + 1)
+    return offsets
+
+
+class ParallelParse:
+    """A parse of |data| that runs in a pool of worker processes. Call ready()
+    to check whether the parse is done and then stitch() to apply the result
+    to a Parser."""
+
+    def __init__(self, appPrefs, data, grammar, processCount=None,
+                 chunkCount=None):
+        self.data = data
+        self.grammar = grammar
+        context = poolContext()
+        if processCount is None:
+            processCount = context.cpu_count()
+        if chunkCount is None:
+            chunkCount = processCount * kChunksPerProcess
+        self.offsets = splitOffsets(data, chunkCount)
+        ends = self.offsets[1:] + [len(data)]
+        chunks = []
+        for i, begin in enumerate(self.offsets):
+            prefixLength = 1 if begin else 0
+            chunks.append(
+                (grammar['name'], data[begin - prefixLength:ends[i]],
+                 prefixLength))
+        # The workers are given the prefs, so that they parse with the same
+        # grammars (including the user's changes to them).
+        self.pool = context.Pool(processCount, _initWorker, (appPrefs,))
+        self.asyncResult = self.pool.map_async(_parseChunk, chunks)
+        self.pool.close()
+
+    def cancel(self):
+        """Stop the worker processes."""
+        self.pool.terminate()
+        self.pool.join()
+
+    def ready(self, timeout=0):
+        """Wait up to |timeout| seconds for the parse to finish.
+
+        Returns:
+          True if the parse is finished.
+        """
+        self.asyncResult.wait(timeout)
+        return self.asyncResult.ready()
+
+    def stitch(self, parser, appPrefs):
+        """Replace the nodes in |parser| with the result of the parallel parse.
+
+        Returns:
+          The number of rows parsed (which will be fewer than the rows in the
+          document if a chunk did not begin in the root grammar).
+        """
+        self.pool.join()
+        try:
+            results = self.asyncResult.get()
+        except Exception as e:
+            app.log.exception(e)
+            results = []
+        rootId = parser.grammarId(self.grammar)
+        parser.nodeGrammar = array.array('i')
+        parser.nodeBegin = array.array(app.parser.kIntType)
+        parser.nodePrior = array.array(app.parser.kIntType)
+        parser.nodeVisual = array.array(app.parser.kIntType)
+        parser.rows = array.array(app.parser.kIntType)
+        # The offset and visual offset at which the current chunk begins.
+        offset = 0
+        visual = 0
+        for i, result in enumerate(results):
+            if result is None:
+                break
+            (grammarNames, nodeGrammar, nodeBegin, nodePrior, nodeVisual,
+             rows) = result
+            grammarIds = [
+                parser.grammarId(appPrefs.grammars[name])
+                if name is not None else 0 for name in grammarNames
+            ]
+            # Skip the node for the prefix (from the prior chunk).
+            first = 1 if offset else 0
+            if offset and (len(rows) < 2 or rows[1] != first or
+                           nodePrior[first] != app.parser.kNoPrior or
+                           grammarIds[nodeGrammar[first]] != rootId):
+                app.log.info('parallel parse: chunk did not begin cleanly', i)
+                break
+            isLastChunk = i + 1 == len(results)
+            if isLastChunk:
+                # All but the end node (which __fastLineParse will add).
+                end = len(nodeBegin)
+                if nodeBegin[-1] == sys.maxsize:
+                    end -= 1
+                rowLimit = len(rows)
+            else:
+                # All but the start of the last row, which is the first node
+                # of the next chunk (if that was a correct guess).
+                end = rows[-1]
+                rowLimit = len(rows) - 1
+            nodeDelta = len(parser.nodeBegin) - first
+            offsetDelta = offset - nodeBegin[first]
+            visualDelta = visual - nodeVisual[first]
+            priors = []
+            for prior in nodePrior[first:end]:
+                if prior != app.parser.kNoPrior:
+                    if prior < first:
+                        # Refers to the prefix.
+                        priors = None
+                        break
+                    prior += nodeDelta
+                priors.append(prior)
+            if priors is None:
+                app.log.info('parallel parse: chunk refers to prefix', i)
+                break
+            parser.nodeGrammar.extend(
+                [grammarIds[grammarId] for grammarId in nodeGrammar[first:end]])
+            parser.nodeBegin.extend(
+                [begin + offsetDelta for begin in nodeBegin[first:end]])
+            parser.nodePrior.extend(priors)
+            parser.nodeVisual.extend(
+                [v + visualDelta for v in nodeVisual[first:end]])
+            parser.rows.extend(
+                [row + nodeDelta for row in rows[first:rowLimit]])
+            if isLastChunk:
+                break
+            boundary = rows[-1]
+            offset = nodeBegin[boundary] + offsetDelta
+            visual = nodeVisual[boundary] + visualDelta
+            if (nodePrior[boundary] != app.parser.kNoPrior or
+                    grammarIds[nodeGrammar[boundary]] != rootId):
+                # The next chunk was parsed as if it began in the root grammar,
+                # but it doesn't. Keep the start of the row (its state is
+                # correct) and leave the rest to the serial parser.
+                app.log.info('parallel parse: chunk ends in a nested grammar',
+                             i)
+                parser.rows.append(len(parser.nodeBegin))
+                parser.nodeGrammar.append(grammarIds[nodeGrammar[boundary]])
+                parser.nodeBegin.append(offset)
+                parser.nodePrior.append(app.parser.kNoPrior if nodePrior[
+                    boundary] == app.parser.kNoPrior else nodePrior[boundary] +
+                                        nodeDelta)
+                parser.nodeVisual.append(visual)
+                break
+        if not parser.nodeBegin:
+            parser.nodeGrammar.append(rootId)
+            parser.nodeBegin.append(0)
+            parser.nodePrior.append(app.parser.kNoPrior)
+            parser.nodeVisual.append(0)
+            parser.rows.append(0)
+        parsedRows = len(parser.rows)
+        # Let the parser add nodes for any rows that were not parsed.
+        parser.fullyParsedToLine = parsedRows
+        parser.parse(None, appPrefs, self.data, self.grammar, parsedRows,
+                     parsedRows)
+        return parsedRows
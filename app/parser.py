@@ -21,7 +21,11 @@ except NameError:
     unicode = str
     unichr = chr
 
+import array
+import bisect
 import curses.ascii
+import itertools
+import operator
 import os
 import re
 import sys
@@ -34,10 +38,124 @@ import app.config
 import app.log
 import app.selectable
 
-kGrammar = 0
-kBegin = 1
-kPrior = 2
-kVisual = 3
+# Parser nodes are stored in arrays of machine integers (rather than a list of
+# Python objects). Python 2 arrays lack 'q' (long long).
+try:
+    array.array('q')
+    kIntType = 'q'
+except ValueError:
+    kIntType = 'l'
+
+# The prior of a node that has no prior (the root of the grammar stack).
+kNoPrior = -1
+
+# How far above the requested rows parseWindow() looks for a place to begin.
+kWindowLeadRows = 200
+
+# Characters that are drawn two columns wide.
+kReWideCharacter = re.compile(u'[^\0-\u2fff]')
+
+try:
+    accumulate = itertools.accumulate
+except AttributeError:
+    # Python 2.
+    def accumulate(values):
+        total = 0
+        for value in values:
+            total += value
+            yield total
+
+
+def rowIndex(data):
+    """Find the offset and visual offset at which each row (line) of |data|
+    begins.
+
+    Returns:
+      (begins, visuals, endVisual). |begins| and |visuals| are arrays with an
+      entry per row and |endVisual| is the visual offset of the end of |data|.
+    """
+    lines = data.split(u'\n')
+    begins = array.array(kIntType, [0])
+    # The work here is done by C code (split, map, accumulate) rather than
+    # looping in Python, which matters for documents with millions of rows.
+    begins.extend(
+        accumulate(
+            map(operator.add, map(len, lines[:-1]), itertools.repeat(1))))
+    if kReWideCharacter.search(data) is None:
+        return begins, begins, len(data)
+    widths = [
+        len(line) + len(kReWideCharacter.findall(line)) for line in lines
+    ]
+    visuals = array.array(kIntType, [0])
+    visuals.extend(
+        accumulate(map(operator.add, widths[:-1], itertools.repeat(1))))
+    return begins, visuals, visuals[-1] + widths[-1]
+
+
+def commonPrefixLength(a, b, limit):
+    """Find how many characters at the start of |a| and |b| are the same.
+
+    Args:
+      a (string): One version of the text.
+      b (string): Another version of the text.
+      limit (int): The most characters to compare (the result will not exceed
+          |limit|).
+
+    Returns:
+      The length of the common prefix.
+    """
+    low = 0
+    size = 64
+    # Compare larger and larger chunks (the slice compare is fast) to find the
+    # chunk that differs.
+    while low < limit:
+        high = min(limit, low + size)
+        if a[low:high] != b[low:high]:
+            # Binary search within the differing chunk.
+            while high - low > 1:
+                mid = (low + high) // 2
+                if a[low:mid] == b[low:mid]:
+                    low = mid
+                else:
+                    high = mid
+            return low
+        low = high
+        size *= 2
+    return limit
+
+
+def commonSuffixLength(a, b, limit):
+    """Find how many characters at the end of |a| and |b| are the same.
+
+    Args:
+      a (string): One version of the text.
+      b (string): Another version of the text.
+      limit (int): The most characters to compare (the result will not exceed
+          |limit|).
+
+    Returns:
+      The length of the common suffix.
+    """
+    lenA = len(a)
+    lenB = len(b)
+    low = 0
+    size = 64
+    # Compare larger and larger chunks (the slice compare is fast) to find the
+    # chunk that differs.
+    while low < limit:
+        high = min(limit, low + size)
+        if a[lenA - high:lenA - low] != b[lenB - high:lenB - low]:
+            # Binary search within the differing chunk.
+            while high - low > 1:
+                mid = (low + high) // 2
+                if a[lenA - mid:lenA - low] == b[lenB - mid:lenB - low]:
+                    low = mid
+                else:
+                    high = mid
+            return low
+        low = high
+        size *= 2
+    return limit
 
 
 class ParserNode:
@@ -66,41 +184,102 @@ class Parser:
     def __init__(self):
         self.data = u""
         self.emptyNode = ParserNode({}, None, None, 0)
-        self.endNode = ({}, sys.maxsize, sys.maxsize, sys.maxsize)
         self.fullyParsedToLine = -1
+        # Grammars are interned to small integers; |self.grammars| maps the
+        # integer back to the grammar (a dict).
+        self.grammars = []
+        self.__grammarIds = {}
         # A row on screen will consist of one or more ParserNodes. When a
         # ParserNode is returned from the parser it will be an instance of
-        # ParserNode, but internally tuples are used in place of ParserNodes.
-        # This makes for some ugly code, but the performance difference (~5%) is
-        # worth it.
-        self.parserNodes = [({}, 0, None, 0)]
-        # Each entry in |self.rows| is an index into the |self.parserNodes|
-        # array to the parerNode that begins that row.
-        self.rows = [0]  # Row parserNodes index.
+        # ParserNode, but internally the nodes are held as columns in parallel
+        # arrays (the grammar id, begin offset, prior index, and visual
+        # offset of each node). A large document has millions of nodes; the
+        # arrays use a fraction of the memory of a list of tuples.
+        self.nodeGrammar = array.array('i', [self.grammarId({})])
+        self.nodeBegin = array.array(kIntType, [0])
+        self.nodePrior = array.array(kIntType, [kNoPrior])
+        self.nodeVisual = array.array(kIntType, [0])
+        # Each entry in |self.rows| is an index into the node arrays for the
+        # node that begins that row.
+        self.rows = array.array(kIntType, [0])
+        # The result of the prior parse, used by __buildGrammarList() to reuse
+        # the tail of the prior parse when re-parsing after an edit. See
+        # __prepareResync().
+        self.__resync = None
+        # A cache of rowIndex(self.data), see __fastLineParse().
+        self.__rowIndexData = None
+        self.__rowIndex = None
+        # How many rows the most recent parse() copied from the prior parse
+        # rather than parsing again (for debugging and testing).
+        self.reusedRowCount = 0
+        # A parse of a few rows past fullyParsedToLine, from a guessed starting
+        # state. See parseWindow().
+        self.__window = None
+        self.__windowBeginRow = 0
+        self.__windowEndRow = 0
         app.log.parser('__init__')
 
+    def grammarId(self, grammar):
+        """Get the small integer used for |grammar| in self.nodeGrammar."""
+        key = id(grammar)
+        grammarId = self.__grammarIds.get(key)
+        if grammarId is None:
+            grammarId = len(self.grammars)
+            # Holding the grammar in |self.grammars| also keeps its id() unique.
+            self.grammars.append(grammar)
+            self.__grammarIds[key] = grammarId
+        return grammarId
+
+    def __appendNode(self, grammarId, begin, prior, visual):
+        self.nodeGrammar.append(grammarId)
+        self.nodeBegin.append(begin)
+        self.nodePrior.append(prior)
+        self.nodeVisual.append(visual)
+
+    def __truncateNodes(self, count):
+        """Keep the first |count| nodes. This makes new arrays (rather than
+        deleting in place) so the prior parse remains intact for reuse."""
+        self.nodeGrammar = self.nodeGrammar[:count]
+        self.nodeBegin = self.nodeBegin[:count]
+        self.nodePrior = self.nodePrior[:count]
+        self.nodeVisual = self.nodeVisual[:count]
+
+    def nodeCount(self):
+        return len(self.nodeBegin)
+
+    def nodeTuple(self, index):
+        """Get the node at |index| as (grammar, begin, prior, visual). A prior
+        of None means the node has no prior."""
+        prior = self.nodePrior[index]
+        return (self.grammars[self.nodeGrammar[index]], self.nodeBegin[index],
+                None if prior == kNoPrior else prior, self.nodeVisual[index])
+
     def grammarIndexFromRowCol(self, row, col):
         """
         Returns:
             index. |index| may then be passed to grammarAtIndex().
         """
-        if row + 1 >= len(
-                self.rows):  # or self.rows[row + 1] > len(self.parserNodes):
+        window, windowRow = self.__windowForRow(row)
+        if window is not None:
+            return window.grammarIndexFromRowCol(windowRow, col)
+        if row + 1 >= len(self.rows):
             # This file is too large. There's other ways to handle this, but for
             # now let's leave the tail un-highlighted.
             return 0
-        gl = self.parserNodes[self.rows[row]:self.rows[row + 1]] + [
-            self.endNode
-        ]
-        offset = gl[0][kVisual] + col
-        # Binary search to find the node for the column.
+        begin = self.rows[row]
+        end = self.rows[row + 1]
+        visuals = self.nodeVisual
+        offset = visuals[begin] + col
+        # Binary search to find the node for the column. The node past the end
+        # of the row is treated as ending at sys.maxsize.
         low = 0
-        high = len(gl) - 1
+        high = end - begin
         while True:
             index = (high + low) // 2
-            if offset >= gl[index + 1][kVisual]:
+            nodeIndex = begin + index
+            if nodeIndex + 1 < end and offset >= visuals[nodeIndex + 1]:
                 low = index
-            elif offset < gl[index][kVisual]:
+            elif offset < visuals[nodeIndex]:
                 high = index
             else:
                 return index
@@ -122,21 +301,25 @@ class Parser:
             (node, preceding, remaining). |proceeding| and |remaining| are
             relative to the |col| parameter.
         """
+        window, windowRow = self.__windowForRow(row)
+        if window is not None:
+            return window.grammarAtIndex(windowRow, col, index)
         finalResult = (self.emptyNode, col, sys.maxsize)
         if row >= len(self.rows):
             return finalResult
         rowIndex = self.rows[row]
-        if rowIndex + index >= len(self.parserNodes):
+        nodeCount = len(self.nodeBegin)
+        if rowIndex + index >= nodeCount:
             return finalResult
-        offset = self.parserNodes[rowIndex][kVisual] + col
+        offset = self.nodeVisual[rowIndex] + col
         nextOffset = sys.maxsize
-        if rowIndex + index + 1 < len(self.parserNodes):
-            nextOffset = self.parserNodes[rowIndex + index + 1][kVisual]
+        if rowIndex + index + 1 < nodeCount:
+            nextOffset = self.nodeVisual[rowIndex + index + 1]
         remaining = nextOffset - offset
         if remaining < 0:
             return finalResult
-        node = self.parserNodes[rowIndex + index]
-        return ParserNode(*node), offset - node[kVisual], remaining
+        node = ParserNode(*self.nodeTuple(rowIndex + index))
+        return node, offset - node.visual, remaining
 
     def parse(self, bgThread, appPrefs, data, grammar, beginRow, endRow):
         """
@@ -158,57 +341,197 @@ class Parser:
             beginRow = self.fullyParsedToLine
 
         self.emptyNode = ParserNode(grammar, None, None, 0)
+        oldData = self.data
+        oldNodes = (self.nodeGrammar, self.nodeBegin, self.nodePrior,
+                    self.nodeVisual)
+        oldRows = self.rows
+        oldFullyParsedToLine = self.fullyParsedToLine
+        if data is not oldData:
+            self.__window = None
         self.data = data
         self.endRow = endRow
         if beginRow > 0:  # and len(self.rows):
             if beginRow < len(self.rows):
-                self.parserNodes = self.parserNodes[:self.rows[beginRow]]
+                self.__truncateNodes(self.rows[beginRow])
                 self.rows = self.rows[:beginRow]
         else:
             # First time parse. Do a fast parse of the whole file.
-            self.parserNodes = [(grammar, 0, None, 0)]
-            self.rows = [0]
+            self.nodeGrammar = array.array('i', [self.grammarId(grammar)])
+            self.nodeBegin = array.array(kIntType, [0])
+            self.nodePrior = array.array(kIntType, [kNoPrior])
+            self.nodeVisual = array.array(kIntType, [0])
+            self.rows = array.array(kIntType, [0])
+        self.reusedRowCount = 0
         if self.endRow > len(self.rows):
+            self.__prepareResync(oldData, oldNodes, oldRows,
+                                 oldFullyParsedToLine)
             self.__buildGrammarList(bgThread, appPrefs)
+            self.__resync = None
         self.fullyParsedToLine = len(self.rows)
+        if self.fullyParsedToLine >= self.__windowEndRow:
+            # The window is superseded by the full parse.
+            self.__window = None
         self.__fastLineParse(grammar)
         #startTime = time.time()
         if app.log.enabledChannels.get('parser', False):
             self.debugLog(app.log.parser, data)
         #app.log.startup('parsing took', time.time() - startTime)
 
+    def parseWindow(self, appPrefs, grammar, beginRow, endRow):
+        """Parse rows |beginRow| to |endRow| of self.data ahead of the full
+        parse, so that they may be highlighted before the rows above them
+        are parsed (e.g. after jumping to the end of a large file).
+
+        The grammar state at |beginRow| may not be known until the rows above
+        it are parsed. When the window reaches up to the last fully parsed row,
+        the parse begins with the state of that row. Otherwise it begins with
+        a guess: |grammar| at a blank line a little above |beginRow|. The
+        result is used for rows at or past fullyParsedToLine and is dropped
+        when the full parse reaches |endRow| or the data changes (call parse()
+        first, so that self.data is current).
+        """
+        endRow = min(endRow, len(self.rows))
+        if beginRow >= endRow or self.fullyParsedToLine >= endRow:
+            return
+        if (self.__window is not None and
+                self.__windowBeginRow <= beginRow and
+                endRow <= self.__windowEndRow):
+            return
+        nodeBegin = self.nodeBegin
+        rows = self.rows
+        data = self.data
+        state = None
+        leadRow = beginRow - kWindowLeadRows
+        if leadRow < self.fullyParsedToLine:
+            # The last fully parsed row is the last one with a known state.
+            leadRow = max(self.fullyParsedToLine - 1, 0)
+            state = self.rowState(leadRow)
+            if state is None:
+                leadRow = max(self.fullyParsedToLine, 0)
+        windowBegin = nodeBegin[rows[leadRow]]
+        if state is None:
+            blankLine = data.rfind(u'\n\n', windowBegin,
+                                   nodeBegin[rows[beginRow]])
+            if blankLine != -1:
+                leadRow += data.count(u'\n', windowBegin, blankLine + 1)
+                windowBegin = blankLine + 1
+        if endRow < len(rows):
+            windowEnd = nodeBegin[rows[endRow]]
+        else:
+            windowEnd = len(data)
+        window = Parser()
+        windowData = data[windowBegin:windowEnd]
+        # The extra row completes the parse of the last row in the window.
+        if state is None:
+            window.parse(None, appPrefs, windowData, grammar, 0,
+                         endRow - leadRow + 1)
+        else:
+            window.__seedState([self.grammars[i] for i in state])
+            window.parse(None, appPrefs, windowData, grammar, 1,
+                         endRow - leadRow + 1)
+        self.__window = window
+        self.__windowBeginRow = leadRow
+        self.__windowEndRow = endRow
+
+    def __seedState(self, grammars):
+        """Start the first row in the state |grammars| (innermost first), so
+        that a parse from row 1 continues within those grammars.
+
+        The innermost grammar is repeated (as in a row that continues it), so
+        that the parse doesn't look for its 'begin' at the start of the row.
+        """
+        ids = [self.grammarId(grammar) for grammar in reversed(grammars)]
+        priors = [kNoPrior] + list(range(len(ids) - 1))
+        self.nodeGrammar = array.array('i', ids + ids[-1:])
+        self.nodeBegin = array.array(kIntType, [0] * (len(ids) + 1))
+        self.nodePrior = array.array(kIntType, priors + priors[-1:])
+        self.nodeVisual = array.array(kIntType, [0] * (len(ids) + 1))
+        self.rows = array.array(kIntType, [len(ids)])
+        self.fullyParsedToLine = 1
+
+    def __windowForRow(self, row):
+        """Returns (parser, row) for looking up |row| in the parseWindow()
+        result, or (None, row) if |row| is not in the window."""
+        if (self.__window is not None and self.fullyParsedToLine <= row and
+                self.__windowBeginRow <= row < self.__windowEndRow):
+            return self.__window, row - self.__windowBeginRow
+        return None, row
+
     def __fastLineParse(self, grammar):
+        """Add a plain node for each row that was not parsed (after the last
+        parsed row) and an end node."""
         data = self.data
-        index = self.parserNodes[self.rows[-1]][kBegin]
-        visual = self.parserNodes[self.rows[-1]][kVisual]
-        limit = len(data)
-        while True:
-            while index < limit and data[index] != '\n':
-                if data[index] >= app.curses_util.MIN_DOUBLE_WIDE_CHARACTER:
-                    visual += 2
-                else:
-                    visual += 1
-                index += 1
-            if index >= limit:
-                # New line not found.
-                break
-            index += 1
-            self.rows.append(len(self.parserNodes))
-            self.parserNodes.append((grammar, index, None, visual))
-        if self.parserNodes[-1][kBegin] != sys.maxsize:
+        if self.__rowIndexData is not data:
+            # The background parse calls parse() many times on the same data.
+            # Indexing the rows once keeps that from taking quadratic time.
+            self.__rowIndex = rowIndex(data)
+            self.__rowIndexData = data
+        begins, visuals, endVisual = self.__rowIndex
+        grammarId = self.grammarId(grammar)
+        index = self.nodeBegin[self.rows[-1]]
+        visual = self.nodeVisual[self.rows[-1]]
+        # The rows that begin after |index| are unparsed.
+        firstRow = bisect.bisect_right(begins, index)
+        priorRow = firstRow - 1
+        indexVisual = visuals[priorRow] + (index - begins[priorRow]) + len(
+            kReWideCharacter.findall(data, begins[priorRow], index))
+        visualDelta = visual - indexVisual
+        count = len(begins) - firstRow
+        nodeCount = len(self.nodeBegin)
+        self.rows.extend(range(nodeCount, nodeCount + count))
+        self.nodeGrammar.extend(array.array('i', [grammarId]) * count)
+        self.nodeBegin.extend(begins[firstRow:])
+        self.nodePrior.extend(array.array(kIntType, [kNoPrior]) * count)
+        if visualDelta:
+            self.nodeVisual.extend(
+                [i + visualDelta for i in visuals[firstRow:]])
+        else:
+            self.nodeVisual.extend(visuals[firstRow:])
+        if self.nodeBegin[-1] != sys.maxsize:
             # End node, points just past the end of the document.
-            self.parserNodes.append((grammar, sys.maxsize, None, visual))
+            self.__appendNode(grammarId, sys.maxsize, kNoPrior,
+                              endVisual + visualDelta)
 
     def rowCount(self):
         return len(self.rows)
 
+    def rowColFromOffset(self, offset):
+        """Get the (row, col) of |offset| within self.data."""
+        if self.__rowIndexData is not self.data:
+            self.__rowIndex = rowIndex(self.data)
+            self.__rowIndexData = self.data
+        begins = self.__rowIndex[0]
+        row = bisect.bisect_right(begins, offset) - 1
+        return row, offset - begins[row]
+
+    def rowState(self, row):
+        """The grammar state at the start of |row|, as a tuple of grammar ids
+        (innermost first). Rows with the same text and state are parsed the
+        same way.
+
+        Returns:
+          The state tuple, or None if it isn't known (e.g. the row is not fully
+          parsed yet, or the state includes a grammar with a dynamic end).
+        """
+        if row >= self.fullyParsedToLine or row >= len(self.rows):
+            return None
+        grammars = self.grammars
+        nodeGrammar = self.nodeGrammar
+        state = []
+        for index in self.__stateChain(self.nodePrior, self.rows[row]):
+            grammarId = nodeGrammar[index]
+            if grammars[grammarId].get('end_key'):
+                return None
+            state.append(grammarId)
+        return tuple(state)
+
     def rowText(self, row):
         if app.config.strict_debug:
             assert isinstance(row, int)
             assert isinstance(self.data, unicode)
-        begin = self.parserNodes[self.rows[row]][kBegin]
+        begin = self.nodeBegin[self.rows[row]]
         if row + 1 < len(self.rows):
-            end = self.parserNodes[self.rows[row + 1]][kBegin]
+            end = self.nodeBegin[self.rows[row + 1]]
             if len(self.data) and self.data[end - 1] == '\n':
                 end -= 1
         else:
@@ -216,48 +539,170 @@ class Parser:
         return self.data[begin:end]
 
     def rowTextAndWidth(self, row):
-        begin = self.parserNodes[self.rows[row]][kBegin]
-        visual = self.parserNodes[self.rows[row]][kVisual]
+        begin = self.nodeBegin[self.rows[row]]
+        visual = self.nodeVisual[self.rows[row]]
         if row + 1 < len(self.rows):
-            end = self.parserNodes[self.rows[row + 1]][kBegin]
-            visualEnd = self.parserNodes[self.rows[row + 1]][kVisual]
+            end = self.nodeBegin[self.rows[row + 1]]
+            visualEnd = self.nodeVisual[self.rows[row + 1]]
             if len(self.data) and self.data[end - 1] == '\n':
                 end -= 1
                 visualEnd -= 1
         else:
             # There is a sentinel node at the end that records the end of
             # document.
-            lastNode = self.parserNodes[-1]
-            end = lastNode[kBegin]
-            visualEnd = lastNode[kVisual]
+            end = self.nodeBegin[-1]
+            visualEnd = self.nodeVisual[-1]
         return self.data[begin:end], visualEnd - visual
 
+    def __prepareResync(self, oldData, oldNodes, oldRows,
+                        oldFullyParsedToLine):
+        """Set up self.__resync so that __buildGrammarList() may stop parsing
+        once it reaches text that was not changed (since the prior parse) and
+        the grammar state is the same as the prior parse had at that point.
+
+        Data before the node being resumed from is assumed unchanged (the
+        caller passes the first changed row as |beginRow| to parse()). Data
+        after the edit is found by comparing the tails of the old and new data.
+        """
+        self.__resync = None
+        # The last row with a fully parsed row start in the old parse.
+        lastRow = oldFullyParsedToLine - 1
+        if len(self.rows) >= lastRow or lastRow >= len(oldRows):
+            # There are no rows after the resume point to reuse. This is the
+            # case when the background parse continues an unchanged document.
+            return
+        resumeAt = self.nodeBegin[-1]
+        limit = min(len(oldData), len(self.data)) - resumeAt
+        if limit <= 0:
+            return
+        suffix = commonSuffixLength(oldData, self.data, limit)
+        if suffix == 0:
+            return
+        self.__resync = (oldNodes, oldRows, lastRow,
+                         len(self.data) - len(oldData), len(self.data) - suffix)
+
+    def __stateChain(self, nodePrior, index):
+        """The node indexes that make up the grammar stack at node |index|."""
+        chain = []
+        while index != kNoPrior:
+            chain.append(index)
+            index = nodePrior[index]
+        return chain
+
+    def __resyncWithOldParse(self):
+        """Try to splice the prior parse onto the current (new) one.
+
+        Called when the most recent node begins a row. If that row is in the
+        unchanged tail of the document and has the same grammar state as the
+        corresponding row of the prior parse, the nodes and rows of the prior
+        parse from there are appended (shifted to the new offsets).
+
+        Returns:
+          True if the prior parse was spliced in.
+        """
+        oldNodes, oldRows, lastRow, delta, tailBegin = self.__resync
+        oldGrammar, oldBegin, oldPrior, oldVisual = oldNodes
+        begin = self.nodeBegin[-1]
+        if begin < tailBegin:
+            return False
+        # Binary search for the old row that began at the same text.
+        oldRowBegin = begin - delta
+        low = 0
+        high = lastRow
+        while low < high:
+            mid = (low + high) // 2
+            if oldBegin[oldRows[mid]] < oldRowBegin:
+                low = mid + 1
+            else:
+                high = mid
+        oldRow = low
+        if oldRow >= lastRow:
+            return False
+        oldIndex = oldRows[oldRow]
+        if oldBegin[oldIndex] != oldRowBegin:
+            return False
+        newIndex = len(self.nodeBegin) - 1
+        oldChain = self.__stateChain(oldPrior, oldIndex)
+        newChain = self.__stateChain(self.nodePrior, newIndex)
+        if len(oldChain) != len(newChain):
+            return False
+        priorMap = {}
+        for oldChainIndex, newChainIndex in zip(oldChain, newChain):
+            grammarId = self.nodeGrammar[newChainIndex]
+            if (oldGrammar[oldChainIndex] != grammarId or
+                    self.grammars[grammarId].get('end_key')):
+                # A grammar with a dynamic end (end_key) may have a different
+                # end by now, so it can't be compared.
+                return False
+            priorMap[oldChainIndex] = newChainIndex
+        # The state matches. Copy the old nodes (up to and including the node
+        # that starts the |lastRow|), shifting them to the new positions.
+        nodeDelta = newIndex - oldIndex
+        visualDelta = self.nodeVisual[-1] - oldVisual[oldIndex]
+        tailStart = oldIndex + 1
+        tailEnd = oldRows[lastRow] + 1
+        priors = []
+        for prior in oldPrior[tailStart:tailEnd]:
+            if prior >= oldIndex:
+                prior += nodeDelta
+            elif prior != kNoPrior:
+                prior = priorMap.get(prior)
+                if prior is None:
+                    return False
+            priors.append(prior)
+        self.nodeGrammar.extend(oldGrammar[tailStart:tailEnd])
+        self.nodeBegin.extend(
+            [offset + delta for offset in oldBegin[tailStart:tailEnd]])
+        self.nodePrior.extend(priors)
+        self.nodeVisual.extend(
+            [visual + visualDelta for visual in oldVisual[tailStart:tailEnd]])
+        self.rows.extend(
+            [index + nodeDelta for index in oldRows[oldRow + 1:lastRow + 1]])
+        self.reusedRowCount = lastRow - oldRow
+        return True
+
     def __buildGrammarList(self, bgThread, appPrefs):
         # An arbitrary limit to avoid run-away looping.
         leash = 50000
-        topNode = self.parserNodes[-1]
-        cursor = topNode[kBegin]
-        visual = topNode[kVisual]
+        grammars = self.grammars
+        nodeGrammar = self.nodeGrammar
+        nodeBegin = self.nodeBegin
+        nodePrior = self.nodePrior
+        nodeVisual = self.nodeVisual
+        rows = self.rows
+        data = self.data
+        appendNode = self.__appendNode
+        textId = self.grammarId(appPrefs.grammars['text'])
+        errorId = self.grammarId(appPrefs.grammars['error'])
+        keywordId = self.grammarId(appPrefs.grammars['keyword'])
+        typeId = self.grammarId(appPrefs.grammars['type'])
+        specialId = self.grammarId(appPrefs.grammars['special'])
+        cursor = nodeBegin[-1]
+        visual = nodeVisual[-1]
         # If we are at the start of a grammar, skip the 'begin' part of the
         # grammar.
-        if (len(self.parserNodes) == 1 or
-                topNode[kGrammar] is not self.parserNodes[-2][kGrammar]):
-            beginRegex = topNode[kGrammar].get('begin')
-            if beginRegex is not None:
-                sre = re.match(beginRegex, self.data[cursor:])
+        if len(nodeBegin) == 1 or nodeGrammar[-1] != nodeGrammar[-2]:
+            beginRe = grammars[nodeGrammar[-1]].get('beginRe')
+            if beginRe is not None:
+                sre = beginRe.match(data, cursor)
                 if sre is not None:
-                    cursor += sre.regs[0][1]
-                    visual += sre.regs[0][1]  # Assumes single-wide characters.
-        while self.endRow > len(self.rows):
+                    # Assumes single-wide characters.
+                    visual += sre.end() - cursor
+                    cursor = sre.end()
+        while self.endRow > len(rows):
             if not leash:
                 #app.log.error('grammar likely caught in a loop')
                 break
             leash -= 1
             if bgThread and bgThread.hasUserEvent():
                 break
-            subdata = self.data[cursor:]
-            found = self.parserNodes[-1][kGrammar].get('matchRe').search(
-                subdata)
+            rowStarted = False
+            grammar = grammars[nodeGrammar[-1]]
+            # Search from |cursor| within |data|, rather than making a copy of
+            # the remainder of the document for each search. A look behind (or
+            # \b) sees the text before |cursor|, e.g. the new line that ends
+            # the prior row.
+            found = grammar.get('matchRe').search(data, cursor)
             if not found:
                 #app.log.info('parser exit, match not found')
                 # todo(dschuyler): mark parent grammars as unterminated (if they
@@ -270,6 +715,8 @@ class Parser:
                 if k is not None:
                     break
             reg = found.regs[index + 1]
+            # Make the match offsets relative to the |cursor|.
+            reg = (reg[0] - cursor, reg[1] - cursor)
             if index == 0:
                 # Found escaped value.
                 cursor += reg[1]
@@ -277,116 +724,87 @@ class Parser:
                 continue
             if index == len(foundGroups) - 1:
                 # Found new line.
-                child = (self.parserNodes[-1][kGrammar], cursor + reg[1],
-                         self.parserNodes[-1][kPrior], visual + reg[1])
+                rows.append(len(nodeBegin))
+                appendNode(nodeGrammar[-1], cursor + reg[1], nodePrior[-1],
+                           visual + reg[1])
                 cursor += reg[1]
                 visual += reg[1]
-                self.rows.append(len(self.parserNodes))
+                rowStarted = True
             elif index == len(foundGroups) - 2:
                 # Found double wide character.
-                self.parserNodes.append(
-                    (appPrefs.grammars['text'], cursor + reg[0],
-                     len(self.parserNodes) - 1, visual + reg[0]))
+                appendNode(textId, cursor + reg[0],
+                           len(nodeBegin) - 1, visual + reg[0])
                 # Resume the current grammar.
-                child = (
-                    self.parserNodes[self.parserNodes[-1][kPrior]][kGrammar],
-                    cursor + reg[1],
-                    self.parserNodes[self.parserNodes[-1][kPrior]][kPrior],
-                    visual + reg[1] * 2)
+                prior = nodePrior[-1]
+                appendNode(nodeGrammar[prior], cursor + reg[1],
+                           nodePrior[prior], visual + reg[1] * 2)
                 cursor += reg[1]
                 visual += reg[1] * 2
             elif index == 1:
                 # Found end of current grammar section (an 'end').
-                child = (
-                    self.parserNodes[self.parserNodes[-1][kPrior]][kGrammar],
-                    cursor + reg[1],
-                    self.parserNodes[self.parserNodes[-1][kPrior]][kPrior],
-                    visual + reg[1])
-                cursor = child[kBegin]
-                visual += reg[1]
-                if subdata[reg[1] - 1] == '\n':
+                if data[cursor + reg[1] - 1] == '\n':
                     # This 'end' ends with a new line.
-                    self.rows.append(len(self.parserNodes))
+                    rows.append(len(nodeBegin))
+                    rowStarted = True
+                prior = nodePrior[-1]
+                appendNode(nodeGrammar[prior], cursor + reg[1],
+                           nodePrior[prior], visual + reg[1])
+                cursor += reg[1]
+                visual += reg[1]
             else:
                 [
                     newGrammarIndexLimit, errorIndexLimit, keywordIndexLimit,
                     typeIndexLimit, specialIndexLimit
-                ] = self.parserNodes[-1][kGrammar]['indexLimits']
+                ] = grammar['indexLimits']
                 if index < newGrammarIndexLimit:
                     # A new grammar within this grammar (a 'contains').
-                    if subdata[reg[0]] == '\n':
+                    if data[cursor + reg[0]] == '\n':
                         # This 'begin' begins with a new line.
-                        self.rows.append(len(self.parserNodes))
-                    priorGrammar = self.parserNodes[-1][kGrammar].get(
-                        'matchGrammars', [])[index]
+                        rows.append(len(nodeBegin))
+                    priorGrammar = grammar.get('matchGrammars', [])[index]
                     if priorGrammar.get('end_key'):
                         # A dynamic end tag.
-                        hereKey = re.search(priorGrammar['end_key'],
-                                            subdata[reg[0]:]).groups()[0]
+                        hereKey = priorGrammar['endKeyRe'].search(
+                            data, cursor + reg[0]).groups()[0]
                         markers = priorGrammar['markers']
                         markers[1] = priorGrammar['end'].replace(
                             r'\0', re.escape(hereKey))
                         priorGrammar['matchRe'] = re.compile(
-                            app.regex.joinReList(markers))
-                    child = (priorGrammar, cursor + reg[0],
-                             len(self.parserNodes) - 1, visual + reg[0])
+                            app.regex.joinReList(markers), re.MULTILINE)
+                    appendNode(self.grammarId(priorGrammar), cursor + reg[0],
+                               len(nodeBegin) - 1, visual + reg[0])
                     cursor += reg[1]
                     visual += reg[1]
+                    continue
                 elif index < errorIndexLimit:
                     # A special doesn't change the nodeIndex.
-                    self.parserNodes.append(
-                        (appPrefs.grammars['error'], cursor + reg[0],
-                         len(self.parserNodes) - 1, visual + reg[0]))
-                    # Resume the current grammar.
-                    child = (
-                        self.parserNodes[self.parserNodes[-1]
-                                         [kPrior]][kGrammar], cursor + reg[1],
-                        self.parserNodes[self.parserNodes[-1][kPrior]][kPrior],
-                        visual + reg[1])
-                    cursor += reg[1]
-                    visual += reg[1]
+                    specialNodeId = errorId
                 elif index < keywordIndexLimit:
                     # A keyword doesn't change the nodeIndex.
-                    self.parserNodes.append(
-                        (appPrefs.grammars['keyword'], cursor + reg[0],
-                         len(self.parserNodes) - 1, visual + reg[0]))
-                    # Resume the current grammar.
-                    child = (
-                        self.parserNodes[self.parserNodes[-1]
-                                         [kPrior]][kGrammar], cursor + reg[1],
-                        self.parserNodes[self.parserNodes[-1][kPrior]][kPrior],
-                        visual + reg[1])
-                    cursor += reg[1]
-                    visual += reg[1]
+                    specialNodeId = keywordId
                 elif index < typeIndexLimit:
                     # A type doesn't change the nodeIndex.
-                    self.parserNodes.append(
-                        (appPrefs.grammars['type'], cursor + reg[0],
-                         len(self.parserNodes) - 1, visual + reg[0]))
-                    # Resume the current grammar.
-                    child = (
-                        self.parserNodes[self.parserNodes[-1]
-                                         [kPrior]][kGrammar], cursor + reg[1],
-                        self.parserNodes[self.parserNodes[-1][kPrior]][kPrior],
-                        visual + reg[1])
-                    cursor += reg[1]
-                    visual += reg[1]
+                    specialNodeId = typeId
                 elif index < specialIndexLimit:
                     # A special doesn't change the nodeIndex.
-                    self.parserNodes.append(
-                        (appPrefs.grammars['special'], cursor + reg[0],
-                         len(self.parserNodes) - 1, visual + reg[0]))
-                    # Resume the current grammar.
-                    child = (
-                        self.parserNodes[self.parserNodes[-1]
-                                         [kPrior]][kGrammar], cursor + reg[1],
-                        self.parserNodes[self.parserNodes[-1][kPrior]][kPrior],
-                        visual + reg[1])
-                    cursor += reg[1]
-                    visual += reg[1]
+                    specialNodeId = specialId
                 else:
                     app.log.error('invalid grammar index')
-            self.parserNodes.append(child)
+                    continue
+                appendNode(specialNodeId, cursor + reg[0], len(nodeBegin) - 1,
+                           visual + reg[0])
+                # Resume the current grammar.
+                prior = nodePrior[-1]
+                appendNode(nodeGrammar[prior], cursor + reg[1],
+                           nodePrior[prior], visual + reg[1])
+                cursor += reg[1]
+                visual += reg[1]
+            if rowStarted and self.__resync is not None:
+                if self.__resyncWithOldParse():
+                    # Continue from the end of the reused rows.
+                    self.__resync = None
+                    cursor = nodeBegin[-1]
+                    visual = nodeVisual[-1]
 
     def debugLog(self, out, data):
         out('parser debug:')
@@ -395,13 +813,91 @@ class Parser:
             if i + 1 < len(self.rows):
                 end = self.rows[i + 1]
             else:
-                end = sys.maxsize
+                end = len(self.nodeBegin)
             out('row', i, '(line', str(i + 1) + ') index', start, 'to', end)
-            for node in self.parserNodes[start:end]:
-                if node is None:
-                    out('a None')
-                    continue
-                nodeBegin = node[kBegin]
+            for index in range(start, end):
+                grammar, nodeBegin, prior, visual = self.nodeTuple(index)
                 out('  ParserNode %26s prior %4s, b%4d, v%4d, %s' % (
-                    node[kGrammar].get('name', 'None'), node[kPrior], nodeBegin,
-                    node[kVisual], repr(data[nodeBegin:nodeBegin + 15])[1:-1]))
+                    grammar.get('name', 'None'), prior, nodeBegin, visual,
+                    repr(data[nodeBegin:nodeBegin + 15])[1:-1]))
+
+
+class WindowParser:
+    """Parses only the rows near the view of a (large) document.
+
+    This has the row and grammar lookup API of a Parser, but reads the rows
+    from a list of lines (e.g. a LineStore reading from an
+    app.mapped_file.MappedFile) rather than from one string of the whole
+    document. Only the rows passed to parse() (and a few above them, to
+    begin at a blank line) are highlighted; the rest of the document is
+    never held in memory as a single string.
+    """
+
+    def __init__(self):
+        self.lines = []
+        self.emptyNode = ParserNode({}, None, None, 0)
+        self.fullyParsedToLine = -1
+        self.__parser = None
+        self.__version = None
+        self.__beginRow = 0
+        self.__endRow = 0
+
+    def parse(self, appPrefs, lines, grammar, beginRow, endRow):
+        """Highlight rows |beginRow| to |endRow| of |lines|."""
+        self.lines = lines
+        self.emptyNode = ParserNode(grammar, None, None, 0)
+        # There's nothing for a background parse to do.
+        self.fullyParsedToLine = len(lines)
+        endRow = min(endRow, len(lines))
+        version = lines.version()
+        if (self.__parser is not None and self.__version == version and
+                self.__beginRow <= beginRow and endRow <= self.__endRow):
+            return
+        leadRow = max(0, beginRow - kWindowLeadRows)
+        leadLines = lines[leadRow:beginRow]
+        for i in range(len(leadLines) - 1, -1, -1):
+            if not leadLines[i]:
+                leadRow += i
+                break
+        parser = Parser()
+        # The extra row completes the parse of the last row in the window.
+        parser.parse(None, appPrefs, u"\n".join(lines[leadRow:endRow]), grammar,
+                     0, endRow - leadRow + 1)
+        self.__parser = parser
+        self.__version = version
+        self.__beginRow = leadRow
+        self.__endRow = endRow
+
+    def __windowForRow(self, row):
+        if (self.__parser is not None and
+                self.__version == self.lines.version() and
+                self.__beginRow <= row < self.__endRow):
+            return self.__parser, row - self.__beginRow
+        return None, row
+
+    def rowCount(self):
+        return len(self.lines)
+
+    def rowText(self, row):
+        return self.lines[row]
+
+    def rowTextAndWidth(self, row):
+        line = self.lines[row]
+        return line, len(line) + len(kReWideCharacter.findall(line))
+
+    def grammarIndexFromRowCol(self, row, col):
+        window, windowRow = self.__windowForRow(row)
+        if window is not None:
+            return window.grammarIndexFromRowCol(windowRow, col)
+        return 0
+
+    def grammarAt(self, row, col):
+        grammarIndex = self.grammarIndexFromRowCol(row, col)
+        node, _, _ = self.grammarAtIndex(row, col, grammarIndex)
+        return node.grammar
+
+    def grammarAtIndex(self, row, col, index):
+        window, windowRow = self.__windowForRow(row)
+        if window is not None:
+            return window.grammarAtIndex(windowRow, col, index)
+        return self.emptyNode, col, sys.maxsize
@@ -22,11 +22,11 @@ except NameError:
     unichr = chr
 
 import os
-import re
 import time
 
 import app.buffer_file
 import app.controller
+import app.regex
 
 
 class PredictionListController(app.controller.Controller):
@@ -101,7 +101,7 @@ class PredictionListController(app.controller.Controller):
                         items.append((None, chromiumPath, '=', 'alt'))
                         added.add(chromiumPath)
         if self.filter is not None:
-            regex = re.compile(self.filter)
+            regex = app.regex.cachedCompile(self.filter)
             i = 0
             while i < len(items):
                 if not regex.search(items[i][1]):
@@ -182,8 +182,16 @@ class Prefs():
             # Index [-1]
             markers.append(r'\n')
             #app.log.startup('markers', v['name'], markers)
-            v['matchRe'] = re.compile(app.regex.joinReList(markers))
+            # The parser searches from an offset within the whole document
+            # (rather than a copy of the remaining text), so '^' must match at
+            # the start of each line.
+            v['matchRe'] = re.compile(
+                app.regex.joinReList(markers), re.MULTILINE)
             v['markers'] = markers
+            if v.get('begin'):
+                v['beginRe'] = re.compile(v['begin'], re.MULTILINE)
+            if v.get('end_key'):
+                v['endKeyRe'] = re.compile(v['end_key'], re.MULTILINE)
             v['matchGrammars'] = matchGrammars
             newGrammarIndexLimit = 2 + len(v.get('contains', []))
             errorIndexLimit = newGrammarIndexLimit + len(v.get('errors', []))
@@ -194,9 +202,6 @@ class Prefs():
                                 keywordIndexLimit, typeIndexLimit,
                                 specialIndexLimit)
 
-        # Reset the re.cache for user regexes.
-        re.purge()
-
     def __setUpFileTypes(self, defaultFileTypes):
         self.nameToType = {}
         self.extensions = {}
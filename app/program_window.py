@@ -162,6 +162,7 @@ class ProgramWindow(app.window.ActiveWindow):
         return finished
 
     def shortTimeSlice(self):
+        self.program.history.runSavedCallbacks()
         win = self.focusedWindow
         while win is not None and win is not self:
             win.shortTimeSlice()
@@ -302,7 +303,7 @@ class ProgramWindow(app.window.ActiveWindow):
         if self.showLogWindow:
             inputWidth = min(88, cols)
             debugWidth = max(cols - inputWidth - 1, 0)
-            debugRows = 20
+            debugRows = 24
             self.debugWindow.reshape(0, inputWidth + 1, debugRows, debugWidth)
             self.debugUndoWindow.reshape(debugRows, inputWidth + 1,
                                          rows - debugRows, debugWidth)
@@ -0,0 +1,369 @@
+# Copyright 2018 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+  Find text in the files of a directory tree (a project).
+
+  A walker thread lists the files (skipping those excluded by .gitignore
+  files) and hands them, a batch at a time, to a pool of worker processes that
+  search them. Results arrive while the search runs, so they may be shown
+  right away. A search can be cancelled (e.g. when the query changes).
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+import io
+import os
+import re
+import sys
+import threading
+
+import app.log
+import app.parallel_parser
+
+# The number of files given to a worker process at a time.
+kBatchFiles = 32
+
+# Files that have a zero byte within this many bytes of the start are treated
+# as binary and skipped.
+kBinaryCheckBytes = 8192
+
+# Files larger than this are skipped.
+kMaxFileBytes = 32 * 1024 * 1024
+
+# At most this many matching lines are reported for each file.
+kMaxFileResults = 1000
+
+# Directories that are never searched.
+kSkipDirs = set([u'.git', u'.hg', u'.svn'])
+
+# Patterns using any of these may match a line on its own but not where that
+# line sits within the whole file (e.g. \A only matches the first line), so
+# they can't be checked against the whole file first.
+kLineOnlyTokens = (u'\\A', u'\\Z', u'(?<!', u'(?!')
+
+
+def _globToRegex(glob):
+    """Convert a .gitignore glob into a regex (string)."""
+    out = []
+    i = 0
+    size = len(glob)
+    while i < size:
+        c = glob[i]
+        if glob.startswith(u'**/', i):
+            out.append(u'(?:.*/)?')
+            i += 3
+            continue
+        if glob.startswith(u'**', i):
+            out.append(u'.*')
+            i += 2
+            continue
+        if c == u'*':
+            out.append(u'[^/]*')
+        elif c == u'?':
+            out.append(u'[^/]')
+        elif c == u'[':
+            end = glob.find(u']', i + 2)
+            if end == -1:
+                out.append(u'\\[')
+            else:
+                charSet = glob[i + 1:end]
+                if charSet.startswith(u'!'):
+                    charSet = u'^' + charSet[1:]
+                out.append(u'[%s]' % (charSet.replace(u'\\', u'\\\\'),))
+                i = end
+        elif c == u'\\' and i + 1 < size:
+            i += 1
+            out.append(re.escape(glob[i]))
+        else:
+            out.append(re.escape(c))
+        i += 1
+    return u''.join(out) + u'$'
+
+
+class IgnoreRules:
+    """The rules of a .gitignore file (or several, see extend())."""
+
+    def __init__(self, rules=None):
+        # A list of (regex, isNegated, isDirOnly, isAnchored, basePath).
+        self.rules = rules or []
+
+    def extend(self, path, basePath):
+        """Make new IgnoreRules that adds the rules from the file at |path| to
+        these rules. Patterns in the file are relative to |basePath| (which is
+        relative to the search root, using '/' separators).
+
+        Returns:
+          The new IgnoreRules, or self if the file can't be read.
+        """
+        try:
+            with io.open(path, encoding=u'utf-8', errors=u'replace') as f:
+                lines = f.read().splitlines()
+        except (IOError, OSError):
+            return self
+        rules = list(self.rules)
+        for line in lines:
+            line = line.rstrip()
+            if not line or line.startswith(u'#'):
+                continue
+            isNegated = line.startswith(u'!')
+            if isNegated:
+                line = line[1:]
+            isDirOnly = line.endswith(u'/')
+            line = line.rstrip(u'/')
+            isAnchored = u'/' in line
+            line = line.lstrip(u'/')
+            if not line:
+                continue
+            rules.append((re.compile(_globToRegex(line)), isNegated, isDirOnly,
+                          isAnchored, basePath))
+        return IgnoreRules(rules)
+
+    def isIgnored(self, relPath, isDir):
+        """Whether |relPath| (relative to the search root, using '/'
+        separators) is excluded. The last matching rule decides."""
+        name = relPath.rsplit(u'/', 1)[-1]
+        ignored = False
+        for regex, isNegated, isDirOnly, isAnchored, basePath in self.rules:
+            if isDirOnly and not isDir:
+                continue
+            if isAnchored:
+                if basePath:
+                    if not relPath.startswith(basePath + u'/'):
+                        continue
+                    target = relPath[len(basePath) + 1:]
+                else:
+                    target = relPath
+            else:
+                target = name
+            if regex.match(target):
+                ignored = not isNegated
+        return ignored
+
+
+def walkFiles(root):
+    """Generate the paths (relative to |root|) of the files in the tree at
+    |root| that aren't excluded by a .gitignore file."""
+    rulesByDir = {u'': IgnoreRules()}
+    for dirPath, dirNames, fileNames in os.walk(root):
+        relDir = os.path.relpath(dirPath, root).replace(os.sep, u'/')
+        if relDir == u'.':
+            relDir = u''
+        rules = rulesByDir.pop(relDir, IgnoreRules())
+        if u'.gitignore' in fileNames:
+            rules = rules.extend(
+                os.path.join(dirPath, u'.gitignore'), relDir)
+
+        def relPath(name):
+            return relDir + u'/' + name if relDir else name
+
+        keptDirs = []
+        for name in sorted(dirNames):
+            if name in kSkipDirs or rules.isIgnored(relPath(name), True):
+                continue
+            keptDirs.append(name)
+            rulesByDir[relPath(name)] = rules
+        # Only walk into the kept directories.
+        dirNames[:] = keptDirs
+        for name in sorted(fileNames):
+            if not rules.isIgnored(relPath(name), False):
+                yield relPath(name)
+
+
+def searchFiles(args):
+    """Search a batch of files (in a worker process).
+
+    Args:
+      args (tuple): (root, relPaths, pattern, flags).
+
+    Returns:
+      A list of (relPath, row, col, line) for each matching line.
+    """
+    root, relPaths, pattern, flags = args
+    regex = re.compile(pattern, flags)
+    # Matches wherever |regex| matches a line (and maybe a few other places).
+    fileRegex = None
+    if not flags & re.DOTALL and u'(?s' not in pattern and not any(
+            token in pattern for token in kLineOnlyTokens):
+        fileRegex = re.compile(pattern, flags | re.MULTILINE)
+    results = []
+    for relPath in relPaths:
+        path = os.path.join(root, relPath)
+        try:
+            if os.path.getsize(path) > kMaxFileBytes:
+                continue
+            with io.open(path, 'rb') as f:
+                data = f.read()
+        except (IOError, OSError):
+            continue
+        if b'\0' in data[:kBinaryCheckBytes]:
+            continue
+        text = data.decode(u'utf-8', u'replace')
+        # Split lines as the editor does (see Actions.doDataToLines()).
+        text = text.replace(u'\r\n', u'\n').replace(u'\r', u'\n')
+        # Most files don't match, so check the whole file before going line
+        # by line.
+        if fileRegex is not None and not fileRegex.search(text):
+            continue
+        lines = text.split(u'\n')
+        count = 0
+        for row, line in enumerate(lines):
+            found = regex.search(line)
+            if found:
+                results.append((relPath, row, found.start(), line))
+                count += 1
+                if count >= kMaxFileResults:
+                    break
+    return results
+
+
+class ProjectSearch:
+    """A search of the files in a directory tree. Call takeResults() to get
+    the results found so far."""
+
+    def __init__(self, root, pattern, flags, processCount=None, index=None):
+        """
+        Args:
+          root (str): The directory to search.
+          pattern (str): A regex, e.g. from app.regex.findPattern().
+          flags (int): re flags for |pattern|.
+          processCount (int): The number of worker processes.
+          index (TrigramIndex): Used to skip files that can't match, see
+              app.trigram_index.
+        """
+        re.compile(pattern, flags)  # Fail now if the pattern is bad.
+        self.root = root
+        self.pattern = pattern
+        self.flags = flags
+        self.index = index
+        self.fileCount = 0
+        self.__results = queue.Queue()
+        self.__cancelled = threading.Event()
+        # Batches handed to the pool, and batches finished (which are only
+        # changed with self.__lock held).
+        self.__lock = threading.Lock()
+        self.__batchCount = 0
+        self.__doneCount = 0
+        self.__walked = False
+        self.__poolStopped = False
+        # Not forked from this thread, see app.parallel_parser.poolContext().
+        context = app.parallel_parser.poolContext()
+        if processCount is None:
+            processCount = context.cpu_count()
+        self.pool = context.Pool(processCount)
+        self.__walker = threading.Thread(
+            target=self.__walk, name='project_search')
+        self.__walker.daemon = True
+        self.__walker.start()
+
+    def __walk(self):
+        try:
+            batch = []
+            relPaths = walkFiles(self.root)
+            if self.index is not None:
+                relPaths = self.index.filterFiles(relPaths, self.pattern,
+                                                  self.flags)
+            for relPath in relPaths:
+                if self.__cancelled.is_set():
+                    return
+                self.fileCount += 1
+                batch.append(relPath)
+                if len(batch) >= kBatchFiles:
+                    self.__submit(batch)
+                    batch = []
+            if batch:
+                self.__submit(batch)
+        except Exception as e:
+            app.log.exception(e)
+        finally:
+            with self.__lock:
+                if not self.__poolStopped:
+                    self.pool.close()
+                self.__walked = True
+            if not self.__cancelled.is_set() and self.index is not None:
+                # Catch up with files that changed.
+                self.index.updateInBackground()
+
+    def __submit(self, batch):
+        if self.__cancelled.is_set():
+            return
+        kwargs = {}
+        if sys.version_info[0] > 2:
+            # Without this a batch that fails is never done.
+            kwargs['error_callback'] = self.__onError
+        with self.__lock:
+            self.__batchCount += 1
+        self.pool.apply_async(
+            searchFiles, ((self.root, batch, self.pattern, self.flags),),
+            callback=self.__onResults,
+            **kwargs)
+
+    def __onError(self, error):
+        # Called on a thread of the pool.
+        app.log.exception(error)
+        self.__results.put([])
+
+    def __onResults(self, results):
+        # Called on a thread of the pool.
+        self.__results.put(results)
+
+    def __stopPool(self):
+        """Stop the worker processes (once)."""
+        with self.__lock:
+            if self.__poolStopped:
+                return
+            self.__poolStopped = True
+        self.pool.terminate()
+        self.pool.join()
+
+    def isDone(self):
+        """Whether all files have been searched (or the search was
+        cancelled)."""
+        if self.__cancelled.is_set():
+            return True
+        with self.__lock:
+            done = self.__walked and self.__doneCount >= self.__batchCount
+        if done:
+            # All the results are in, so the workers are idle.
+            self.__stopPool()
+        return done
+
+    def takeResults(self, timeout=0):
+        """Get the results that arrived since the last call, waiting up to
+        |timeout| seconds for some to arrive.
+
+        Returns:
+          A list of (relPath, row, col, line), sorted within each file.
+        """
+        results = []
+        try:
+            batch = self.__results.get(timeout > 0, timeout or None)
+            while True:
+                results.extend(batch)
+                with self.__lock:
+                    self.__doneCount += 1
+                batch = self.__results.get_nowait()
+        except queue.Empty:
+            pass
+        return results
+
+    def cancel(self):
+        """Stop searching."""
+        self.__cancelled.set()
+        self.__stopPool()
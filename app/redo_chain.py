@@ -0,0 +1,265 @@
+# Copyright 2018 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+  A compact serialization of a redo chain (see app.mutator.Mutator), for
+  keeping the undo history of a file in the user history.
+
+  The chain is split into chunks of kChunkChanges changes. Each chunk is
+  encoded on its own and zlib compressed:
+    - integers are written as (zigzag) varints.
+    - each distinct string is written once per chunk, then referred to by
+      index. A string is written as the prefix and suffix it shares with the
+      prior string plus the characters between them, so the '- old line' and
+      '+ new line' of a line diff cost little more than the change between
+      them.
+    - tuples and lists are written as a count followed by their items.
+
+  Whole chunks of the oldest changes are left out to keep the stored size
+  within a limit (the saveUndoLimit editor pref).
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import struct
+import zlib
+
+try:
+    unicode
+except NameError:
+    unicode = str
+
+import app.log
+
+# The number of changes encoded together.
+kChunkChanges = 64
+
+# Type tags for the encoded values.
+kNone = 0
+kTrue = 1
+kFalse = 2
+kInt = 3
+kNewString = 4
+kStringRef = 5
+kTuple = 6
+kList = 7
+kFloat = 8
+
+
+def writeVarint(out, value):
+    """Append the unsigned int |value| to the bytearray |out|."""
+    while value >= 0x80:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def readVarint(data, offset):
+    """Returns (value, offset after the varint)."""
+    value = 0
+    shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return value, offset
+        shift += 7
+
+
+class _ChunkWriter:
+
+    def __init__(self):
+        self.out = bytearray()
+        self.strings = {}
+        self.priorString = u''
+
+    def writeString(self, value):
+        index = self.strings.get(value)
+        if index is not None:
+            self.out.append(kStringRef)
+            writeVarint(self.out, index)
+            return
+        self.strings[value] = len(self.strings)
+        prior = self.priorString
+        self.priorString = value
+        limit = min(len(prior), len(value))
+        prefix = 0
+        while prefix < limit and prior[prefix] == value[prefix]:
+            prefix += 1
+        suffix = 0
+        limit -= prefix
+        while (suffix < limit and
+               prior[-1 - suffix] == value[-1 - suffix]):
+            suffix += 1
+        middle = value[prefix:len(value) - suffix].encode(u'utf-8')
+        self.out.append(kNewString)
+        writeVarint(self.out, prefix)
+        writeVarint(self.out, suffix)
+        writeVarint(self.out, len(middle))
+        self.out.extend(middle)
+
+    def write(self, value):
+        out = self.out
+        if value is None:
+            out.append(kNone)
+        elif value is True:
+            out.append(kTrue)
+        elif value is False:
+            out.append(kFalse)
+        elif isinstance(value, (str, unicode)):
+            if isinstance(value, bytes):
+                # Python 2 str.
+                value = value.decode(u'utf-8')
+            self.writeString(value)
+        elif isinstance(value, int) or type(value).__name__ == 'long':
+            out.append(kInt)
+            writeVarint(out, value * 2 if value >= 0 else -value * 2 - 1)
+        elif isinstance(value, (tuple, list)):
+            out.append(kTuple if isinstance(value, tuple) else kList)
+            writeVarint(out, len(value))
+            for item in value:
+                self.write(item)
+        elif isinstance(value, float):
+            out.append(kFloat)
+            out.extend(struct.pack('<d', value))
+        else:
+            raise TypeError(u'unexpected type in redo chain: %r' % (value,))
+
+
+class _ChunkReader:
+
+    def __init__(self, data):
+        self.data = bytearray(data)
+        self.offset = 0
+        self.strings = []
+        self.priorString = u''
+
+    def varint(self):
+        value, self.offset = readVarint(self.data, self.offset)
+        return value
+
+    def read(self):
+        tag = self.data[self.offset]
+        self.offset += 1
+        if tag == kNone:
+            return None
+        elif tag == kTrue:
+            return True
+        elif tag == kFalse:
+            return False
+        elif tag == kInt:
+            value = self.varint()
+            return value >> 1 if not value & 1 else -(value >> 1) - 1
+        elif tag == kNewString:
+            prefix = self.varint()
+            suffix = self.varint()
+            size = self.varint()
+            middle = bytes(self.data[self.offset:self.offset + size]).decode(
+                u'utf-8')
+            self.offset += size
+            prior = self.priorString
+            value = (prior[:prefix] + middle +
+                     prior[len(prior) - suffix:len(prior)])
+            self.strings.append(value)
+            self.priorString = value
+            return value
+        elif tag == kStringRef:
+            return self.strings[self.varint()]
+        elif tag in (kTuple, kList):
+            items = [self.read() for _ in range(self.varint())]
+            return tuple(items) if tag == kTuple else items
+        elif tag == kFloat:
+            value = struct.unpack('<d', bytes(
+                self.data[self.offset:self.offset + 8]))[0]
+            self.offset += 8
+            return value
+        raise ValueError(u'bad redo chain tag %d' % (tag,))
+
+
+def encodeChunk(changes):
+    """Encode a list of changes (see module doc) as bytes."""
+    writer = _ChunkWriter()
+    writeVarint(writer.out, len(changes))
+    for change in changes:
+        writer.write(change)
+    return zlib.compress(bytes(writer.out))
+
+
+def decodeChunk(data):
+    """The inverse of encodeChunk()."""
+    reader = _ChunkReader(zlib.decompress(data))
+    return [reader.read() for _ in range(reader.varint())]
+
+
+def decodeRedoChain(chunks):
+    """Get the redo chain (a list) from the chunks made by
+    RedoChainEncoder.encode()."""
+    redoChain = []
+    for chunk in chunks:
+        redoChain.extend(decodeChunk(chunk))
+    return redoChain
+
+
+class RedoChainEncoder:
+    """Encodes the redo chain of a buffer each time it's saved.
+
+    Chunks of changes that were encoded by a prior save (and haven't changed
+    since) are reused, so a save only encodes the most recent changes.
+    """
+
+    def __init__(self):
+        # Keyed by the index of the first change in the chunk. Each value is
+        # (changes, encoded bytes).
+        self.__chunks = {}
+
+    def encode(self, redoChain, savedAtRedoIndex, maxBytes=None):
+        """
+        Args:
+          redoChain (list): The changes to encode.
+          savedAtRedoIndex (int): The redo index when the file was saved.
+              Changes after this index are always kept.
+          maxBytes (int): Leave out the oldest chunks (prior to
+              |savedAtRedoIndex|) to keep the result within this many bytes.
+              None for no limit.
+
+        Returns:
+          (chunks, dropped) where |chunks| is a list of bytes and |dropped| is
+          the number of changes left out of the start of the chain.
+        """
+        chunks = {}
+        for begin in range(0, len(redoChain), kChunkChanges):
+            changes = redoChain[begin:begin + kChunkChanges]
+            cached = self.__chunks.get(begin)
+            if (cached is not None and len(cached[0]) == len(changes) and
+                    all(a is b for a, b in zip(cached[0], changes))):
+                chunks[begin] = cached
+            else:
+                chunks[begin] = (changes, encodeChunk(changes))
+        self.__chunks = chunks
+        kept = []
+        size = 0
+        for begin in sorted(chunks, reverse=True):
+            data = chunks[begin][1]
+            size += len(data)
+            if (maxBytes is not None and size > maxBytes and
+                    begin + kChunkChanges <= savedAtRedoIndex):
+                app.log.info(u'undo history dropped', begin + kChunkChanges,
+                             u'changes')
+                kept.reverse()
+                return kept, begin + kChunkChanges
+            kept.append(data)
+        kept.reverse()
+        return kept, 0
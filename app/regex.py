@@ -16,7 +16,87 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import collections
 import re
+import threading
+
+# The most compiled regexes kept by cachedCompile().
+kCacheSize = 256
+
+# Compiled regexes keyed by (pattern, flags), least recently used first.
+_cache = collections.OrderedDict()
+_cacheLock = threading.Lock()
+cacheHits = 0
+cacheMisses = 0
+
+
+def cachedCompile(pattern, flags=0):
+    """Compile |pattern|, reusing the result of a recent call with the same
+    |pattern| and |flags|. Use this for patterns that come from the user or
+    are built while editing (rather than the module level constants).
+
+    Raises:
+      re.error if |pattern| is not a valid regex.
+    """
+    global cacheHits, cacheMisses
+    key = (pattern, flags)
+    with _cacheLock:
+        regex = _cache.pop(key, None)
+        if regex is not None:
+            cacheHits += 1
+            _cache[key] = regex
+            return regex
+    regex = re.compile(pattern, flags)
+    with _cacheLock:
+        cacheMisses += 1
+        _cache[key] = regex
+        while len(_cache) > kCacheSize:
+            _cache.popitem(last=False)
+    return regex
+
+
+def cacheStats():
+    """Get (hits, misses, size) for cachedCompile()."""
+    return (cacheHits, cacheMisses, len(_cache))
+
+
+def findPattern(searchFor, editorPrefs):
+    """Apply the find* editor prefs (e.g. findIgnoreCase, findUseRegex) to
+    |searchFor|.
+
+    Returns:
+      (pattern, flags) for re.compile().
+    """
+    flags = 0
+    flags |= (editorPrefs.get(u'findIgnoreCase') and re.IGNORECASE or 0)
+    flags |= (editorPrefs.get(u'findMultiLine') and re.MULTILINE or 0)
+    flags |= (editorPrefs.get(u'findLocale') and re.LOCALE or 0)
+    flags |= (editorPrefs.get(u'findDotAll') and re.DOTALL or 0)
+    flags |= (editorPrefs.get(u'findVerbose') and re.VERBOSE or 0)
+    flags |= (editorPrefs.get(u'findUnicode') and re.UNICODE or 0)
+    if not editorPrefs.get(u'findUseRegex'):
+        searchFor = re.escape(searchFor)
+    if editorPrefs.get(u'findWholeWord'):
+        searchFor = r"\b%s\b" % searchFor
+    return searchFor, flags
+
+
+def searchBackward(regex, text, endCol=None):
+    """Find the last match of |regex| in |text| that begins before |endCol|
+    (or anywhere in |text| if |endCol| is None).
+
+    The matches are found going forward, so this costs about the same as a
+    forward search of |text| (rather than searching again from each match).
+
+    Returns:
+      A match object, or None.
+    """
+    found = None
+    for i in regex.finditer(text):
+        if endCol is not None and i.start() >= endCol:
+            break
+        found = i
+    return found
 
 
 def joinReList(reList):
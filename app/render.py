@@ -16,21 +16,236 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import itertools
+import time
+
+import app.curses_util
+
+# The least time (in seconds) between the start of one frame and the next, a
+# limit of 60 frames per second.
+kFrameTime = 1.0 / 60
+
+
+def _cells(text):
+    """The characters of |text|, one per cell. The second cell of a
+    double-wide character holds u''."""
+    wide = app.curses_util.MIN_DOUBLE_WIDE_CHARACTER
+    if not text or max(text) <= wide:
+        return list(text)
+    cells = []
+    for c in text:
+        cells.append(c)
+        if c > wide:
+            cells.append(u'')
+    return cells
+
+
+def _paint(chars, styles, col, text, style, limit=None):
+    """Write |text| into the cells |chars| and |styles| at |col|, over what
+    was there, growing the lists as needed (up to |limit| cells).
+
+    Returns:
+      The number of cells painted.
+    """
+    cells = _cells(text)
+    if col < 0:
+        cells = cells[-col:]
+        col = 0
+    if limit is not None and len(cells) > limit - col:
+        cells = cells[:max(0, limit - col)]
+        if cells and cells[-1] > app.curses_util.MIN_DOUBLE_WIDE_CHARACTER:
+            # Half of a double-wide character doesn't fit.
+            cells[-1] = u' '
+    end = col + len(cells)
+    if end > len(chars):
+        chars.extend([None] * (end - len(chars)))
+        styles.extend([None] * (end - len(styles)))
+    chars[col:end] = cells
+    styles[col:end] = [style] * len(cells)
+    return len(cells)
+
+
+def _fixWideCells(chars, styles):
+    """Forget the cells left over from a double-wide character that was partly
+    painted over (so they are painted again)."""
+    wide = app.curses_util.MIN_DOUBLE_WIDE_CHARACTER
+    limit = len(chars)
+    for i, c in enumerate(chars):
+        if c == u'':
+            if i == 0 or not chars[i - 1] or chars[i - 1] <= wide:
+                chars[i] = styles[i] = None
+        elif c is not None and c > wide:
+            if i + 1 == limit or chars[i + 1] != u'':
+                chars[i] = styles[i] = None
+
 
 class Frame:
+    """The text drawn by the windows for one render.
+
+    Windows draw in layers (e.g. the text, then the selection over it), so each
+    row is composited into cells as it is drawn. The frame is then grabbed as
+    the runs of cells that share a style, without the overdraw.
+    """
 
     def __init__(self):
         self.cursor = None
-        self.drawList = []
+        # A ([char], [style]) for each row that is drawn on.
+        self.cells = {}
 
     def addStr(self, row, col, text, style):
-        self.drawList.append((row, col, text, style))
+        cells = self.cells.get(row)
+        if cells is None:
+            cells = self.cells[row] = ([], [])
+        _paint(cells[0], cells[1], col, text, style)
 
     def setCursor(self, cursor):
         self.cursor = cursor
 
     def grabFrame(self):
-        r = self.drawList, self.cursor
-        self.drawList = []
+        """Take the frame (and start the next one).
+
+        Returns:
+          (drawList, cursor) where |drawList| is a list of (row, col, text,
+          style) runs that don't overlap.
+        """
+        drawList = []
+        for row in sorted(self.cells):
+            chars, styles = self.cells[row]
+            if u'' in chars:
+                _fixWideCells(chars, styles)
+            col = 0
+            for style, group in itertools.groupby(styles):
+                end = col + len(list(group))
+                if style is not None:
+                    drawList.append((row, col, u''.join(chars[col:end]),
+                                     style))
+                col = end
+        r = drawList, self.cursor
+        self.cells = {}
         self.cursor = None
         return r
+
+
+class Screen:
+    """The cells last written to the curses window.
+
+    Each frame's draw list is painted onto a copy of the cells and only the
+    runs of cells that differ from the prior frame are written to curses. Used
+    from the main thread (while the Frame is filled by the background thread).
+    """
+
+    def __init__(self):
+        self.reset(0, 0)
+        # The number of cells in the draw list and the number written to
+        # curses, for the last frame.
+        self.cellsDrawn = 0
+        self.cellsWritten = 0
+
+    def reset(self, rows, cols):
+        """Forget what is on the screen (e.g. after a resize)."""
+        self.rows = rows
+        self.cols = cols
+        # A cell holds a character and a style, or None if unknown.
+        self.chars = [[None] * cols for _ in range(rows)]
+        self.styles = [[None] * cols for _ in range(rows)]
+
+    def changes(self, drawList, rows, cols):
+        """Find the cells that |drawList| changes on a screen of |rows| by
+        |cols|.
+
+        Returns:
+          A list of (row, col, text, style) runs to write, with the text
+          encoded as utf-8.
+        """
+        if rows != self.rows or cols != self.cols:
+            self.reset(rows, cols)
+        newChars = {}
+        newStyles = {}
+        drawn = 0
+        for row, col, text, style in drawList:
+            if not (0 <= row < rows and col < cols):
+                continue
+            chars = newChars.get(row)
+            if chars is None:
+                chars = newChars[row] = self.chars[row][:]
+                styles = newStyles[row] = self.styles[row][:]
+            else:
+                styles = newStyles[row]
+            drawn += _paint(chars, styles, col, text, style, cols)
+        runs = []
+        written = 0
+        for row in sorted(newChars):
+            chars = newChars[row]
+            styles = newStyles[row]
+            oldChars = self.chars[row]
+            oldStyles = self.styles[row]
+            if chars == oldChars and styles == oldStyles:
+                continue
+            if u'' in chars or u'' in oldChars:
+                _fixWideCells(chars, styles)
+            col = 0
+            while col < cols:
+                c = chars[col]
+                if c is None or (c == oldChars[col] and
+                                 styles[col] == oldStyles[col]):
+                    col += 1
+                    continue
+                # The start of a run of changed cells with the same style.
+                begin = col - 1 if c == u'' else col
+                style = styles[col]
+                col += 1
+                while col < cols:
+                    c = chars[col]
+                    if c is None or styles[col] != style:
+                        break
+                    if (c != u'' and c == oldChars[col] and
+                            style == oldStyles[col]):
+                        break
+                    col += 1
+                runs.append((row, begin, u''.join(chars[begin:col]).encode(
+                    'utf-8'), style))
+                written += col - begin
+            self.chars[row] = chars
+            self.styles[row] = styles
+        self.cellsDrawn = drawn
+        self.cellsWritten = written
+        return runs
+
+
+class RenderScheduler:
+    """Decides when to render, and times the renders.
+
+    Input that arrives within kFrameTime of the prior frame is gathered into
+    the next frame, so a held key or a fast paste is rendered once per frame
+    (rather than once per batch of input). The first input after a pause is
+    rendered right away.
+    """
+
+    def __init__(self):
+        self.frameTime = kFrameTime
+        # When the last frame began rendering (from time.time()).
+        self.frameStart = 0.0
+        self.frameCount = 0
+        # The number of commands handled in the last frame.
+        self.frameCommands = 0
+        # The seconds spent rendering the last frame, and the most spent on
+        # any one frame.
+        self.renderTime = 0.0
+        self.renderTimePeak = 0.0
+
+    def timeUntilFrame(self):
+        """The seconds until the next frame is due (zero or less if it is
+        due now)."""
+        return self.frameStart + self.frameTime - time.time()
+
+    def render(self, window, commandCount):
+        """Render |window| (e.g. the ProgramWindow), having handled
+        |commandCount| commands since the prior frame."""
+        start = time.time()
+        window.render()
+        self.renderTime = time.time() - start
+        if self.renderTime > self.renderTimePeak:
+            self.renderTimePeak = self.renderTime
+        self.frameStart = start
+        self.frameCount += 1
+        self.frameCommands = commandCount
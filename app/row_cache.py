@@ -0,0 +1,61 @@
+# Copyright 2018 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+  A cache of the rendered segments of rows of text, so that the rows which are
+  still on screen after a scroll (or every row, after a cursor move) are not
+  highlighted again.
+
+  A row is keyed by its text, the grammar state it begins in, and the columns
+  drawn. The least recently used rows are dropped first.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import collections
+
+# The number of rows kept, a few screens full.
+kCacheSize = 1000
+
+
+class RowCache:
+    """Rendered rows, least recently used first."""
+
+    def __init__(self, size=kCacheSize):
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self.clear()
+
+    def clear(self):
+        self.__rows = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self.__rows)
+
+    def get(self, key):
+        """Get the value put() for |key|, or None."""
+        value = self.__rows.pop(key, None)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.__rows[key] = value
+        return value
+
+    def put(self, key, value):
+        self.__rows[key] = value
+        while len(self.__rows) > self.size:
+            self.__rows.popitem(last=False)
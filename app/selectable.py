@@ -18,6 +18,7 @@ from __future__ import print_function
 
 import re
 
+import app.line_store
 import app.log
 import app.regex
 
@@ -46,12 +47,25 @@ kSelectionModeNames = [
 ]
 
 
-class BaseLineBuffer:
+class BaseLineBuffer(object):
 
     def __init__(self):
+        self.__lines = None
         self.lines = [u""]
         self.message = (u"New buffer", None)
 
+    @property
+    def lines(self):
+        return self.__lines
+
+    @lines.setter
+    def lines(self, value):
+        """Lists of lines are kept in a LineStore, which allows the lines to be
+        edited without shifting the entire document."""
+        if isinstance(value, (list, tuple)):
+            value = app.line_store.LineStore(value)
+        self.__lines = value
+
     def isEmpty(self):
         return len(self.lines) == 1 and len(self.lines[0]) == 0
 
@@ -178,16 +192,14 @@ class Selectable(BaseLineBuffer):
               selectionMode == kSelectionCharacter or
               selectionMode == kSelectionLine or
               selectionMode == kSelectionWord):
-            lines.reverse()
             firstLine = self.lines[row]
             if len(lines) == 1:
                 self.lines[row] = (firstLine[:col] + lines[0] + firstLine[col:])
             else:
-                self.lines[row] = (firstLine[:col] + lines[-1])
-                currentRow = row + 1
-                self.lines.insert(currentRow, lines[0] + firstLine[col:])
-                for line in lines[1:-1]:
-                    self.lines.insert(currentRow, line)
+                # Replace the one row with all the new rows in a single step.
+                lines[0] = firstLine[:col] + lines[0]
+                lines[-1] = lines[-1] + firstLine[col:]
+                self.lines[row:row + 1] = lines
         else:
             app.log.info('selection mode not recognized', selectionMode)
 
@@ -23,6 +23,7 @@ import sys
 import app.actions
 import app.curses_util
 import app.regex
+import app.row_cache
 import app.log
 import app.parser
 import app.selectable
@@ -37,6 +38,8 @@ class TextBuffer(app.actions.Actions):
         self.highlightRe = None
         self.highlightCursorLine = False
         self.highlightTrailingWhitespace = True
+        self.rowCache = app.row_cache.RowCache()
+        self.__rowCacheParser = None
 
     def checkScrollToCursor(self, window):
         """Move the selected view rectangle so that the cursor is visible."""
@@ -125,67 +128,34 @@ class TextBuffer(app.actions.Actions):
         startCol = self.view.scrollCol + left
         endCol = startCol + cols
         appPrefs = self.view.program.prefs
-        defaultColor = appPrefs.color['default']
         spellChecking = appPrefs.editor.get('spellChecking', True)
         colorPrefs = self.view.program.color
-        spelling = self.program.dictionary
         if self.parser:
             # Highlight grammar.
-            rowLimit = min(max(self.parser.rowCount() - startRow, 0), rows)
+            parser = self.parser
+            if parser is not self.__rowCacheParser:
+                # Grammar ids are particular to a parser.
+                self.rowCache.clear()
+                self.__rowCacheParser = parser
+            isParser = isinstance(parser, app.parser.Parser)
+            rowLimit = min(max(parser.rowCount() - startRow, 0), rows)
             for i in range(rowLimit):
-                line, renderedWidth = self.parser.rowTextAndWidth(startRow + i)
-                k = startCol
-                if k == 0:
-                    # When rendering from column 0 the grammar index is always
-                    # zero.
-                    grammarIndex = 0
-                else:
-                    # When starting mid-line, find starting grammar index.
-                    grammarIndex = self.parser.grammarIndexFromRowCol(
-                        startRow + i, k)
-                while k < endCol:
-                    node, preceding, remaining = self.parser.grammarAtIndex(
-                        startRow + i, k, grammarIndex)
-                    grammarIndex += 1
-                    if remaining == 0:
-                        continue
-                    remaining = min(renderedWidth - k, remaining)
-                    length = min(endCol - k, remaining)
-                    color = colorPrefs.get(
-                        node.grammar.get(u'colorIndex', defaultColor),
-                        colorDelta)
-                    if length <= 0:
-                        window.addStr(top + i, left + k - startCol,
-                                      u' ' * (endCol - k), color)
-                        break
-                    window.addStr(
-                        top + i, left + k - startCol,
-                        app.curses_util.renderedSubStr(line, k, k + length),
-                        color)
-                    subStart = k - preceding
-                    subEnd = k + remaining
-                    subLine = line[subStart:subEnd]
-                    if spellChecking and node.grammar.get(u'spelling', True):
-                        # Highlight spelling errors
-                        grammarName = node.grammar.get(u'name', 'unknown')
-                        misspellingColor = colorPrefs.get(
-                            u'misspelling', colorDelta)
-                        for found in re.finditer(app.regex.kReSubwords,
-                                                 subLine):
-                            reg = found.regs[0]  # Mispelllled word
-                            offsetStart = subStart + reg[0]
-                            offsetEnd = subStart + reg[1]
-                            if startCol < offsetEnd and offsetStart < endCol:
-                                word = line[offsetStart:offsetEnd]
-                                if not spelling.isCorrect(word, grammarName):
-                                    if startCol > offsetStart:
-                                        offsetStart += startCol - offsetStart
-                                    wordFragment = line[offsetStart:min(
-                                        endCol, offsetEnd)]
-                                    window.addStr(
-                                        top + i, left + offsetStart - startCol,
-                                        wordFragment, misspellingColor)
-                    k += length
+                row = startRow + i
+                line, renderedWidth = parser.rowTextAndWidth(row)
+                state = parser.rowState(row) if isParser else None
+                segments = None
+                if state is not None:
+                    key = (line, state, startCol, endCol, colorDelta,
+                           spellChecking)
+                    segments = self.rowCache.get(key)
+                if segments is None:
+                    segments = self.__rowSegments(row, line, renderedWidth,
+                                                  startCol, endCol, colorDelta,
+                                                  spellChecking)
+                    if state is not None:
+                        self.rowCache.put(key, segments)
+                for col, text, color in segments:
+                    window.addStr(top + i, left + col, text, color)
         else:
             # For testing, draw without parser.
             rowLimit = min(max(self.parser.rowCount() - startRow, 0), rows)
@@ -200,6 +170,64 @@ class TextBuffer(app.actions.Actions):
                 window.addStr(self.penRow - startRow, self.penCol - startCol,
                               u'X', 200)
 
+    def __rowSegments(self, row, line, renderedWidth, startCol, endCol,
+                      colorDelta, spellChecking):
+        """Highlight the grammar (and spelling errors) of |line|, the text of
+        |row|, from |startCol| to |endCol|.
+
+        Returns:
+          A list of (col, text, color) where |col| is relative to |startCol|.
+        """
+        defaultColor = self.view.program.prefs.color['default']
+        colorPrefs = self.view.program.color
+        spelling = self.program.dictionary
+        segments = []
+        k = startCol
+        if k == 0:
+            # When rendering from column 0 the grammar index is always zero.
+            grammarIndex = 0
+        else:
+            # When starting mid-line, find starting grammar index.
+            grammarIndex = self.parser.grammarIndexFromRowCol(row, k)
+        while k < endCol:
+            node, preceding, remaining = self.parser.grammarAtIndex(
+                row, k, grammarIndex)
+            grammarIndex += 1
+            if remaining == 0:
+                continue
+            remaining = min(renderedWidth - k, remaining)
+            length = min(endCol - k, remaining)
+            color = colorPrefs.get(
+                node.grammar.get(u'colorIndex', defaultColor), colorDelta)
+            if length <= 0:
+                segments.append((k - startCol, u' ' * (endCol - k), color))
+                break
+            segments.append((k - startCol,
+                             app.curses_util.renderedSubStr(
+                                 line, k, k + length), color))
+            subStart = k - preceding
+            subEnd = k + remaining
+            subLine = line[subStart:subEnd]
+            if spellChecking and node.grammar.get(u'spelling', True):
+                # Highlight spelling errors
+                grammarName = node.grammar.get(u'name', 'unknown')
+                misspellingColor = colorPrefs.get(u'misspelling', colorDelta)
+                for found in re.finditer(app.regex.kReSubwords, subLine):
+                    reg = found.regs[0]  # Mispelllled word
+                    offsetStart = subStart + reg[0]
+                    offsetEnd = subStart + reg[1]
+                    if startCol < offsetEnd and offsetStart < endCol:
+                        word = line[offsetStart:offsetEnd]
+                        if not spelling.isCorrect(word, grammarName):
+                            if startCol > offsetStart:
+                                offsetStart += startCol - offsetStart
+                            wordFragment = line[offsetStart:min(
+                                endCol, offsetEnd)]
+                            segments.append((offsetStart - startCol,
+                                             wordFragment, misspellingColor))
+            k += length
+        return segments
+
     def drawOverlays(self, window, top, left, maxRow, maxCol, colorDelta):
         startRow = self.view.scrollRow + top
         endRow = self.view.scrollRow + top + maxRow
@@ -258,7 +286,18 @@ class TextBuffer(app.actions.Actions):
                 line = self.parser.rowText(self.penRow)[startCol:endCol]
                 window.addStr(top + self.penRow - startRow, left, line,
                               colorPrefs.get(u'trailing_space', colorDelta))
-        if self.findRe is not None:
+        if self.findRe is not None and self.matchIndex.isCurrent(
+                self.findRe, self.lines):
+            # Highlight find, from the matches found in the background.
+            color = colorPrefs.get('found_find', colorDelta)
+            for row, begin, end in self.matchIndex.matchesInRows(
+                    startRow, startRow + rowLimit):
+                begin = max(begin, startCol)
+                end = min(end, endCol)
+                if begin <= end:
+                    window.addStr(top + row - startRow, left + begin - startCol,
+                                  self.parser.rowText(row)[begin:end], color)
+        elif self.findRe is not None:
             # Highlight find.
             for i in range(rowLimit):
                 line = self.parser.rowText(startRow + i)[startCol:endCol]
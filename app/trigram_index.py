@@ -0,0 +1,364 @@
+# Copyright 2018 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+  An on-disk trigram index of the files in a directory tree, used to skip
+  reading files that can't match a search (see app.project_search).
+
+  For each file, the index records every three byte sequence (trigram) in the
+  (ASCII lower cased) file, along with the file's modification time and size.
+  A search for text that must contain, e.g., 'needle' need only read the files
+  that have all of the trigrams 'nee', 'eed', 'edl', and 'dle'. Files that have
+  changed since they were indexed are always read.
+
+  The index is an sqlite database, one for each directory tree. update()
+  re-indexes only the files that changed.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+try:
+    import sqlite3
+except ImportError:
+    sqlite3 = None
+import hashlib
+import io
+import os
+import re
+import threading
+
+import app.log
+import app.project_search
+
+# The number of files indexed in each database transaction.
+kCommitFiles = 100
+
+# Characters with a special meaning in a regex (outside of a set).
+kReSpecial = u'.^$*+?{}[]()|'
+
+# Escapes that stand for more than one character.
+kReClassEscapes = u'AbBdDsSwWZ'
+
+# The letters (and '-') of an inline flag group, e.g. (?i) or (?s-x:...).
+kReFlagLetters = u'aiLmsux-'
+
+# Escapes followed by the hex digits of a character code, and how many.
+kReArgumentEscapes = {u'x': 2, u'u': 4, u'U': 8}
+
+# Open indexes, keyed by (indexDir, root). See getIndex().
+_indexes = {}
+_indexesLock = threading.Lock()
+
+
+def trigrams(data):
+    """The set of trigrams (three byte strings) in |data| (bytes)."""
+    return set(data[i:i + 3] for i in range(len(data) - 2))
+
+
+def requiredLiterals(pattern, flags):
+    """Find text that every match of |pattern| must contain.
+
+    Only simple patterns are handled: any alternation, verbose flag, or
+    unusual construct gives up (returns an empty list).
+
+    Returns:
+      A list of strings.
+    """
+    if flags & re.VERBOSE:
+        return []
+    literals = []
+    run = []
+    i = 0
+    size = len(pattern)
+
+    def endRun():
+        if run:
+            literals.append(u''.join(run))
+            del run[:]
+
+    while i < size:
+        c = pattern[i]
+        if c == u'\\':
+            if i + 1 >= size:
+                return []
+            c = pattern[i + 1]
+            i += 2
+            if c in kReArgumentEscapes:
+                # A character given by its code (e.g. \x41 or \u00e9), which
+                # is left out rather than decoded.
+                endRun()
+                i += kReArgumentEscapes[c]
+                continue
+            if c == u'N':
+                # A named character, \N{...}.
+                end = pattern.find(u'}', i)
+                if end == -1:
+                    return []
+                endRun()
+                i = end + 1
+                continue
+            if c.isdigit():
+                # An octal character or a back reference, of up to three
+                # digits.
+                endRun()
+                digits = 1
+                while digits < 3 and i < size and pattern[i].isdigit():
+                    digits += 1
+                    i += 1
+                continue
+            if c in kReClassEscapes or c.isalpha():
+                # A class of characters (or an escape such as \n, which
+                # could be handled but is rare in a search).
+                endRun()
+                continue
+            run.append(c)
+        elif c == u'|':
+            # Either side may match.
+            return []
+        elif c in u'*?':
+            # The prior character is optional.
+            if run:
+                run.pop()
+            endRun()
+            i += 1
+        elif c == u'{':
+            end = pattern.find(u'}', i)
+            if end == -1:
+                return []
+            if run:
+                run.pop()
+            endRun()
+            i = end + 1
+        elif c == u'[':
+            # Skip the set. A ] right after the [ (or [^) is part of the set,
+            # as is an escaped \].
+            i += 1
+            if pattern.startswith(u'^', i):
+                i += 1
+            if pattern.startswith(u']', i):
+                i += 1
+            while i < size and pattern[i] != u']':
+                if pattern[i] == u'\\':
+                    i += 1
+                i += 1
+            if i >= size:
+                return []
+            endRun()
+            i += 1
+        elif c == u'(':
+            if pattern.startswith(u'(?', i):
+                flagEnd = i + 2
+                while flagEnd < size and pattern[flagEnd] in kReFlagLetters:
+                    flagEnd += 1
+                if u'x' in pattern[i + 2:flagEnd]:
+                    # Verbose (set inline), see re.VERBOSE above.
+                    return []
+            # Skip the group, which may be optional or have alternatives.
+            depth = 0
+            while i < size:
+                if pattern[i] == u'\\':
+                    i += 1
+                elif pattern[i] == u'(':
+                    depth += 1
+                elif pattern[i] == u')':
+                    depth -= 1
+                    if depth == 0:
+                        break
+                i += 1
+            endRun()
+            i += 1
+        elif c in kReSpecial:
+            endRun()
+            i += 1
+        else:
+            run.append(c)
+            i += 1
+    endRun()
+    return literals
+
+
+def requiredTrigrams(pattern, flags):
+    """The trigrams that a file must have to contain a match of |pattern|."""
+    required = set()
+    for literal in requiredLiterals(pattern, flags):
+        data = literal.encode(u'utf-8').lower()
+        found = trigrams(data)
+        if flags & re.IGNORECASE or u'(?' in pattern:
+            # Only ASCII is lower cased in the index, so other bytes may
+            # differ in case. (A group such as (?i) may set flags.)
+            found = set(
+                i for i in found if all(b < 0x80 for b in bytearray(i)))
+        required.update(found)
+    return required
+
+
+def fileTrigrams(path):
+    """The trigrams in the file at |path|, or None if it isn't searched (see
+    app.project_search.searchFiles())."""
+    try:
+        if os.path.getsize(path) > app.project_search.kMaxFileBytes:
+            return None
+        with io.open(path, 'rb') as f:
+            data = f.read()
+    except (IOError, OSError):
+        return None
+    if b'\0' in data[:app.project_search.kBinaryCheckBytes]:
+        return None
+    return trigrams(data.lower())
+
+
+def statKey(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_mtime, stat.st_size)
+
+
+def getIndex(indexDir, root):
+    """Get the TrigramIndex of |root|, stored in |indexDir|."""
+    root = os.path.abspath(root)
+    with _indexesLock:
+        index = _indexes.get((indexDir, root))
+        if index is None:
+            name = hashlib.sha1(root.encode(u'utf-8')).hexdigest()
+            index = TrigramIndex(
+                os.path.join(indexDir, name + u'.db'), root)
+            _indexes[(indexDir, root)] = index
+        return index
+
+
+class TrigramIndex:
+    """The trigram index of the files in the tree at |root|."""
+
+    def __init__(self, path, root):
+        self.path = path
+        self.root = root
+        self.__updateLock = threading.Lock()
+        self.__updater = None
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        db = self.__connect()
+        db.execute(u"""CREATE TABLE IF NOT EXISTS files (
+            id INTEGER PRIMARY KEY,
+            path TEXT UNIQUE NOT NULL,
+            mtime REAL NOT NULL,
+            size INTEGER NOT NULL)""")
+        db.execute(u"""CREATE TABLE IF NOT EXISTS postings (
+            trigram BLOB NOT NULL,
+            file INTEGER NOT NULL,
+            PRIMARY KEY (trigram, file)) WITHOUT ROWID""")
+        db.execute(u"""CREATE INDEX IF NOT EXISTS postings_file
+            ON postings (file)""")
+        db.commit()
+        db.close()
+
+    def __connect(self):
+        # A connection for each use, since they're used from several threads.
+        return sqlite3.connect(self.path, timeout=30)
+
+    def update(self):
+        """Index the files that changed since they were last indexed and
+        forget the files that are gone."""
+        with self.__updateLock:
+            db = self.__connect()
+            try:
+                self.__update(db)
+            finally:
+                db.close()
+
+    def __update(self, db):
+        known = {}
+        for fileId, path, mtime, size in db.execute(
+                u"SELECT id, path, mtime, size FROM files"):
+            known[path] = (fileId, (mtime, size))
+        changed = 0
+        for relPath in app.project_search.walkFiles(self.root):
+            path = os.path.join(self.root, relPath)
+            key = statKey(path)
+            prior = known.pop(relPath, None)
+            if key is None or (prior is not None and prior[1] == key):
+                continue
+            if prior is not None:
+                self.__forget(db, prior[0])
+            found = fileTrigrams(path)
+            if found is None:
+                continue
+            fileId = db.execute(
+                u"INSERT INTO files (path, mtime, size) VALUES (?, ?, ?)",
+                (relPath, key[0], key[1])).lastrowid
+            db.executemany(
+                u"INSERT INTO postings (trigram, file) VALUES (?, ?)",
+                ((sqlite3.Binary(i), fileId) for i in found))
+            changed += 1
+            if changed % kCommitFiles == 0:
+                db.commit()
+        for fileId, _ in known.values():
+            self.__forget(db, fileId)
+        db.commit()
+        app.log.info(u'trigram index updated', changed, u'files',
+                     len(known), u'removed')
+
+    def __forget(self, db, fileId):
+        db.execute(u"DELETE FROM postings WHERE file = ?", (fileId,))
+        db.execute(u"DELETE FROM files WHERE id = ?", (fileId,))
+
+    def updateInBackground(self):
+        """Call update() on a thread (unless one is already running)."""
+        if self.__updater is not None and self.__updater.is_alive():
+            return
+        self.__updater = threading.Thread(
+            target=self.__safeUpdate, name='trigram_index')
+        self.__updater.daemon = True
+        self.__updater.start()
+
+    def __safeUpdate(self):
+        try:
+            self.update()
+        except Exception as e:
+            app.log.exception(e)
+
+    def filterFiles(self, relPaths, pattern, flags):
+        """Generate the paths in |relPaths| that may contain a match of
+        |pattern|: those that the index says have the required trigrams, and
+        any that changed since they were indexed."""
+        required = requiredTrigrams(pattern, flags)
+        if not required:
+            for relPath in relPaths:
+                yield relPath
+            return
+        db = self.__connect()
+        try:
+            known = {}
+            for fileId, path, mtime, size in db.execute(
+                    u"SELECT id, path, mtime, size FROM files"):
+                known[path] = (fileId, (mtime, size))
+            candidates = None
+            for trigram in required:
+                fileIds = set(row[0] for row in db.execute(
+                    u"SELECT file FROM postings WHERE trigram = ?",
+                    (sqlite3.Binary(trigram),)))
+                candidates = (fileIds if candidates is None else
+                              candidates & fileIds)
+                if not candidates:
+                    break
+        finally:
+            db.close()
+        for relPath in relPaths:
+            prior = known.get(relPath)
+            if (prior is None or
+                    statKey(os.path.join(self.root, relPath)) != prior[1] or
+                    prior[0] in candidates):
+                yield relPath
@@ -305,6 +305,64 @@ class TextDeleteTestCases(unittest.TestCase):
         tb.insert("q")
         self.assertEqual(tb.message, None)
 
+class FindReplaceTestCases(unittest.TestCase):
+
+    def setUp(self):
+        app.log.shouldWritePrintLog = False
+        self.prg = app.ci_program.CiProgram()
+        self.textBuffer = app.text_buffer.TextBuffer(self.prg)
+        self.textBuffer.setView(FakeView())
+        self.original = [
+            u'one two', u'', u'three two one', u'four', u'two', u'five two'
+        ]
+        self.textBuffer.editPasteLines(tuple(self.original))
+
+    def tearDown(self):
+        self.textBuffer = None
+
+    def checkReplace(self, cmd, expected):
+        self.assertEqual(list(self.textBuffer.lines), self.original)
+        tb = self.textBuffer
+        tb.findReplace(cmd)
+        self.assertEqual(list(tb.lines), expected)
+        tb.undo()
+        self.assertEqual(list(tb.lines), self.original)
+        tb.redo()
+        self.assertEqual(list(tb.lines), expected)
+        tb.undo()
+
+    def test_find_replace(self):
+        self.checkReplace(u'/two/2/', [
+            u'one 2', u'', u'three 2 one', u'four', u'2', u'five 2'
+        ])
+        # Adding and removing rows.
+        self.checkReplace(u'/two/a\\nb/', [
+            u'one a', u'b', u'', u'three a', u'b one', u'four', u'a', u'b',
+            u'five a', u'b'
+        ])
+        self.checkReplace(u'/o\\n+t/X/', [
+            u'one twXhree two one', u'four', u'two', u'five two'
+        ])
+        self.checkReplace(u'/(\\w+) (\\w+)/\\2 \\1/', [
+            u'two one', u'', u'two three one', u'four', u'two', u'two five'
+        ])
+        self.checkReplace(u'/^/> /m', [u'> ' + i for i in self.original])
+        tb = self.textBuffer
+        tb.findReplace(u'/seven/7/')
+        self.assertEqual(tb.message[0], u'No matches found')
+        self.assertEqual(list(tb.lines), self.original)
+
+    def test_apply_document_update(self):
+        tb = self.textBuffer
+        for lines in ([u'one two', u'', u'3', u'four', u'two', u'5'],
+                      [u'zero', u'one two', u'', u'four', u'two', u'five two'],
+                      [u'one two']):
+            tb.applyDocumentUpdate(u'\n'.join(lines))
+            self.assertEqual(list(tb.lines), lines)
+            tb.undo()
+            self.assertEqual(list(tb.lines), self.original)
+
+
 class GrammarDeterminationTestCases(unittest.TestCase):
 
     def setUp(self):
@@ -0,0 +1,119 @@
+# Copyright 2018 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+import select
+import threading
+import unittest
+
+import app.background
+import app.log
+import app.render
+
+
+def isAwake(transport):
+    return transport.wakeFd in select.select([transport.wakeFd], [], [], 0)[0]
+
+
+class BackgroundTestCases(unittest.TestCase):
+
+    def setUp(self):
+        app.log.shouldWritePrintLog = False
+
+    def test_frame_transport(self):
+        transport = app.background.FrameTransport()
+        self.assertIsNone(transport.take())
+        self.assertFalse(isAwake(transport))
+        frame = [(0, 0, u'ab', 1), (0, 2, u'c', 2), (1, 0, u'de', 1)]
+        transport.put(frame, (0, 1), 1)
+        self.assertTrue(isAwake(transport))
+        self.assertTrue(transport.hasFrame())
+        self.assertEqual(transport.take(), (frame, (0, 1), 1))
+        self.assertFalse(isAwake(transport))
+        self.assertFalse(transport.hasFrame())
+        # Only the rows that changed are sent.
+        transport.put([(0, 0, u'ab', 1), (0, 2, u'c', 2), (1, 0, u'dx', 1)],
+                      (1, 1), 2)
+        self.assertEqual(transport.take(), ([(1, 0, u'dx', 1)], (1, 1), 2))
+        transport.put([(0, 0, u'ab', 1), (0, 2, u'c', 2), (1, 0, u'dx', 1)],
+                      None, 3)
+        self.assertEqual(transport.take(), ([], None, 3))
+        # Frames that weren't taken are merged.
+        transport.put([(0, 0, u'xy', 1), (1, 0, u'dx', 1)], (0, 0), 4)
+        transport.put([(0, 0, u'xy', 1), (1, 0, u'dz', 1)], (1, 0), 5)
+        self.assertEqual(transport.droppedFrames, 1)
+        self.assertEqual(
+            transport.take(), ([(0, 0, u'xy', 1), (1, 0, u'dz', 1)], (1, 0),
+                               5))
+        transport.resend()
+        transport.put([(0, 0, u'xy', 1), (1, 0, u'dz', 1)], None, 5)
+        self.assertEqual(
+            transport.take(), ([(0, 0, u'xy', 1), (1, 0, u'dz', 1)], None, 5))
+        transport.putException([u'error\n'])
+        self.assertTrue(isAwake(transport))
+        self.assertEqual(transport.take(), ('exception', [u'error\n']))
+
+    def test_gather_input_into_frame(self):
+
+        class FakeProgram:
+
+            def __init__(self):
+                self.program = self
+                self.frame = app.render.Frame()
+                self.renderScheduler = app.render.RenderScheduler()
+                # Long enough that the test doesn't depend on timing.
+                self.renderScheduler.frameTime = 60.0
+                self.commands = []
+
+            def executeCommandList(self, cmdList):
+                self.commands.extend(cmdList)
+
+            def shortTimeSlice(self):
+                pass
+
+            def longTimeSlice(self):
+                # Don't block (or render) when idle.
+                return False
+
+            def render(self):
+                self.frame.addStr(0, 0, u'%d' % (len(self.commands),), 1)
+
+        program = FakeProgram()
+        inputQueue = queue.Queue()
+        frames = app.background.FrameTransport()
+        thread = threading.Thread(
+            target=app.background.background, args=(inputQueue, frames))
+        thread.start()
+        try:
+            # The first input after a pause is rendered right away.
+            inputQueue.put((program, [1]))
+            select.select([frames.wakeFd], [], [], 10)
+            self.assertEqual(frames.take(), ([(0, 0, u'1', 1)], None, 1))
+            # Input within the frame time is gathered into the next frame.
+            inputQueue.put((program, [2]))
+            inputQueue.put((program, [3, 4]))
+            inputQueue.put((program, 'quit'))
+        finally:
+            thread.join(10)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(program.commands, [1, 2, 3, 4])
+        self.assertEqual(program.renderScheduler.frameCount, 1)
+        self.assertIsNone(frames.take())
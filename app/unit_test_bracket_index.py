@@ -0,0 +1,108 @@
+# Copyright 2018 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import unittest
+
+import app.bracket_index
+import app.ci_program
+import app.log
+import app.parser
+import app.prefs
+import app.text_buffer
+
+
+class BracketIndexTestCases(unittest.TestCase):
+
+    def setUp(self):
+        app.log.shouldWritePrintLog = False
+        self.prefs = app.prefs.Prefs()
+        self.parser = app.parser.Parser()
+        self.scanChars = app.bracket_index.kScanChars
+
+    def tearDown(self):
+        app.bracket_index.kScanChars = self.scanChars
+
+    def parse(self, data):
+        self.parser.parse(None, self.prefs, data, self.prefs.grammars[u'cpp'],
+                          0, 99999)
+
+    def match(self, index, data, offset):
+        found = index.matchingBracket(self.parser, offset)
+        if found is None or found == app.bracket_index.kNoMatch:
+            return found
+        return data[found], found
+
+    def test_skip_strings_and_comments(self):
+        data = u'f(a, ")", b[0]);  // (\n/* { */ g({ [ }]);\n'
+        self.parse(data)
+        index = app.bracket_index.BracketIndex()
+        self.assertTrue(index.update(self.parser))
+        self.assertEqual(self.match(index, data, 1), (u')', 14))
+        self.assertEqual(self.match(index, data, 14), (u'(', 1))
+        self.assertEqual(self.match(index, data, 11), (u']', 13))
+        # Each kind of bracket is paired separately.
+        self.assertEqual(self.match(index, data, 33), (u'}', 37))
+        self.assertEqual(self.match(index, data, 35), (u']', 38))
+        # Brackets in strings and comments aren't indexed.
+        self.assertIsNone(self.match(index, data, 6))
+        self.assertIsNone(self.match(index, data, 21))
+        self.assertIsNone(self.match(index, data, 26))
+        self.assertEqual(self.parser.rowColFromOffset(33), (1, 10))
+
+    def test_edit(self):
+        app.bracket_index.kScanChars = 8
+        data = u''.join(u'f%d(x[%d]);\n' % (i, i) for i in range(20))
+        self.parse(data)
+        index = app.bracket_index.BracketIndex()
+        index.update(self.parser)
+        offset = data.index(u'(', data.index(u'f10'))
+        self.assertEqual(self.match(index, data, offset), (u')', offset + 6))
+        # Leave a bracket on row 10 open. The brackets above are kept.
+        checkpoints = len(index.checkpoints)
+        data = data.replace(u'f10(x[10]);', u'f10(x[10];')
+        self.parse(data)
+        index.update(self.parser)
+        self.assertLess(len(index.checkpoints), checkpoints * 2)
+        self.assertEqual(
+            self.match(index, data, offset), app.bracket_index.kNoMatch)
+        self.assertEqual(self.match(index, data, 2), (u')', 7))
+        fresh = app.bracket_index.BracketIndex()
+        fresh.update(self.parser)
+        self.assertEqual(index.offsets, fresh.offsets)
+        self.assertEqual(index.partners, fresh.partners)
+        last = data.rindex(u'(')
+        self.assertEqual(self.match(index, data, last), (u')', last + 6))
+
+    def test_text_buffer(self):
+        prg = app.ci_program.CiProgram()
+        tb = app.text_buffer.TextBuffer(prg)
+        tb.lines = [u'a = (1,', u'  ")" + [2])', u'']
+        tb.parseDocument()
+        self.assertTrue(tb.bracketIndexMaybe())
+        tb.penCol = 4
+        self.assertEqual(tb.getMatchingBracketRowCol(), (1, 11))
+        tb.penRow = 1
+        tb.penCol = 11
+        self.assertEqual(tb.getMatchingBracketRowCol(), (0, 4))
+        # Before the index is updated, the rows are searched instead (still
+        # skipping the string).
+        tb.bracketIndex.clear()
+        self.assertEqual(tb.getMatchingBracketRowCol(), (0, 4))
+        tb.penRow = 0
+        tb.penCol = 4
+        self.assertEqual(tb.getMatchingBracketRowCol(), (1, 11))
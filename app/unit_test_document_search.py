@@ -0,0 +1,99 @@
+# Copyright 2018 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import re
+import unittest
+
+import app.ci_program
+import app.document_search
+import app.line_store
+import app.log
+import app.text_buffer
+
+
+class DocumentSearchTestCases(unittest.TestCase):
+
+    def setUp(self):
+        app.log.shouldWritePrintLog = False
+
+    def test_search(self):
+        lines = app.line_store.LineStore([u'one two', u'three', u'', u'two'])
+        search = app.document_search.DocumentSearch()
+        search.update(lines)
+        self.assertEqual(search.text, u'one two\nthree\n\ntwo')
+        self.assertEqual(search.rowCol(search.offset(1, 2)), (1, 2))
+        self.assertEqual(search.rowCol(search.offset(2, 0)), (2, 0))
+        regex = re.compile(u'two\\nth', re.MULTILINE)
+        self.assertEqual(
+            search.search(regex, 0, 0, 1), ((0, 4), (1, 2), False))
+        self.assertEqual(
+            search.search(regex, 0, 5, 1), ((0, 4), (1, 2), True))
+        self.assertEqual(
+            search.search(regex, 0, 5, -1), ((0, 4), (1, 2), False))
+        regex = re.compile(u'e.*?o', re.DOTALL)
+        self.assertEqual(
+            search.search(regex, 1, 4, 1), ((1, 4), (3, 3), False))
+        self.assertEqual(
+            search.search(regex, 1, 4, -1), ((1, 3), (3, 3), False))
+        self.assertIsNone(search.search(re.compile(u'x'), 0, 0, 1))
+        # The text is joined again after an edit.
+        lines[2] = u'four'
+        search.update(lines)
+        self.assertEqual(search.rowCol(search.offset(3, 1)), (3, 1))
+        self.assertEqual(search.text, u'one two\nthree\nfour\ntwo')
+
+    def test_search_backward_in_windows(self):
+        lines = app.line_store.LineStore(
+            [u'x' * 10 + u'ab', u'x' * 20, u'x' * 20 + u'a', u'b'])
+        search = app.document_search.DocumentSearch()
+        search.update(lines)
+        searchWindow = app.document_search.kSearchWindow
+        app.document_search.kSearchWindow = 4
+        try:
+            regex = re.compile(u'a\\s*b')
+            self.assertEqual(
+                search.search(regex, 3, 1, -1), ((2, 20), (3, 1), False))
+            # The match beginning before the pen isn't cut short.
+            self.assertEqual(
+                search.search(regex, 2, 21, -1), ((2, 20), (3, 1), False))
+            self.assertEqual(
+                search.search(regex, 2, 20, -1), ((0, 10), (0, 12), False))
+            self.assertEqual(
+                search.search(regex, 0, 10, -1), ((2, 20), (3, 1), True))
+        finally:
+            app.document_search.kSearchWindow = searchWindow
+
+    def test_find_in_text_buffer(self):
+        prg = app.ci_program.CiProgram()
+        prg.prefs.editor[u'findDotAll'] = True
+        try:
+            tb = app.text_buffer.TextBuffer(prg)
+            tb.lines = [u'begin', u'middle', u'end', u'begin end']
+            tb.find(u'gin.*?end')
+            self.assertEqual((tb.penRow, tb.penCol), (0, 2))
+            self.assertEqual((tb.markerRow, tb.markerCol), (2, 3))
+            tb.findAgain()
+            self.assertEqual((tb.penRow, tb.penCol), (3, 2))
+            self.assertEqual((tb.markerRow, tb.markerCol), (3, 9))
+            tb.findCurrentPattern(-1)
+            self.assertEqual((tb.penRow, tb.penCol), (0, 2))
+            # Multi-line matches aren't kept in the (per row) match index.
+            self.assertTrue(tb.findMatchesMaybe())
+            self.assertIsNone(tb.findMatchNumber())
+        finally:
+            prg.prefs.editor[u'findDotAll'] = False
@@ -0,0 +1,178 @@
+# Copyright 2018 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+import app.history
+
+
+class HistoryTestCases(unittest.TestCase):
+
+    def setUp(self):
+        self.tempDir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tempDir, u'file.txt')
+        self.chunkSize = app.history.kChecksumChunkSize
+        app.history.kChecksumChunkSize = 7
+
+    def tearDown(self):
+        app.history.kChecksumChunkSize = self.chunkSize
+        shutil.rmtree(self.tempDir)
+
+    def writeFile(self, data):
+        with io.open(self.path, 'w', encoding=u'utf-8') as outputFile:
+            outputFile.write(data)
+
+    def test_checksum(self):
+        data = u'some text\nété\n' * 10
+        self.writeFile(data)
+        expected = hashlib.sha512(data.encode(u'utf-8')).hexdigest()
+        self.assertEqual(app.history.calculateChecksum(self.path), expected)
+        self.assertEqual(
+            app.history.calculateChecksum(self.path, data), expected)
+        self.assertEqual(
+            app.history.calculateChecksum(self.path, algorithm='md5'),
+            hashlib.md5(data.encode(u'utf-8')).hexdigest())
+        # An unchanged file is not read again.
+        cacheKey = (self.path, app.history.kDefaultChecksumAlgorithm)
+        statKey, _ = app.history._checksumCache[cacheKey]
+        app.history._checksumCache[cacheKey] = (statKey, u'cached')
+        self.assertEqual(app.history.calculateChecksum(self.path), u'cached')
+        self.writeFile(data + u'more')
+        self.assertEqual(
+            app.history.calculateChecksum(self.path),
+            hashlib.sha512((data + u'more').encode(u'utf-8')).hexdigest())
+        self.assertIsNone(
+            app.history.calculateChecksum(self.path + u'.does_not_exist'))
+
+    def test_save_user_history(self):
+        history = app.history.History(
+            os.path.join(self.tempDir, u'history.db'))
+        history.loadUserHistory()
+        self.writeFile(u'one')
+        savedInfos = []
+        history.saveUserHistory((self.path, None, 0), {u'pen': (1, 2)},
+                                savedInfos.append)
+        history.waitForSaves()
+        # The new info is given to the thread that saved the file.
+        self.assertEqual(savedInfos, [])
+        history.runSavedCallbacks()
+        fileInfo = history.getFileInfo(self.path)
+        self.assertEqual(savedInfos, [fileInfo])
+        self.writeFile(u'two')
+        fileHistory = {u'pen': (3, 4)}
+        history.saveUserHistory((self.path, fileInfo[0], fileInfo[1]),
+                                fileHistory)
+        # The history is saved as it was when saveUserHistory() was called.
+        fileHistory[u'pen'] = (5, 6)
+        history.waitForSaves()
+        # The prior entry for the file is replaced.
+        loaded = app.history.History(history.pathToHistory)
+        loaded.loadUserHistory()
+        self.assertEqual(
+            loaded.getFileHistory(self.path)[u'pen'], (3, 4))
+        self.writeFile(u'one')
+        self.assertNotIn(u'pen', loaded.getFileHistory(self.path))
+
+    def test_open_while_saving_another_file(self):
+        history = app.history.History(
+            os.path.join(self.tempDir, u'history.db'))
+        history.loadUserHistory()
+        self.writeFile(u'one')
+        otherPath = os.path.join(self.tempDir, u'other.txt')
+        with io.open(otherPath, 'w', encoding=u'utf-8') as outputFile:
+            outputFile.write(u'other')
+        # Hold up the save of |otherPath| (e.g. hashing a large file).
+        hashing = threading.Event()
+        release = threading.Event()
+        getFileInfo = history.getFileInfo
+
+        def slowGetFileInfo(filePath, data=None):
+            if filePath == otherPath:
+                hashing.set()
+                release.wait()
+            return getFileInfo(filePath, data)
+
+        history.getFileInfo = slowGetFileInfo
+        try:
+            history.saveUserHistory((otherPath, None, 0), {u'pen': (1, 2)})
+            history.saveUserHistory((self.path, None, 0), {u'pen': (3, 4)})
+            self.assertTrue(hashing.wait(10))
+            # Opening a file that isn't being saved doesn't wait.
+            self.assertNotIn(u'pen', history.getFileHistory(otherPath + u'2'))
+        finally:
+            release.set()
+        self.assertEqual(history.getFileHistory(self.path)[u'pen'], (3, 4))
+        self.assertEqual(history.getFileHistory(otherPath)[u'pen'], (1, 2))
+
+    def test_recent_files_and_eviction(self):
+        history = app.history.History(
+            os.path.join(self.tempDir, u'history.db'))
+        history.loadUserHistory()
+        maxEntries = app.history.kMaxHistoryEntries
+        app.history.kMaxHistoryEntries = 3
+        try:
+            for i in range(5):
+                path = os.path.join(self.tempDir, u'file%d.txt' % (i,))
+                with io.open(path, 'w', encoding=u'utf-8') as outputFile:
+                    outputFile.write(u'file %d' % (i,))
+                history.saveUserHistory((path, None, 0), {
+                    u'path': path,
+                    u'pen': (i, 0)
+                })
+                history.waitForSaves()
+        finally:
+            app.history.kMaxHistoryEntries = maxEntries
+        # Only the most recently used records are kept.
+        self.assertEqual(history.getRecentFiles(), [
+            os.path.join(self.tempDir, u'file%d.txt' % (i,))
+            for i in (4, 3, 2)
+        ])
+        self.assertEqual(
+            history.getFileHistory(
+                os.path.join(self.tempDir, u'file0.txt')).get(u'pen'), None)
+
+    def test_import_legacy_history(self):
+        self.writeFile(u'one')
+        checksum, fileSize = app.history.getFileInfo(self.path)
+        legacyPath = os.path.join(self.tempDir, u'history.dat')
+        with io.open(legacyPath, 'wb') as outputFile:
+            pickle.dump({
+                (checksum, fileSize): {
+                    u'path': self.path,
+                    u'pen': (5, 6)
+                }
+            }, outputFile)
+        history = app.history.History(
+            os.path.join(self.tempDir, u'history.db'),
+            pathToLegacyHistory=legacyPath)
+        history.loadUserHistory()
+        self.assertEqual(history.getRecentFiles(), [self.path])
+        self.assertEqual(history.getFileHistory(self.path)[u'pen'], (5, 6))
+        history.clearUserHistory()
+        self.assertFalse(os.path.exists(legacyPath))
+        self.assertFalse(os.path.exists(history.pathToHistory))
@@ -0,0 +1,160 @@
+# Copyright 2018 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import random
+import unittest
+
+import app.line_store
+import app.selectable
+
+
+class LineStoreTestCases(unittest.TestCase):
+
+    def test_list_behavior(self):
+        store = app.line_store.LineStore([u"a", u"b", u"c"], blockSize=2)
+        self.assertEqual(len(store), 3)
+        self.assertEqual(store, [u"a", u"b", u"c"])
+        self.assertEqual(store[0], u"a")
+        self.assertEqual(store[-1], u"c")
+        self.assertEqual(store[1:], [u"b", u"c"])
+        self.assertEqual(list(reversed(store)), [u"c", u"b", u"a"])
+        with self.assertRaises(IndexError):
+            store[3]
+        store.insert(1, u"x")
+        self.assertEqual(store, [u"a", u"x", u"b", u"c"])
+        store.append(u"z")
+        del store[0]
+        self.assertEqual(store, [u"x", u"b", u"c", u"z"])
+        store[1:3] = [u"1", u"2", u"3"]
+        self.assertEqual(store, [u"x", u"1", u"2", u"3", u"z"])
+        del store[:]
+        self.assertEqual(store, [])
+        store.insert(0, u"")
+        self.assertEqual(store, [u""])
+
+    def test_matches_list(self):
+        """Apply the same random edits to a list and a LineStore."""
+        rand = random.Random(7)
+        expected = [u"line %d" % (i,) for i in range(100)]
+        store = app.line_store.LineStore(expected, blockSize=4)
+        for i in range(2000):
+            row = rand.randint(0, len(expected))
+            end = min(len(expected), row + rand.randint(0, 12))
+            op = rand.randint(0, 3)
+            if op == 0:
+                expected.insert(row, u"ins %d" % (i,))
+                store.insert(row, u"ins %d" % (i,))
+            elif op == 1 and row < len(expected):
+                del expected[row]
+                del store[row]
+            elif op == 2:
+                new = [u"rep %d %d" % (i, k) for k in range(rand.randint(0, 9))]
+                expected[row:end] = new
+                store[row:end] = new
+            elif row < len(expected):
+                expected[row] = u"set %d" % (i,)
+                store[row] = u"set %d" % (i,)
+            self.assertEqual(len(store), len(expected))
+        self.assertEqual(list(store), expected)
+        self.assertEqual(store[10:50], expected[10:50])
+        self.assertLess(store.blockCount(), len(expected))
+
+    def test_buffer_lines(self):
+        lineBuffer = app.selectable.BaseLineBuffer()
+        self.assertIsInstance(lineBuffer.lines, app.line_store.LineStore)
+        lineBuffer.lines = [u"one", u"two"]
+        self.assertIsInstance(lineBuffer.lines, app.line_store.LineStore)
+        self.assertEqual(lineBuffer.lines, [u"one", u"two"])
+        self.assertFalse(lineBuffer.isEmpty())
+
+    def test_text(self):
+        joinCalls = []
+
+        def joinLines(lines):
+            joinCalls.append(len(lines))
+            return u"\n".join(lines)
+
+        lines = [u"row %d" % (i,) for i in range(10)]
+        store = app.line_store.LineStore(lines, blockSize=2)
+        self.assertEqual(store.text(joinLines), u"\n".join(lines))
+        self.assertEqual(len(joinCalls), 5)
+        # Unchanged, nothing is joined again.
+        version = store.version()
+        self.assertEqual(store.text(joinLines), u"\n".join(lines))
+        self.assertEqual(len(joinCalls), 5)
+        # Only the changed block is joined again.
+        store[4] = u"changed"
+        lines[4] = u"changed"
+        self.assertNotEqual(store.version(), version)
+        self.assertEqual(store.text(joinLines), u"\n".join(lines))
+        self.assertEqual(len(joinCalls), 6)
+        store[3:5] = [u"a", u"b", u"c"]
+        lines[3:5] = [u"a", u"b", u"c"]
+        self.assertEqual(store.text(joinLines), u"\n".join(lines))
+        del store[:]
+        self.assertEqual(store.text(joinLines), u"")
+
+    def test_text_offsets(self):
+        lines = [u"row %d" % (i,) for i in range(10)]
+        lines[3] = u""
+        store = app.line_store.LineStore(lines, blockSize=2)
+        text = store.text(app.line_store.joinNewLines)
+        for row in range(len(lines)):
+            offset = store.textOffset(row)
+            self.assertEqual(offset, len(u"\n".join(lines[:row] + [u""])))
+            self.assertEqual(store.textRowCol(offset), (row, 0))
+            self.assertEqual(
+                store.textRowCol(offset + len(lines[row])),
+                (row, len(lines[row])))
+        self.assertEqual(store.textRowCol(len(text)), (9, 5))
+        # Each joinLines has its own cache.
+        joinCalls = []
+
+        def joinLines(lines):
+            joinCalls.append(len(lines))
+            return u"\n".join(lines).upper()
+
+        store.text(joinLines)
+        store[4] = u"changed"
+        lines[4] = u"changed"
+        store.text(joinLines)
+        self.assertEqual(len(joinCalls), 6)
+        self.assertEqual(store.textOffset(5), len(u"\n".join(lines[:5])) + 1)
+        self.assertEqual(store.textRowCol(store.textOffset(5) - 1), (4, 7))
+        self.assertEqual(store.text(joinLines), u"\n".join(lines).upper())
+        self.assertEqual(len(joinCalls), 6)
+        self.assertEqual(app.line_store.LineStore().textRowCol(0), (0, 0))
+
+    def test_edits_since(self):
+        store = app.line_store.LineStore([u"a", u"b", u"c"], blockSize=2)
+        version = store.version()
+        self.assertEqual(store.editsSince(version), [])
+        store[1] = u"x"
+        store.insert(0, u"y")
+        del store[3]
+        store[1:2] = [u"p", u"q"]
+        self.assertEqual(
+            store.editsSince(version), [(1, 2, 1), (0, 0, 1), (3, 4, 0),
+                                        (1, 2, 2)])
+        self.assertEqual(store.editsSince(version + 3), [(1, 2, 2)])
+        # Too many edits to recall.
+        version = store.version()
+        for i in range(app.line_store.kMaxEdits + 1):
+            store[0] = u"z"
+        self.assertIsNone(store.editsSince(version))
+        self.assertEqual(store.editsSince(store.version() - 1), [(0, 1, 1)])
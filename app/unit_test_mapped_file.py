@@ -0,0 +1,232 @@
+# Copyright 2018 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import binascii
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+import app.ci_program
+import app.line_store
+import app.log
+import app.mapped_file
+import app.parser
+import app.text_buffer
+
+
+class FakeView:
+
+    def __init__(self):
+        self.rows = 10
+        self.cols = 100
+        self.scrollRow = 0
+        self.scrollCol = 0
+
+
+class MappedFileTestCases(unittest.TestCase):
+
+    def setUp(self):
+        app.log.shouldWritePrintLog = False
+        self.prg = app.ci_program.CiProgram()
+        self.textBuffer = app.text_buffer.TextBuffer(self.prg)
+        self.tempDir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tempDir, u'large.cc')
+        # Use tiny blocks, so that a small file has many of them.
+        self.blockBytes = app.mapped_file.kBlockBytes
+        app.mapped_file.kBlockBytes = 16
+        self.largeFileSize = self.prg.prefs.editor[u'largeFileSize']
+
+    def tearDown(self):
+        app.mapped_file.kBlockBytes = self.blockBytes
+        self.prg.prefs.editor[u'largeFileSize'] = self.largeFileSize
+        self.textBuffer = None
+        shutil.rmtree(self.tempDir)
+
+    def writeFile(self, data):
+        with io.open(self.path, 'wb') as outputFile:
+            outputFile.write(data)
+
+    def test_lines(self):
+        for data in (b'one', b'one\n', b'\n\n',
+                     b'one\r\ntwo\rthree\n\tfour\x02\n' * 5 + b'last',
+                     b'a very long line that spans several blocks\nend\n',
+                     b'cr only\r' * 10 + b'a long last line with no break',
+                     b'a' * 15 + b'\r\n' + b'b' * 14 + b'\r\r\n\n'):
+            self.writeFile(data)
+            mappedFile = app.mapped_file.MappedFile(
+                self.path, self.textBuffer.doDataToLines)
+            store = app.line_store.LineStore()
+            store.assignBlocks(mappedFile.blocks)
+            expected = self.textBuffer.doDataToLines(data.decode('utf-8'))
+            self.assertEqual(len(store), len(expected))
+            self.assertEqual(list(store), expected)
+            self.assertEqual(store[3:9], expected[3:9])
+            mappedFile.close()
+
+    def test_cr_line_breaks(self):
+        # Blocks are cut at a CR as well as at a LF.
+        data = b''.join(b'line %d\r' % (i,) for i in range(100))
+        self.writeFile(data)
+        mappedFile = app.mapped_file.MappedFile(self.path,
+                                                self.textBuffer.doDataToLines)
+        self.assertGreater(len(mappedFile.blocks), 40)
+        store = app.line_store.LineStore()
+        store.assignBlocks(mappedFile.blocks)
+        self.assertEqual(list(store),
+                         self.textBuffer.doDataToLines(data.decode('utf-8')))
+        mappedFile.close()
+
+    def test_edit(self):
+        data = u''.join(u'line %d\n' % (i,) for i in range(100))
+        self.writeFile(data.encode('utf-8'))
+        mappedFile = app.mapped_file.MappedFile(
+            self.path, self.textBuffer.doDataToLines)
+        store = app.line_store.LineStore()
+        store.assignBlocks(mappedFile.blocks)
+        expected = self.textBuffer.doDataToLines(data)
+        store[50] = u'changed'
+        expected[50] = u'changed'
+        store[10:12] = [u'a', u'b', u'c']
+        expected[10:12] = [u'a', u'b', u'c']
+        self.assertEqual(list(store), expected)
+        # Only the edited blocks (and neighbors merged with them) are held in
+        # memory.
+        materialized = [
+            block for block in mappedFile.blocks if block.isMaterialized()
+        ]
+        self.assertLess(len(materialized), 5)
+        self.assertGreater(len(mappedFile.blocks), 40)
+        app.mapped_file.writeLines(self.path, store,
+                                   self.textBuffer.doLinesToData, u'utf-8')
+        with io.open(self.path, encoding=u'utf-8') as inputFile:
+            self.assertEqual(inputFile.read(), u'\n'.join(expected))
+        mappedFile.close()
+
+    def test_file_load(self):
+        self.prg.prefs.editor[u'largeFileSize'] = 1
+        data = u''.join(u'int x%d; // line\n' % (i,) for i in range(400))
+        self.writeFile(data.encode('utf-8'))
+        tb = self.textBuffer
+        tb.setView(FakeView())
+        tb.setFilePath(self.path)
+        tb.fileLoad()
+        self.assertIsNotNone(tb.mappedFile)
+        self.assertIsInstance(tb.parser, app.parser.WindowParser)
+        self.assertEqual(tb.parser.rowCount(), 401)
+        tb.view.scrollRow = 390
+        tb.parseScreenMaybe()
+        self.assertEqual(tb.parser.rowText(395), u'int x395; // line')
+        self.assertEqual(
+            tb.parser.grammarAt(395, 11),
+            self.prg.prefs.grammars[u'cpp_line_comment'])
+        # Not in view, not parsed.
+        self.assertEqual(tb.parser.grammarAt(5, 10), tb.rootGrammar)
+
+    def test_hex_file(self):
+        data = bytes(bytearray(i % 256 for i in range(1000)))
+        self.writeFile(data)
+        tb = self.textBuffer
+        tb.setFilePath(self.path)
+        tb.fileLoad()
+        self.assertTrue(tb.isBinary)
+        self.assertIsInstance(tb.mappedFile, app.mapped_file.HexFile)
+        hexDigits = binascii.hexlify(data).decode(u'ascii')
+        expected = [hexDigits[i:i + 32] for i in range(0, len(hexDigits), 32)]
+        expected.append(u'')
+        self.assertEqual(list(tb.lines), expected)
+        hexFile = tb.mappedFile
+        inode = os.stat(self.path).st_ino
+        # Changing bytes writes only those bytes.
+        tb.lines[3] = u'ffff' + tb.lines[3][4:]
+        tb.lines[62] = tb.lines[62][:-2] + u'ee'
+        patches, size = hexFile.patches(tb.lines)
+        self.assertEqual(patches, [(48, b'\xff\xff'), (1000 - 1, b'\xee')])
+        self.assertEqual(size, 1000)
+        hexFile.write(self.path, tb.lines)
+        self.assertEqual(os.stat(self.path).st_ino, inode)
+        data = data[:48] + b'\xff\xff' + data[50:-1] + b'\xee'
+        with io.open(self.path, 'rb') as inputFile:
+            self.assertEqual(inputFile.read(), data)
+        # Removing a row moves the rest of the bytes, so the file is rewritten.
+        del tb.lines[1]
+        self.assertIsNone(hexFile.patches(tb.lines))
+        hexFile.write(self.path, tb.lines)
+        data = data[:16] + data[32:]
+        with io.open(self.path, 'rb') as inputFile:
+            self.assertEqual(inputFile.read(), data)
+        # And after that, is always rewritten.
+        tb.lines[0] = u'00'
+        hexFile.write(self.path, tb.lines)
+        with io.open(self.path, 'rb') as inputFile:
+            self.assertEqual(inputFile.read(), b'\0' + data[16:])
+
+    def test_invalid_byte_in_first_block(self):
+        self.prg.prefs.editor[u'largeFileSize'] = 1
+        data = b'bad \xff byte\n' + b''.join(
+            b'line %d\n' % (i,) for i in range(20))
+        self.writeFile(data)
+        with self.assertRaises(UnicodeDecodeError):
+            app.mapped_file.MappedFile(self.path, self.textBuffer.doDataToLines)
+        # The file is opened as hex, so saving keeps every byte.
+        tb = self.textBuffer
+        tb.setFilePath(self.path)
+        tb.fileLoad()
+        self.assertTrue(tb.isBinary)
+        tb.lines[0] = u'42' + tb.lines[0][2:]
+        tb.mappedFile.write(self.path, tb.lines)
+        with io.open(self.path, 'rb') as inputFile:
+            self.assertEqual(inputFile.read(), b'B' + data[1:])
+
+    def test_invalid_byte_past_first_block(self):
+        self.prg.prefs.editor[u'largeFileSize'] = 1
+        data = b''.join(b'line %d\n' % (i,) for i in range(20))
+        data += b'bad \xff byte\n' + b'tail\n'
+        self.assertGreater(data.index(b'\xff'), app.mapped_file.kBlockBytes)
+        self.writeFile(data)
+        # Only the first block is decoded when the file is opened.
+        tb = self.textBuffer
+        tb.setView(FakeView())
+        tb.setFilePath(self.path)
+        tb.fileLoad()
+        self.assertFalse(tb.isBinary)
+        self.assertIsNone(tb.mappedFile.decodeError)
+        self.assertFalse(tb.isReadOnly)
+        # The bad byte is found when its block is read.
+        self.assertEqual(tb.lines[20], u'bad \ufffd byte')
+        self.assertIsInstance(tb.mappedFile.decodeError, UnicodeDecodeError)
+        tb.parseScreenMaybe()
+        self.assertTrue(tb.isReadOnly)
+        # Saving would write the replacement character, so it fails.
+        tb.lines[0] = u'changed'
+        tb.fileWrite()
+        with io.open(self.path, 'rb') as inputFile:
+            self.assertEqual(inputFile.read(), data)
+
+    def test_character_split_by_block_size(self):
+        # The first block has no line break, and a character spans the point
+        # where it would be cut.
+        text = u'a' * (app.mapped_file.kBlockBytes - 1) + u'\u00e9\u00e9\nend'
+        self.writeFile(text.encode('utf-8'))
+        mappedFile = app.mapped_file.MappedFile(
+            self.path, self.textBuffer.doDataToLines)
+        store = app.line_store.LineStore()
+        store.assignBlocks(mappedFile.blocks)
+        self.assertEqual(list(store), text.split(u'\n'))
+        mappedFile.close()
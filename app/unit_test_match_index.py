@@ -0,0 +1,169 @@
+# Copyright 2018 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import random
+import re
+import unittest
+
+import app.ci_program
+import app.line_store
+import app.log
+import app.match_index
+import app.text_buffer
+
+
+def allMatches(index):
+    return list(index.matchesInRows(0, len(index.lines)))
+
+
+class MatchIndexTestCases(unittest.TestCase):
+
+    def setUp(self):
+        app.log.shouldWritePrintLog = False
+
+    def test_next_and_prior(self):
+        lines = app.line_store.LineStore(
+            [u'ab ab', u'', u'xx', u'ab', u'b'])
+        regex = re.compile(u'ab')
+        index = app.match_index.MatchIndex()
+        self.assertFalse(index.isCurrent(regex, lines))
+        self.assertTrue(index.update(regex, lines))
+        self.assertTrue(index.isCurrent(regex, lines))
+        self.assertEqual(index.matchCount(), 3)
+        self.assertEqual(allMatches(index), [(0, 0, 2), (0, 3, 5), (3, 0, 2)])
+        self.assertEqual(index.nextMatch(0, 1), (0, 3, 5))
+        self.assertEqual(index.nextMatch(0, 4), (3, 0, 2))
+        self.assertEqual(index.nextMatch(3, 1), None)
+        self.assertEqual(index.priorMatch(3, 0), (0, 3, 5))
+        self.assertEqual(index.priorMatch(0, 3), (0, 0, 2))
+        self.assertEqual(index.priorMatch(0, 0), None)
+        self.assertEqual(index.matchNumber(0, 3), 2)
+        self.assertEqual(index.matchNumber(3, 0), 3)
+        self.assertEqual(index.matchNumber(3, 1), None)
+        self.assertEqual(list(index.matchesInRows(1, 4)), [(3, 0, 2)])
+        # A new pattern starts over.
+        regex = re.compile(u'b')
+        self.assertFalse(index.isCurrent(regex, lines))
+        index.update(regex, lines)
+        self.assertEqual(index.matchCount(), 4)
+
+    def test_incremental_update(self):
+        """Apply random edits and compare the index with a fresh one."""
+        rand = random.Random(3)
+        lines = app.line_store.LineStore(
+            [u'row %d' % (i,) for i in range(300)], blockSize=8)
+        regex = re.compile(u'[13]')
+        index = app.match_index.MatchIndex()
+        index.update(regex, lines)
+        for i in range(300):
+            row = rand.randint(0, len(lines) - 1)
+            op = rand.randint(0, 3)
+            if op == 0:
+                lines.insert(row, u'new %d' % (i,))
+            elif op == 1 and len(lines) > 1:
+                del lines[row]
+            elif op == 2:
+                lines[row:row + rand.randint(0, 3)] = [
+                    u'rep %d' % (k,) for k in range(rand.randint(0, 3))
+                ]
+            else:
+                lines[row] = u'set %d' % (i,)
+            if rand.randint(0, 3) == 0:
+                self.assertTrue(index.update(regex, lines))
+                fresh = app.match_index.MatchIndex()
+                fresh.update(regex, lines)
+                self.assertEqual(allMatches(index), allMatches(fresh))
+                self.assertEqual(index.matchCount(), fresh.matchCount())
+
+    def test_paused_update(self):
+
+        class UserEvent:
+
+            def __init__(self, count):
+                self.count = count
+
+            def hasUserEvent(self):
+                self.count -= 1
+                return self.count < 0
+
+        lines = app.line_store.LineStore(
+            [u'line %d' % (i,) for i in range(app.match_index.kCheckRows * 3)])
+        regex = re.compile(u'0$')
+        index = app.match_index.MatchIndex()
+        self.assertFalse(index.update(regex, lines, UserEvent(1)))
+        self.assertEqual(index.scannedTo, app.match_index.kCheckRows)
+        # An edit to a row that was searched, and another that wasn't.
+        lines[5] = u'line 10'
+        lines[app.match_index.kCheckRows + 5] = u'line 10'
+        self.assertTrue(index.update(regex, lines, UserEvent(10)))
+        self.assertEqual(index.matchCount(), len(lines) // 10 + 2)
+
+    def test_find_in_text_buffer(self):
+        prg = app.ci_program.CiProgram()
+        tb = app.text_buffer.TextBuffer(prg)
+        tb.lines = [u'one two', u'two', u'three two']
+        tb.find(u'two')
+        self.assertEqual((tb.penRow, tb.penCol), (0, 4))
+        # Found by scanning the lines, the index isn't built yet.
+        self.assertIsNone(tb.findMatchNumber())
+        self.assertTrue(tb.findMatchesMaybe())
+        self.assertEqual(tb.findMatchNumber(), (1, 3))
+        tb.findAgain()
+        self.assertEqual((tb.penRow, tb.penCol), (1, 0))
+        tb.findAgain()
+        self.assertEqual((tb.penRow, tb.penCol), (2, 6))
+        self.assertEqual(tb.findMatchNumber(), (3, 3))
+        tb.findAgain()
+        self.assertEqual((tb.penRow, tb.penCol), (0, 4))
+        tb.findCurrentPattern(-1)
+        self.assertEqual((tb.penRow, tb.penCol), (2, 6))
+        # Edits are picked up.
+        tb.lines[1] = u'two two'
+        self.assertIsNone(tb.findMatchNumber())
+        self.assertTrue(tb.findMatchesMaybe())
+        self.assertEqual(tb.findMatchNumber(), (4, 4))
+        tb.find(u'')
+        self.assertTrue(tb.findMatchesMaybe())
+        self.assertIsNone(tb.findMatchNumber())
+
+    def test_find_anchored_in_text_buffer(self):
+        prg = app.ci_program.CiProgram()
+        tb = app.text_buffer.TextBuffer(prg)
+        tb.lines = [u'aaa', u'b aa']
+        tb.find(u'^a')
+        self.assertEqual((tb.penRow, tb.penCol), (0, 0))
+        self.assertTrue(tb.findMatchesMaybe())
+        self.assertEqual(tb.findMatchNumber(), (1, 1))
+        # The rest of the pen row is searched from the pen, where ^ matches.
+        tb.findAgain()
+        self.assertEqual((tb.penRow, tb.penCol), (0, 1))
+        # That match isn't one of a search of the whole row.
+        self.assertEqual(tb.findMatchNumber(), (None, 1))
+        tb.findAgain()
+        self.assertEqual((tb.penRow, tb.penCol), (0, 2))
+        # The other rows are searched as a whole.
+        tb.findAgain()
+        self.assertEqual((tb.penRow, tb.penCol), (0, 0))
+        tb.find(u'\\ba')
+        self.assertTrue(tb.findMatchesMaybe())
+        tb.findAgain()
+        self.assertEqual((tb.penRow, tb.penCol), (0, 1))
+        tb.findAgain()
+        self.assertEqual((tb.penRow, tb.penCol), (0, 2))
+        tb.findAgain()
+        self.assertEqual((tb.penRow, tb.penCol), (1, 2))
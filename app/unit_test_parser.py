@@ -23,6 +23,7 @@ import sys
 from timeit import timeit
 import unittest
 
+import app.parallel_parser
 import app.parser
 import app.prefs
 
@@ -76,6 +77,21 @@ void blah();
         self.assertEqual(
             self.parser.grammarAt(3, 7), self.prefs.grammars[u'cpp'])
 
+    def test_parse_look_behind(self):
+        # Each search starts at an offset within the whole document, so a
+        # look behind (or \\b) sees the text before that offset. E.g. the
+        # regex_string 'begin' looks behind for a new line.
+        test = u"""}
+
+  /re/;
+"""
+        self.prefs = app.prefs.Prefs()
+        self.parser.parse(None, self.prefs, test, self.prefs.grammars[u'js'], 0,
+                          99999)
+        self.assertEqual(self.parser.grammarAt(0, 2), self.prefs.grammars[u'js'])
+        self.assertEqual(
+            self.parser.grammarAt(2, 3), self.prefs.grammars[u'regex_string'])
+
     def test_parse_rs_raw_string(self):
         test = u"""// one
 let stuff = r###"two
@@ -105,6 +121,143 @@ fn main { }
         self.assertEqual(
             self.parser.grammarAt(4, 7), self.prefs.grammars[u'rs'])
 
+    def test_incremental_parse(self):
+        self.prefs = app.prefs.Prefs()
+        grammar = self.prefs.grammars[u'cpp']
+        lines = [u"// header comment"]
+        for i in range(200):
+            lines += [
+                u"int func%d(int a) {" % (i,),
+                u"  return a + %d;  // line" % (i,), u"}"
+            ]
+
+        def checkParse(beginRow):
+            data = u"\n".join(lines)
+            self.parser.parse(None, self.prefs, data, grammar, beginRow, 99999)
+            fresh = app.parser.Parser()
+            fresh.parse(None, self.prefs, data, grammar, 0, 99999)
+            self.assertEqual(self.parser.rows, fresh.rows)
+            self.assertEqual(self.parser.nodeCount(), fresh.nodeCount())
+            for i in range(fresh.nodeCount()):
+                self.assertEqual(
+                    self.parser.nodeTuple(i), fresh.nodeTuple(i))
+
+        checkParse(0)
+        # Typing within a function only re-parses a few rows.
+        lines[301] = u"  return a + b;  // line"
+        checkParse(301)
+        self.assertGreater(self.parser.reusedRowCount, 290)
+        # Adding and removing lines shifts the reused rows.
+        lines[100:100] = [u"", u"int x;"]
+        checkParse(100)
+        self.assertGreater(self.parser.reusedRowCount, 490)
+        del lines[10:13]
+        checkParse(10)
+        self.assertGreater(self.parser.reusedRowCount, 580)
+        # Opening a block comment changes the grammar for the rest of the
+        # document.
+        lines[50] = u"/* unterminated"
+        checkParse(50)
+        self.assertEqual(self.parser.reusedRowCount, 0)
+        self.assertEqual(
+            self.parser.grammarAt(500, 1),
+            self.prefs.grammars[u'cpp_block_comment'])
+        # Closing it again.
+        lines[50] = u""
+        checkParse(50)
+        self.assertEqual(
+            self.parser.grammarAt(500, 1), self.prefs.grammars[u'cpp'])
+
+    def test_parallel_parse(self):
+        self.prefs = app.prefs.Prefs()
+        grammar = self.prefs.grammars[u'cpp']
+        lines = []
+        for i in range(300):
+            lines += [
+                u"int func%d(int a) {" % (i,),
+                u"  return a + %d;  // comment" % (i,), u"}", u""
+            ]
+
+        def checkParse(expectedSplit=None):
+            data = u"\n".join(lines)
+            parallelParse = app.parallel_parser.ParallelParse(
+                self.prefs, data, grammar, processCount=2, chunkCount=6)
+            self.assertEqual(len(parallelParse.offsets), 6)
+            self.assertTrue(parallelParse.ready(30))
+            expectedRows = len(lines)
+            if expectedSplit is not None:
+                # The rows up to and including the start of the row at the
+                # split are parsed.
+                expectedRows = data.count(
+                    u"\n", 0, parallelParse.offsets[expectedSplit]) + 1
+            self.assertEqual(
+                parallelParse.stitch(self.parser, self.prefs), expectedRows)
+            fresh = app.parser.Parser()
+            fresh.parse(None, self.prefs, data, grammar, 0, len(lines) + 1)
+            self.assertEqual(self.parser.rows[:expectedRows],
+                             fresh.rows[:expectedRows])
+            for i in range(self.parser.rows[expectedRows - 1] + 1):
+                self.assertEqual(
+                    self.parser.nodeTuple(i), fresh.nodeTuple(i))
+            self.assertEqual(self.parser.rowCount(), len(lines))
+
+        checkParse()
+        # A block comment spanning the second split makes the stitching stop
+        # there.
+        lines[399] = u"/* open comment"
+        lines[550] = u"*/"
+        self.parser = app.parser.Parser()
+        checkParse(2)
+        # The workers use these prefs, not ones of their own.
+        lines[399] = u""
+        lines[550] = u""
+        grammar = dict(grammar)
+        grammar[u'name'] = u'custom_cpp'
+        self.prefs.grammars[u'custom_cpp'] = grammar
+        self.parser = app.parser.Parser()
+        checkParse()
+
+    def test_parse_window(self):
+        self.prefs = app.prefs.Prefs()
+        grammar = self.prefs.grammars[u'cpp']
+        lines = [u"/* unterminated"]
+        for i in range(300):
+            lines += [
+                u"int func%d(int a) {" % (i,),
+                u"  return a + %d;  // line" % (i,), u"}", u""
+            ]
+        data = u"\n".join(lines)
+        lineComment = self.prefs.grammars[u'cpp_line_comment']
+        blockComment = self.prefs.grammars[u'cpp_block_comment']
+        self.parser.parse(None, self.prefs, data, grammar, 0, 10)
+        # Rows past fullyParsedToLine have no highlighting.
+        self.assertEqual(self.parser.grammarAt(1002, 20), grammar)
+        self.parser.parseWindow(self.prefs, grammar, 1000, 1020)
+        # The window guesses that a blank line is in the root grammar.
+        self.assertEqual(self.parser.rowText(1002), u"  return a + 250;  // line")
+        self.assertEqual(self.parser.grammarAt(1002, 20), lineComment)
+        self.assertEqual(self.parser.grammarAt(1002, 0), grammar)
+        self.assertEqual(self.parser.grammarAt(1019, 20), grammar)
+        self.assertEqual(self.parser.grammarAt(1022, 20), grammar)
+        # Parsing the document replaces the guess with the real state.
+        self.parser.parse(None, self.prefs, data, grammar, 10, 99999)
+        self.assertEqual(self.parser.grammarAt(1002, 20), blockComment)
+        # A change to the data drops the window.
+        self.parser = app.parser.Parser()
+        self.parser.parse(None, self.prefs, data, grammar, 0, 10)
+        self.parser.parseWindow(self.prefs, grammar, 1000, 1020)
+        self.assertEqual(self.parser.grammarAt(1002, 20), lineComment)
+        self.parser.parse(None, self.prefs, data + u"\n", grammar, 10, 10)
+        self.assertEqual(self.parser.grammarAt(1002, 20), grammar)
+        # A window that reaches the parsed rows begins in their state.
+        self.parser = app.parser.Parser()
+        self.parser.parse(None, self.prefs, data, grammar, 0, 10)
+        self.parser.parseWindow(self.prefs, grammar, 100, 120)
+        self.assertEqual(self.parser.rowText(102), u"  return a + 25;  // line")
+        self.assertEqual(self.parser.grammarAt(102, 0), blockComment)
+        self.assertEqual(self.parser.grammarAt(102, 20), blockComment)
+        self.assertEqual(self.parser.grammarAt(118, 20), blockComment)
+
     if 0:
 
         def test_profile_parse(self):
@@ -16,10 +16,14 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import time
 from timeit import timeit
 import unittest
 
+import app.ci_program
 import app.parser
+import app.prefs
+import app.text_buffer
 
 
 class PerformanceTestCases(unittest.TestCase):
@@ -204,3 +208,66 @@ foo = []
 ''',
                     number=10000)
                 print("\n%9s: %s %s" % (lineCount, a, b))
+
+    def test_parse_scaling(self):
+        # Disabled due to running time (a few minutes for 50MB).
+        if 0:
+            # Parsing time is expected to grow linearly with the size of the
+            # document. The parse is done the way the background thread does
+            # it, with repeated calls that each resume where the last stopped.
+            prefs = app.prefs.Prefs()
+            grammar = prefs.grammars['cpp']
+            sample = u''.join([
+                u'''// A comment line %d.
+int function%d(int a, char* b) {
+  /* block comment */
+  return a + strlen(b) * 42;  // trailing
+}
+''' % (i, i) for i in range(1000)
+            ])
+            secondsPerMegabyte = []
+            for megabytes in (1, 10, 50):
+                data = sample * (megabytes * 1000000 // len(sample) + 1)
+                rowCount = data.count(u'\n') + 1
+                parser = app.parser.Parser()
+                start = time.time()
+                while parser.fullyParsedToLine < rowCount:
+                    parser.parse(None, prefs, data, grammar,
+                                 parser.fullyParsedToLine, rowCount)
+                secondsPerMegabyte.append(
+                    (time.time() - start) / megabytes)
+            # The cost per megabyte is about the same at each size.
+            self.assertLess(secondsPerMegabyte[1], secondsPerMegabyte[0] * 1.5)
+            self.assertLess(secondsPerMegabyte[2], secondsPerMegabyte[0] * 1.5)
+
+    def test_find_prior_long_line(self):
+        # Finding the prior match on a long (e.g. minified) line is expected to
+        # grow linearly with the length of the line, as finding the next match
+        # does. (A negative lookahead for later matches grows with the square
+        # of the length.)
+        prg = app.ci_program.CiProgram()
+        tb = app.text_buffer.TextBuffer(prg)
+        line = u'var a=1;function f(b){return b+1};'
+
+        def findPriorSeconds(repeat):
+            tb.lines = [line * repeat]
+            tb.findRe = None
+            tb.find(u'return')
+            seconds = []
+            for _ in range(5):
+                tb.penRow = 0
+                tb.penCol = len(tb.lines[0])
+                start = time.time()
+                tb.findCurrentPattern(-1)
+                seconds.append(time.time() - start)
+            self.assertEqual(tb.penCol, len(line) * (repeat - 1) + 22)
+            return min(seconds)
+
+        # Check that the right match is found, without timing it.
+        findPriorSeconds(10)
+        # Disabled due to running time (and it's timing based).
+        if 0:
+            shortSeconds = findPriorSeconds(5000)
+            longSeconds = findPriorSeconds(40000)
+            self.assertLess(longSeconds, 1.0)
+            self.assertLess(longSeconds, shortSeconds * 16)
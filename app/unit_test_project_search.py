@@ -0,0 +1,173 @@
+# Copyright 2018 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import io
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+
+import app.ci_program
+import app.log
+import app.project_search
+import app.text_buffer
+
+
+def failingSearchFiles(args):
+    raise ValueError(u'failed')
+
+
+class ProjectSearchTestCases(unittest.TestCase):
+
+    def setUp(self):
+        app.log.shouldWritePrintLog = False
+        self.root = tempfile.mkdtemp()
+        self.writeFile(u'.gitignore', u'*.log\nbuild/\n/top.txt\n!keep.log\n')
+        self.writeFile(u'a.txt', u'one\ntwo needle\r\nthree needle\n')
+        self.writeFile(u'top.txt', u'needle\n')
+        self.writeFile(u'keep.log', u'needle\n')
+        self.writeFile(u'skip.log', u'needle\n')
+        self.writeFile(u'build/out.txt', u'needle\n')
+        self.writeFile(u'src/b.py', u'# needle\n')
+        self.writeFile(u'src/top.txt', u'needle\n')
+        self.writeFile(u'src/.gitignore', u'gen/\n')
+        self.writeFile(u'src/gen/c.py', u'needle\n')
+        self.writeFile(u'src/binary.dat', u'needle\0\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def writeFile(self, relPath, data):
+        path = os.path.join(self.root, relPath)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with io.open(path, 'w', encoding=u'utf-8', newline=u'') as f:
+            f.write(data)
+
+    def test_ignore_rules(self):
+        rules = app.project_search.IgnoreRules([
+            (re.compile(app.project_search._globToRegex(glob)), isNegated,
+             isDirOnly, isAnchored, basePath)
+            for glob, isNegated, isDirOnly, isAnchored, basePath in (
+                (u'*.o', False, False, False, u''),
+                (u'lib/**/*.a', False, False, True, u''),
+                (u'tmp', False, True, False, u'src'),
+                (u'x[0-9].o', True, False, False, u''),
+            )
+        ])
+        self.assertTrue(rules.isIgnored(u'a/b.o', False))
+        self.assertFalse(rules.isIgnored(u'a/x1.o', False))
+        self.assertTrue(rules.isIgnored(u'lib/z.a', False))
+        self.assertTrue(rules.isIgnored(u'lib/y/z.a', False))
+        self.assertFalse(rules.isIgnored(u'src/lib/z.a', False))
+        self.assertTrue(rules.isIgnored(u'src/tmp', True))
+        self.assertFalse(rules.isIgnored(u'src/tmp', False))
+
+    def test_walk_files(self):
+        self.assertEqual(
+            sorted(app.project_search.walkFiles(self.root)), [
+                u'.gitignore', u'a.txt', u'keep.log', u'src/.gitignore',
+                u'src/b.py', u'src/binary.dat', u'src/top.txt'
+            ])
+
+    def test_search(self):
+        search = app.project_search.ProjectSearch(
+            self.root, u'needle', 0, processCount=2)
+        results = []
+        deadline = time.time() + 30
+        while not search.isDone() and time.time() < deadline:
+            results += search.takeResults(0.1)
+        self.assertTrue(search.isDone())
+        self.assertEqual(
+            sorted(results), [
+                (u'a.txt', 1, 4, u'two needle'),
+                (u'a.txt', 2, 6, u'three needle'),
+                (u'keep.log', 0, 0, u'needle'),
+                (u'src/b.py', 0, 2, u'# needle'),
+                (u'src/top.txt', 0, 0, u'needle'),
+            ])
+        # The workers are stopped once the search is done.
+        self.assertRaises(ValueError, search.pool.apply_async, len, ([],))
+        search.cancel()
+
+    @unittest.skipIf(sys.version_info[0] < 3, u'needs error_callback')
+    def test_search_failed_batch(self):
+        searchFiles = app.project_search.searchFiles
+        app.project_search.searchFiles = failingSearchFiles
+        try:
+            search = app.project_search.ProjectSearch(
+                self.root, u'needle', 0, processCount=2)
+            results = []
+            deadline = time.time() + 30
+            while not search.isDone() and time.time() < deadline:
+                results += search.takeResults(0.1)
+        finally:
+            app.project_search.searchFiles = searchFiles
+        self.assertTrue(search.isDone())
+        self.assertEqual(results, [])
+
+    def test_search_files_line_endings(self):
+        self.writeFile(u'crlf.txt', u'foo\r\nabc\r\nx abc\rfoo')
+
+        def search(pattern, flags=0):
+            return app.project_search.searchFiles(
+                (self.root, [u'crlf.txt'], pattern, flags))
+
+        self.assertEqual(
+            search(u'foo$'), [(u'crlf.txt', 0, 0, u'foo'),
+                              (u'crlf.txt', 3, 0, u'foo')])
+        # Anchors apply to each line, as they do in the editor.
+        self.assertEqual(search(u'\\Aabc'), [(u'crlf.txt', 1, 0, u'abc')])
+        self.assertEqual(
+            search(u'abc\\Z'), [(u'crlf.txt', 1, 0, u'abc'),
+                                 (u'crlf.txt', 2, 2, u'x abc')])
+        self.assertEqual(search(u'(?<!\\s)abc'), [(u'crlf.txt', 1, 0, u'abc')])
+
+    def test_find_in_files(self):
+        prg = app.ci_program.CiProgram()
+        tb = prg.bufferManager.newTextBuffer()
+        tb.findInFiles(u'three', self.root)
+        first = tb.projectSearch
+        tb.findInFiles(u'needle', self.root)
+        # The first search was cancelled.
+        self.assertTrue(first.isDone())
+        deadline = time.time() + 30
+        while not tb.projectSearchMaybe() and time.time() < deadline:
+            pass
+        self.assertEqual(tb.lines[0], u'find in files: needle')
+        self.assertEqual(
+            sorted(tb.lines[1:-1]), [
+                u'a.txt:2:5: two needle', u'a.txt:3:7: three needle',
+                u'keep.log:1:1: needle', u'src/b.py:1:3: # needle',
+                u'src/top.txt:1:1: needle'
+            ])
+        self.assertEqual(tb.lines[-1], u'')
+        # The results aren't changes to undo (or save).
+        self.assertFalse(tb.isDirty())
+        redoChain = list(tb.redoChain)
+        tb.editUndo()
+        self.assertEqual(tb.redoChain, redoChain)
+        self.assertEqual(len(tb.lines), 7)
+        tb.findInFiles(u'needle', self.root)
+        search = tb.projectSearch
+        prg.bufferManager.closeTextBuffer(tb)
+        self.assertTrue(search.isDone())
+        self.assertEqual(tb.projectSearch, None)
@@ -0,0 +1,87 @@
+# Copyright 2018 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+import unittest
+
+import app.redo_chain
+
+
+def makeRedoChain(count):
+    redoChain = []
+    for i in range(count):
+        line = u'    value = compute(%d, "text")  # été' % (i,)
+        redoChain.append(((u'i', u'abc'),))
+        redoChain.append(((u'm', (0, 1, -i, -1, 0)),))
+        redoChain.append(((u'ld', (i, u'- ' + line, u'+ ' + line + u' x',
+                                   300)),))
+        redoChain.append(((u'n', 1, (u'm', (1, 0, 0, 0, 0))), (u'f',)))
+        redoChain.append(((u'v', [u'one', u'', u'two']),
+                          (u'vi', (u'x', 2, True, None, 1.5))))
+    return redoChain
+
+
+class RedoChainTestCases(unittest.TestCase):
+
+    def test_varint(self):
+        for value in (0, 1, 127, 128, 300, 2**35 + 7):
+            out = bytearray()
+            app.redo_chain.writeVarint(out, value)
+            self.assertEqual(
+                app.redo_chain.readVarint(out, 0), (value, len(out)))
+
+    def test_round_trip(self):
+        redoChain = makeRedoChain(100)
+        encoder = app.redo_chain.RedoChainEncoder()
+        chunks, dropped = encoder.encode(redoChain, len(redoChain))
+        self.assertEqual(dropped, 0)
+        self.assertEqual(
+            len(chunks),
+            (len(redoChain) + app.redo_chain.kChunkChanges - 1) //
+            app.redo_chain.kChunkChanges)
+        self.assertEqual(app.redo_chain.decodeRedoChain(chunks), redoChain)
+        # Much smaller than pickling.
+        self.assertLess(
+            sum(len(i) for i in chunks) * 3,
+            len(pickle.dumps(redoChain, protocol=2)))
+        # Unchanged chunks are reused.
+        redoChain.append(((u'i', u'z'),))
+        chunks2, dropped = encoder.encode(redoChain, len(redoChain))
+        self.assertTrue(all(a is b for a, b in zip(chunks[:-1], chunks2)))
+        self.assertEqual(app.redo_chain.decodeRedoChain(chunks2), redoChain)
+
+    def test_limit(self):
+        redoChain = makeRedoChain(100)
+        chunkChanges = app.redo_chain.kChunkChanges
+        encoder = app.redo_chain.RedoChainEncoder()
+        chunks, _ = encoder.encode(redoChain, len(redoChain))
+        limit = len(chunks[-1]) + len(chunks[-2])
+        chunks, dropped = encoder.encode(redoChain, len(redoChain), limit)
+        self.assertEqual(len(chunks), 2)
+        self.assertEqual(dropped, chunkChanges * 6)
+        self.assertEqual(
+            app.redo_chain.decodeRedoChain(chunks), redoChain[dropped:])
+        # Changes after the save point are kept.
+        savedAt = chunkChanges * 2 + 3
+        chunks, dropped = encoder.encode(redoChain, savedAt, limit)
+        self.assertEqual(dropped, chunkChanges * 2)
+        self.assertEqual(
+            app.redo_chain.decodeRedoChain(chunks), redoChain[dropped:])
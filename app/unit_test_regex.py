@@ -16,7 +16,7 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
-#import re
+import re
 import unittest
 
 import app.regex
@@ -24,6 +24,34 @@ import app.regex
 
 class RegexTestCases(unittest.TestCase):
 
+    def test_cached_compile(self):
+        hits, misses, _ = app.regex.cacheStats()
+        regex = app.regex.cachedCompile(u'cached[0-9]+', re.IGNORECASE)
+        self.assertIs(
+            app.regex.cachedCompile(u'cached[0-9]+', re.IGNORECASE), regex)
+        self.assertIsNot(app.regex.cachedCompile(u'cached[0-9]+'), regex)
+        self.assertEqual(app.regex.cacheStats()[:2], (hits + 1, misses + 2))
+        # The least recently used patterns are dropped.
+        for i in range(app.regex.kCacheSize):
+            app.regex.cachedCompile(u'cached%d' % (i,))
+        self.assertEqual(app.regex.cacheStats()[2], app.regex.kCacheSize)
+        misses = app.regex.cacheStats()[1]
+        app.regex.cachedCompile(u'cached[0-9]+', re.IGNORECASE)
+        self.assertEqual(app.regex.cacheStats()[1], misses + 1)
+        with self.assertRaises(re.error):
+            app.regex.cachedCompile(u'cached[')
+
+    def test_search_backward(self):
+        regex = re.compile(u'ab+')
+        text = u'ab abb xab ab'
+        self.assertEqual(app.regex.searchBackward(regex, text).span(), (11, 13))
+        self.assertEqual(
+            app.regex.searchBackward(regex, text, 11).span(), (8, 10))
+        self.assertEqual(
+            app.regex.searchBackward(regex, text, 4).span(), (3, 6))
+        self.assertIsNone(app.regex.searchBackward(regex, text, 0))
+        self.assertIsNone(app.regex.searchBackward(regex, u'xyz'))
+
     def test_common_numbers(self):
 
         def testNumber(strInput, reg):
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2018 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import unittest
+
+import app.log
+import app.render
+
+
+def encoded(*entries):
+    return [(row, col, text.encode('utf-8'), style)
+            for row, col, text, style in entries]
+
+
+class RenderTestCases(unittest.TestCase):
+
+    def setUp(self):
+        app.log.shouldWritePrintLog = False
+
+    def test_composite(self):
+        frame = app.render.Frame()
+        frame.addStr(0, 0, u'one two three', 1)
+        frame.addStr(0, 4, u'two', 2)
+        frame.addStr(0, 4, u'tw', 3)
+        frame.addStr(0, 8, u'three', 1)
+        frame.addStr(2, 3, u'x', 1)
+        frame.addStr(2, 0, u'ab', 1)
+        frame.setCursor((2, 1))
+        self.assertEqual(
+            frame.grabFrame(),
+            ([(0, 0, u'one ', 1), (0, 4, u'tw', 3), (0, 6, u'o', 2),
+              (0, 7, u' three', 1), (2, 0, u'ab', 1), (2, 3, u'x', 1)], (2,
+                                                                         1)))
+        self.assertEqual(frame.grabFrame(), ([], None))
+        # Painting over half of a double-wide character drops the other half.
+        frame.addStr(0, 0, u'aさb', 1)
+        frame.addStr(0, 1, u'c', 1)
+        frame.addStr(1, 0, u'さ', 1)
+        self.assertEqual(
+            frame.grabFrame()[0], [(0, 0, u'ac', 1), (0, 3, u'b', 1),
+                                   (1, 0, u'さ', 1)])
+
+    def test_changed_runs(self):
+        screen = app.render.Screen()
+        frame = [(0, 0, u'hello world', 1), (1, 0, u'second', 2)]
+        self.assertEqual(screen.changes(frame, 3, 20), encoded(*frame))
+        self.assertEqual(screen.cellsWritten, 17)
+        # The same frame again writes nothing.
+        self.assertEqual(screen.changes(frame, 3, 20), [])
+        self.assertEqual(screen.cellsDrawn, 17)
+        self.assertEqual(screen.cellsWritten, 0)
+        # One character and one style change.
+        frame = [(0, 0, u'hello wOrld', 1), (1, 0, u'sec', 2),
+                 (1, 3, u'ond', 3)]
+        self.assertEqual(
+            screen.changes(frame, 3, 20),
+            encoded((0, 7, u'O', 1), (1, 3, u'ond', 3)))
+        # Text past the edge of the screen is clipped.
+        self.assertEqual(
+            screen.changes([(2, 17, u'abcdef', 1), (5, 0, u'x', 1)], 3, 20),
+            encoded((2, 17, u'abc', 1)))
+        # A resize starts over.
+        self.assertEqual(screen.changes(frame, 3, 30), encoded(*frame))
+
+    def test_double_wide(self):
+        screen = app.render.Screen()
+        self.assertEqual(
+            screen.changes([(0, 0, u'aさb', 1)], 1, 10),
+            encoded((0, 0, u'aさb', 1)))
+        self.assertEqual(screen.cellsWritten, 4)
+        # A change to either half of the character writes all of it.
+        self.assertEqual(
+            screen.changes([(0, 0, u'aさb', 2)], 1, 10),
+            encoded((0, 0, u'aさb', 2)))
+        # Painting over half of it leaves the other half unknown.
+        self.assertEqual(
+            screen.changes([(0, 2, u'x', 2)], 1, 10), encoded((0, 2, u'x', 2)))
+        self.assertEqual(screen.chars[0][:3], [u'a', None, u'x'])
+        self.assertEqual(
+            screen.changes([(0, 1, u'さ', 2)], 1, 10),
+            encoded((0, 1, u'さ', 2)))
+        # A character cut by the edge of the screen is padded.
+        self.assertEqual(
+            screen.changes([(0, 7, u'abさ', 2)], 1, 10),
+            encoded((0, 7, u'ab ', 2)))
+
+    def test_render_scheduler(self):
+
+        class FakeWindow:
+
+            def __init__(self):
+                self.renderCount = 0
+
+            def render(self):
+                self.renderCount += 1
+
+        window = FakeWindow()
+        scheduler = app.render.RenderScheduler()
+        # After a pause, a frame is due right away.
+        self.assertLessEqual(scheduler.timeUntilFrame(), 0)
+        scheduler.render(window, 3)
+        self.assertEqual(window.renderCount, 1)
+        self.assertEqual((scheduler.frameCount, scheduler.frameCommands), (1,
+                                                                          3))
+        self.assertGreater(scheduler.timeUntilFrame(), 0)
+        self.assertLessEqual(scheduler.timeUntilFrame(), app.render.kFrameTime)
+        self.assertGreaterEqual(scheduler.renderTimePeak, scheduler.renderTime)
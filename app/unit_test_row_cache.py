@@ -0,0 +1,95 @@
+# Copyright 2018 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import app.fake_curses_testing
+import app.log
+import app.row_cache
+import app.text_buffer
+
+
+class FakeView:
+
+    def __init__(self, program):
+        self.program = program
+        self.scrollRow = 0
+        self.scrollCol = 0
+
+
+class FakeWindow:
+
+    def __init__(self):
+        self.drawList = []
+
+    def addStr(self, row, col, text, color):
+        self.drawList.append((row, col, text, color))
+
+
+class RowCacheTestCases(app.fake_curses_testing.FakeCursesTestCase):
+
+    def setUp(self):
+        app.fake_curses_testing.FakeCursesTestCase.setUp(self)
+        app.log.shouldWritePrintLog = False
+
+    def test_least_recently_used(self):
+        cache = app.row_cache.RowCache(3)
+        for i in range(3):
+            cache.put(i, [i])
+        self.assertEqual(cache.get(0), [0])
+        cache.put(3, [3])
+        self.assertEqual(len(cache), 3)
+        self.assertIsNone(cache.get(1))
+        self.assertEqual(cache.get(0), [0])
+        self.assertEqual(cache.get(3), [3])
+        self.assertEqual((cache.hits, cache.misses), (3, 1))
+
+    def test_draw_text_area(self):
+        prg = self.prg
+        tb = app.text_buffer.TextBuffer(prg)
+        view = FakeView(prg)
+        tb.setView(view)
+        tb.rootGrammar = prg.prefs.grammars[u'cpp']
+        tb.lines = [u'int a = 1;  // note %d' % (i,) for i in range(30)]
+        tb.lines[3] = u'/* a'
+        tb.lines[5] = u'*/'
+        tb.parseDocument()
+        self.assertEqual(tb.parser.rowState(0), tb.parser.rowState(1))
+        self.assertNotEqual(tb.parser.rowState(0), tb.parser.rowState(4))
+
+        def draw():
+            window = FakeWindow()
+            tb.drawTextArea(window, 0, 0, 10, 40, 0)
+            return window.drawList
+
+        first = draw()
+        self.assertEqual(tb.rowCache.misses, 10)
+        self.assertEqual(draw(), first)
+        self.assertEqual(tb.rowCache.hits, 10)
+        # Scrolling by a row highlights only the new row.
+        view.scrollRow = 1
+        scrolled = draw()
+        self.assertEqual(tb.rowCache.misses, 11)
+        tb.rowCache.clear()
+        self.assertEqual(draw(), scrolled)
+        # An edit that changes the state of the rows below it.
+        view.scrollRow = 0
+        draw()
+        misses = tb.rowCache.misses
+        tb.lines[5] = u'still in the comment'
+        tb.parseDocument()
+        draw()
+        self.assertEqual(tb.rowCache.misses, misses + 5)
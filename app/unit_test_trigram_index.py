@@ -0,0 +1,131 @@
+# Copyright 2018 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import io
+import os
+import re
+import shutil
+import tempfile
+import time
+import unittest
+
+import app.log
+import app.project_search
+import app.trigram_index
+
+
+class TrigramIndexTestCases(unittest.TestCase):
+
+    def setUp(self):
+        app.log.shouldWritePrintLog = False
+        self.tempDir = tempfile.mkdtemp()
+        self.root = os.path.join(self.tempDir, u'root')
+        self.writeFile(u'a.txt', u'one Needle\n')
+        self.writeFile(u'b.txt', u'two haystack\n')
+        self.writeFile(u'sub/c.txt', u'three needles\n')
+        self.index = app.trigram_index.TrigramIndex(
+            os.path.join(self.tempDir, u'index', u'root.db'), self.root)
+
+    def tearDown(self):
+        # Waits for an update on a background thread to finish.
+        self.index.update()
+        shutil.rmtree(self.tempDir)
+
+    def writeFile(self, relPath, data):
+        path = os.path.join(self.root, relPath)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with io.open(path, 'w', encoding=u'utf-8') as f:
+            f.write(data)
+
+    def filterFiles(self, pattern, flags=0):
+        return sorted(
+            self.index.filterFiles(
+                app.project_search.walkFiles(self.root), pattern, flags))
+
+    def test_required_literals(self):
+        requiredLiterals = app.trigram_index.requiredLiterals
+        self.assertEqual(requiredLiterals(re.escape(u'a.b c'), 0), [u'a.b c'])
+        self.assertEqual(
+            requiredLiterals(u'abc\\w+def[xy]ghi', 0), [u'abc', u'def', u'ghi'])
+        self.assertEqual(requiredLiterals(u'abcd?e*f', 0), [u'abc', u'f'])
+        self.assertEqual(requiredLiterals(u'ab(cd|ef)+gh{2}', 0), [u'ab', u'g'])
+        self.assertEqual(requiredLiterals(u'abc|def', 0), [])
+        self.assertEqual(requiredLiterals(u'abc', re.VERBOSE), [])
+        # Escapes that take an argument end a literal, argument and all.
+        self.assertEqual(requiredLiterals(u'\\x41BCD', 0), [u'BCD'])
+        self.assertEqual(requiredLiterals(u'ab\\u00e9cde', 0), [u'ab', u'cde'])
+        self.assertEqual(
+            requiredLiterals(u'ab\\U0001f600cde', 0), [u'ab', u'cde'])
+        self.assertEqual(
+            requiredLiterals(u'ab\\N{LATIN SMALL LETTER E}cde', 0),
+            [u'ab', u'cde'])
+        self.assertEqual(requiredLiterals(u'\\101BCD', 0), [u'BCD'])
+        self.assertEqual(requiredLiterals(u'(ab)\\1cde', 0), [u'cde'])
+        self.assertEqual(requiredLiterals(u'ab\\N', 0), [])
+        # A ] within a set doesn't end it.
+        self.assertEqual(requiredLiterals(u'[a\\]bcd]xyz', 0), [u'xyz'])
+        self.assertEqual(requiredLiterals(u'[^]bcd]xyz', 0), [u'xyz'])
+        self.assertEqual(requiredLiterals(u'[]bcd]xyz', 0), [u'xyz'])
+        self.assertEqual(requiredLiterals(u'ab[cd', 0), [])
+        # Verbose may be set inline.
+        self.assertEqual(requiredLiterals(u'(?x)ax yz', 0), [])
+        self.assertEqual(requiredLiterals(u'(?ix:ax yz)', 0), [])
+        self.assertEqual(requiredLiterals(u'(?i)abc', 0), [u'abc'])
+
+    def test_filter_files(self):
+        self.assertEqual(
+            self.filterFiles(u'needle'), [u'a.txt', u'b.txt', u'sub/c.txt'])
+        self.index.update()
+        self.assertEqual(self.filterFiles(u'needle'), [u'a.txt', u'sub/c.txt'])
+        self.assertEqual(self.filterFiles(u'needles'), [u'sub/c.txt'])
+        self.assertEqual(self.filterFiles(u'hay.*k'), [u'b.txt'])
+        self.assertEqual(
+            self.filterFiles(u'\\x6eeedle'), [u'a.txt', u'sub/c.txt'])
+        self.assertEqual(
+            self.filterFiles(u'NEEDLE', re.IGNORECASE),
+            [u'a.txt', u'sub/c.txt'])
+        # Patterns without a literal can't be narrowed.
+        self.assertEqual(len(self.filterFiles(u'\\w+')), 3)
+        # Changed files are always included, until indexed again.
+        time.sleep(0.01)
+        self.writeFile(u'b.txt', u'haystack and needle\n' * 2)
+        self.writeFile(u'd.txt', u'new\n')
+        os.remove(os.path.join(self.root, u'sub/c.txt'))
+        self.assertEqual(self.filterFiles(u'needles'), [u'b.txt', u'd.txt'])
+        self.index.update()
+        self.assertEqual(self.filterFiles(u'needles'), [])
+        self.assertEqual(self.filterFiles(u'needle'), [u'a.txt', u'b.txt'])
+
+    def test_project_search(self):
+        self.index.update()
+        search = app.project_search.ProjectSearch(
+            self.root, u'needle', re.IGNORECASE, processCount=1,
+            index=self.index)
+        results = []
+        deadline = time.time() + 30
+        while not search.isDone() and time.time() < deadline:
+            results += search.takeResults(0.1)
+        self.assertEqual(
+            sorted(results), [
+                (u'a.txt', 0, 4, u'one Needle'),
+                (u'sub/c.txt', 0, 6, u'three needles'),
+            ])
+        # Only the candidate files were read.
+        self.assertEqual(search.fileCount, 2)
+        search.cancel()
@@ -78,8 +78,8 @@ class ViewWindow:
         if app.config.strict_debug:
             app.log.check_le(row, self.rows)
             app.log.check_le(col, self.cols)
-        self.program.frame.addStr(self.top + row, self.left + col,
-                                  text.encode('utf-8'), colorPair)
+        self.program.frame.addStr(self.top + row, self.left + col, text,
+                                  colorPair)
 
     def reattach(self):
         self.setParent(self.parent)
@@ -328,7 +328,7 @@ class ViewWindow:
         text = text[:self.cols]
         text = text + u' ' * max(0, self.cols - len(text))
         self.program.frame.addStr(self.top + self.writeLineRow, self.left,
-                                  text.encode(u'utf-8'), color)
+                                  text, color)
         self.writeLineRow += 1
 
 
@@ -436,6 +436,11 @@ class Window(ActiveWindow):
             # If a user event came in while parsing, the parsing will be paused
             # (to be resumed after handling the event).
             finished = tb.parser.fullyParsedToLine >= len(tb.lines)
+        if tb is not None and tb.projectSearch is not None:
+            finished = tb.projectSearchMaybe() and finished
+        if tb is not None:
+            finished = tb.bracketIndexMaybe() and finished
+            finished = tb.findMatchesMaybe() and finished
         for child in self.zOrder:
             finished = finished and child.longTimeSlice()
         return finished
@@ -931,6 +936,13 @@ class StatusLine(ViewWindow):
         if self.program.prefs.startup.get('showLogWindow'):
             rightSide += u' %s | %s |' % (tb.cursorGrammarName(),
                                           tb.selectionModeName())
+        matchNumber = tb.findMatchNumber()
+        if matchNumber is not None:
+            number, count = matchNumber
+            if number is None:
+                rightSide += u' %d matches |' % (count,)
+            else:
+                rightSide += u' match %d of %d |' % (number, count)
         rightSide += u' %4d,%2d | %3d%%,%3d%%' % (
             self.host.textBuffer.penRow + 1, self.host.textBuffer.penCol + 1,
             rowPercentage, colPercentage)
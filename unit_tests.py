@@ -40,27 +40,41 @@ app.config.strict_debug = True
 import app.unit_test_actions
 import app.unit_test_application
 import app.unit_test_automatic_column_adjustment
+import app.unit_test_background
 import app.unit_test_bookmarks
 import app.unit_test_brace_matching
+import app.unit_test_bracket_index
 import app.unit_test_curses_util
+import app.unit_test_document_search
 import app.unit_test_file_manager
 import app.unit_test_find_window
+import app.unit_test_history
 import app.unit_test_execute_prompt
 import app.unit_test_intention
+import app.unit_test_line_store
+import app.unit_test_mapped_file
+import app.unit_test_match_index
 import app.unit_test_parser
 import app.unit_test_performance
 import app.unit_test_prediction_window
 import app.unit_test_prefs
+import app.unit_test_project_search
+import app.unit_test_redo_chain
 import app.unit_test_regex
+import app.unit_test_render
+import app.unit_test_row_cache
 import app.unit_test_selectable
 import app.unit_test_string
 import app.unit_test_text_buffer
+import app.unit_test_trigram_index
 import app.unit_test_ui
 import app.unit_test_undo_redo
 import unittest
 
 # Add new test cases here.
 TESTS = {
+    'actions_find_replace':
+    app.unit_test_actions.FindReplaceTestCases,
     'actions_grammar':
     app.unit_test_actions.GrammarDeterminationTestCases,
     'actions_mouse':
@@ -75,20 +89,34 @@ TESTS = {
     app.unit_test_application.ApplicationTestCases,
     'automatic_column_adjustment':
     app.unit_test_automatic_column_adjustment.AutomaticColumnAdjustmentCases,
+    'background':
+    app.unit_test_background.BackgroundTestCases,
     'bookmarks':
     app.unit_test_bookmarks.BookmarkTestCases,
     'brace_matching':
     app.unit_test_brace_matching.BraceMatchingTestCases,
+    'bracket_index':
+    app.unit_test_bracket_index.BracketIndexTestCases,
     'curses_util':
     app.unit_test_curses_util.CursesUtilTestCases,
+    'document_search':
+    app.unit_test_document_search.DocumentSearchTestCases,
     'file_manager':
     app.unit_test_file_manager.FileManagerTestCases,
     'find':
     app.unit_test_find_window.FindWindowTestCases,
     'execute':
     app.unit_test_execute_prompt.ExecutePromptTestCases,
+    'history':
+    app.unit_test_history.HistoryTestCases,
     'intention':
     app.unit_test_intention.IntentionTestCases,
+    'line_store':
+    app.unit_test_line_store.LineStoreTestCases,
+    'mapped_file':
+    app.unit_test_mapped_file.MappedFileTestCases,
+    'match_index':
+    app.unit_test_match_index.MatchIndexTestCases,
     'parser':
     app.unit_test_parser.ParserTestCases,
     'performance':
@@ -97,14 +125,24 @@ TESTS = {
     app.unit_test_prediction_window.PredictionWindowTestCases,
     'prefs':
     app.unit_test_prefs.PrefsTestCases,
+    'project_search':
+    app.unit_test_project_search.ProjectSearchTestCases,
+    'redo_chain':
+    app.unit_test_redo_chain.RedoChainTestCases,
     'regex':
     app.unit_test_regex.RegexTestCases,
+    'render':
+    app.unit_test_render.RenderTestCases,
+    'row_cache':
+    app.unit_test_row_cache.RowCacheTestCases,
     'selectable':
     app.unit_test_selectable.SelectableTestCases,
     'string':
     app.unit_test_string.StringTestCases,
     'draw':
     app.unit_test_text_buffer.DrawTestCases,
+    'trigram_index':
+    app.unit_test_trigram_index.TrigramIndexTestCases,
     'ui':
     app.unit_test_ui.UiBasicsTestCases,
     'undo':